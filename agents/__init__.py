@@ -1,6 +1,6 @@
 # Sistema de Agentes Puro Omega
 
-from .rag_engine import RAGEngine, get_rag_engine
+from .rag_engine import RAGEngine, get_rag_engine, reload_rag_engine, get_reload_status
 from .base_agent import BaseAgent
 from .agent_productos import AgenteProductos
 from .agent_objeciones import AgenteObjeciones
@@ -10,6 +10,8 @@ from .orchestrator import Orchestrator, get_orchestrator
 __all__ = [
     "RAGEngine",
     "get_rag_engine",
+    "reload_rag_engine",
+    "get_reload_status",
     "BaseAgent",
     "AgenteProductos",
     "AgenteObjeciones",
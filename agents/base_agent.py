@@ -3,17 +3,24 @@ Clase base para todos los agentes
 """
 from typing import List, Tuple, Optional
 from abc import ABC, abstractmethod
-from .rag_engine import get_rag_engine
+from .rag_engine import QueryScores, RAGEngine, get_rag_engine
 
 
 class BaseAgent(ABC):
     """Clase base abstracta para agentes especializados"""
 
     def __init__(self):
-        self.rag = get_rag_engine()
         self.name = "BaseAgent"
         self.description = ""
         self.categories = []  # Categorías del RAG que este agente maneja
+        # Contadores de search_knowledge_with_fallback (tasa de fallback en /metrics)
+        self.searches = 0
+        self.fallbacks = 0
+
+    @property
+    def rag(self) -> RAGEngine:
+        """Motor RAG activo (al recargar la KB se sustituye por una instancia nueva)"""
+        return get_rag_engine()
 
     @property
     @abstractmethod
@@ -25,42 +32,33 @@ class BaseAgent(ABC):
         """Busca en la base de conocimiento filtrado por las categorías del agente"""
         return self.rag.search(query, top_k=top_k, categories=self.categories if self.categories else None)
 
+    def rank_knowledge(self, scores: QueryScores, top_k: int = 5) -> List[Tuple[dict, float]]:
+        """Como search_knowledge pero sobre una query ya puntuada en todo el corpus (sin volver a buscar)"""
+        return scores.top(top_k, categories=self.categories if self.categories else None)
+
     def search_knowledge_with_fallback(self, query: str, top_k: int = 5,
                                        score_threshold: float = 0.25) -> List[Tuple[dict, float]]:
         """Búsqueda dual: primero filtrada por categorías, si no hay buenos resultados busca sin filtro"""
 
-        # 1. Búsqueda filtrada por categorías del agente
-        filtered_results = self.rag.search(
+        # 1. Una sola pasada de scoring: top-k filtrado por categorías del agente y
+        #    top-k sin filtro ya fusionado (boost 1.1x a resultados de categorías nativas)
+        filtered_results, merged_results = self.rag.search_with_global(
             query, top_k=top_k,
             categories=self.categories if self.categories else None
         )
 
         # 2. Evaluar calidad
         best_score = max((score for _, score in filtered_results), default=0.0)
+        self.searches += 1
 
         if best_score >= score_threshold:
             return filtered_results  # Buenos resultados, usar filtrados
 
         # 3. Fallback activado — log para métricas
+        self.fallbacks += 1
         print(f"[FALLBACK] Query: '{query[:50]}' | Score: {best_score:.2f} | Agent: {self.name}")
 
-        # 4. Búsqueda SIN filtro de categorías
-        unfiltered_results = self.rag.search(query, top_k=top_k, categories=None)
-
-        # 5. Combinar: boost 1.1x a resultados de categorías nativas
-        combined = {}
-        for qa, score in unfiltered_results:
-            combined[qa['pregunta']] = (qa, score)
-
-        for qa, score in filtered_results:
-            key = qa['pregunta']
-            if key in combined:
-                combined[key] = (qa, max(score * 1.1, combined[key][1]))
-            else:
-                combined[key] = (qa, score)
-
-        results = sorted(combined.values(), key=lambda x: x[1], reverse=True)
-        return results[:top_k]
+        return merged_results
 
     def enrich_context(self, query: str, results: List[Tuple[dict, float]]) -> str:
         """Enriquece el contexto RAG con conocimiento estructurado del agente.
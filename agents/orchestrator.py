@@ -1,6 +1,7 @@
 """
 Orquestador - Detecta intención y delega al agente apropiado
 """
+import asyncio
 import os
 import re
 from typing import Optional, Tuple
@@ -10,11 +11,18 @@ from .agent_productos import AgenteProductos
 from .agent_objeciones import AgenteObjeciones
 from .agent_argumentos import AgenteArgumentos
 from .base_agent import BaseAgent
+from .rag_engine import get_rag_engine
 
 
 # Modelo LLM
 LLM_MODEL = "moonshotai/kimi-k2-instruct"
 
+# Endpoint OpenAI-compatible (Groq por defecto; configurable para benchmarks con servidor local)
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.groq.com/openai/v1")
+
+# Con clasificación por LLM, buscar en el RAG mientras el LLM clasifica (0 = una cosa tras otra)
+PARALLEL_CLASSIFICATION = os.getenv("PARALLEL_CLASSIFICATION", "1") == "1"
+
 # Cliente LLM lazy (se inicializa cuando se usa)
 _llm_client = None
 
@@ -24,7 +32,7 @@ def get_llm_client():
     if _llm_client is None:
         _llm_client = AsyncOpenAI(
             api_key=os.getenv("GROQ_API_KEY"),
-            base_url="https://api.groq.com/openai/v1"
+            base_url=LLM_BASE_URL
         )
     return _llm_client
 
@@ -82,6 +90,7 @@ Responde SOLO con una palabra: productos, objeciones o argumentos"""
             for name, agent_class in self.AGENT_MAP.items()
         }
         self.default_agent = "productos"
+        self.parallel_classification = PARALLEL_CLASSIFICATION
 
     async def classify_intent(self, message: str) -> str:
         """
@@ -145,6 +154,10 @@ Responde SOLO con una palabra: productos, objeciones o argumentos"""
         r'\bespecialista\b', r'\bespecialidad\b',
     ]
 
+    # Cada tabla compilada una sola vez en una alternancia: un solo escaneo por fase
+    OBJECTION_RE = re.compile('|'.join(f'(?:{p})' for p in OBJECTION_PATTERNS))
+    ARGUMENT_RE = re.compile('|'.join(f'(?:{p})' for p in ARGUMENT_PATTERNS))
+
     def classify_intent_rules(self, message: str) -> str:
         """
         Clasificación contextual en 2 fases.
@@ -156,14 +169,12 @@ Responde SOLO con una palabra: productos, objeciones o argumentos"""
         message_lower = message.lower()
 
         # Fase 1: ¿Hay rechazo/resistencia explícita?
-        for pattern in self.OBJECTION_PATTERNS:
-            if re.search(pattern, message_lower):
-                return "objeciones"
+        if self.OBJECTION_RE.search(message_lower):
+            return "objeciones"
 
         # Fase 2: ¿Hay contexto de venta/especialidad?
-        for pattern in self.ARGUMENT_PATTERNS:
-            if re.search(pattern, message_lower):
-                return "argumentos"
+        if self.ARGUMENT_RE.search(message_lower):
+            return "argumentos"
 
         # Default: productos (incluye temas médicos, dudas, info técnica)
         return "productos"
@@ -189,17 +200,30 @@ Responde SOLO con una palabra: productos, objeciones o argumentos"""
         Returns:
             Tuple[intent, agent, context]: Intención detectada, agente usado y contexto RAG
         """
-        # Clasificar intención
-        if use_llm_classification:
-            intent = await self.classify_intent(message)
+        if use_llm_classification and self.parallel_classification:
+            # La puntuación del corpus no depende del agente: se calcula (en un hilo) mientras
+            # el LLM clasifica y luego se filtra por las categorías del agente elegido
+            classification = asyncio.create_task(self.classify_intent(message))
+            try:
+                scores = await asyncio.to_thread(get_rag_engine().score_query, message)
+            except BaseException:
+                classification.cancel()
+                raise
+            intent = await classification
+            agent = self.get_agent(intent)
+            results = agent.rank_knowledge(scores, top_k=5)
         else:
-            intent = self.classify_intent_rules(message)
+            # Clasificar intención
+            if use_llm_classification:
+                intent = await self.classify_intent(message)
+            else:
+                intent = self.classify_intent_rules(message)
 
-        # Obtener agente
-        agent = self.get_agent(intent)
+            # Obtener agente
+            agent = self.get_agent(intent)
 
-        # Buscar contexto relevante
-        results = agent.search_knowledge(message, top_k=5)
+            # Buscar contexto relevante
+            results = agent.search_knowledge(message, top_k=5)
         context = agent.format_context(results, min_score=0.1)
 
         return intent, agent, context
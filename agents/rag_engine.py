@@ -2,13 +2,24 @@
 Motor RAG Mejorado - Base de conocimiento compartida por todos los agentes
 v2.0 - Con stemming español, sinónimos y búsqueda híbrida
 """
+import hashlib
 import json
 import numpy as np
 from collections import Counter
+from contextlib import contextmanager
 from typing import List, Tuple, Optional, Set, Dict
 import math
 import os
 import re
+import shutil
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos al construir el artefacto
+    fcntl = None
 
 
 # ============================================
@@ -100,6 +111,14 @@ SYNONYMS: Dict[str, List[str]] = {
     'rtg': ['triglicérido', 'reesterificado', 'biodisponible', 'natural'],
 }
 
+# Sinónimos usados por palabra y su peso relativo a los términos originales de la query
+# (el mismo peso en el canal TF-IDF y en el de keywords)
+MAX_SYNONYMS = 3
+SYNONYM_WEIGHT = 0.5
+
+# Boost de los resultados de las categorías del agente al fusionarlos con la búsqueda global
+NATIVE_CATEGORY_BOOST = 1.1
+
 # Keywords que indican intención específica
 INTENT_KEYWORDS: Dict[str, List[str]] = {
     'comparacion': ['comparar', 'diferencia', 'versus', 'mejor', 'cuál', 'cual', 'elegir', 'entre'],
@@ -118,31 +137,284 @@ QUERY_PATTERNS: Dict[str, List[str]] = {
 }
 
 
+# ============================================
+# MATRIZ DISPERSA (CSR) DOCUMENTO-TÉRMINO
+# ============================================
+class SparseMatrix:
+    """Matriz dispersa en formato CSR (data/indices/indptr) para los embeddings TF-IDF.
+
+    Cada fila es un documento y cada columna un término del vocabulario.
+    Solo se guardan los valores no nulos, así que la memoria crece con el número
+    de términos por documento y no con el tamaño del vocabulario.
+    """
+
+    def __init__(self, data: np.ndarray, indices: np.ndarray, indptr: np.ndarray, n_cols: int,
+                 row_ids: Optional[np.ndarray] = None):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = (len(indptr) - 1, n_cols)
+        # Fila de cada valor no nulo (para reducir el producto con bincount)
+        if row_ids is None:
+            row_ids = np.repeat(np.arange(self.shape[0], dtype=np.int32), np.diff(indptr))
+        self.row_ids = row_ids
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[int, float]], n_cols: int) -> 'SparseMatrix':
+        """Construye la matriz a partir de una lista de filas {columna: valor}"""
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indices = []
+        data = []
+        for i, row in enumerate(rows):
+            cols = sorted(row)
+            indices.extend(cols)
+            data.extend(row[c] for c in cols)
+            indptr[i + 1] = len(indices)
+        return cls(
+            np.asarray(data, dtype=np.float64),
+            np.asarray(indices, dtype=np.int32),
+            indptr,
+            n_cols,
+        )
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def dot(self, vec: np.ndarray) -> np.ndarray:
+        """Producto matriz-vector: un score por fila"""
+        return np.bincount(self.row_ids, weights=self.data * vec[self.indices], minlength=self.shape[0])
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Índices de los k mayores scores, en orden descendente.
+
+    Usa argpartition para no ordenar todo el corpus. Los empates se resuelven
+    por índice ascendente, igual que un sorted() estable.
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        kth = scores[np.argpartition(-scores, k - 1)[:k]].min()
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:k]
+
+
+# ============================================
+# REGISTRO PRECALCULADO POR DOCUMENTO
+# ============================================
+class DocumentRecord:
+    """Textos normalizados, tokens y frecuencias de un Q&A, calculados una sola vez al cargar.
+
+    Evita repetir normalización y tokenización del corpus estático en cada búsqueda.
+    """
+
+    __slots__ = (
+        'pregunta_norm', 'respuesta_norm', 'tokens', 'tokens_stemmed',
+        'term_counts', 'term_ids', 'term_freqs',
+    )
+
+    def __init__(self, pregunta_norm: str, respuesta_norm: str,
+                 tokens: List[str], tokens_stemmed: List[str]):
+        self.pregunta_norm = pregunta_norm
+        self.respuesta_norm = respuesta_norm
+        self.tokens: Set[str] = set(tokens)
+        self.tokens_stemmed: Set[str] = set(tokens_stemmed)
+        # Frecuencia de cada término stemmed (base del TF-IDF)
+        self.term_counts: Counter = Counter(tokens_stemmed)
+        # Mismas frecuencias como arrays alineados con el vocabulario (se rellenan en compute_embeddings)
+        self.term_ids = np.empty(0, dtype=np.int32)
+        self.term_freqs = np.empty(0, dtype=np.float64)
+
+
+# ============================================
+# BM25 SOBRE LISTAS DE POSTINGS
+# ============================================
+class BM25Index:
+    """Índice BM25 con postings por término (documentos + frecuencias) y longitudes de documento.
+
+    Los postings de todos los términos viven en arrays contiguos; `postings_ptr[t]`
+    marca dónde empiezan los del término t. Puntuar una query solo recorre los
+    postings de sus términos, así que el coste depende de la query y no del corpus.
+    """
+
+    def __init__(self, documents: List[DocumentRecord], n_terms: int, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(documents)
+        self.doc_len = np.array([doc.term_freqs.sum() for doc in documents], dtype=np.float64)
+        self.avgdl = float(self.doc_len.mean()) if self.n_docs else 0.0
+
+        term_ids = np.concatenate([doc.term_ids for doc in documents]) if documents else np.empty(0, dtype=np.int32)
+        freqs = np.concatenate([doc.term_freqs for doc in documents]) if documents else np.empty(0)
+        doc_ids = np.repeat(np.arange(self.n_docs, dtype=np.int32), [len(doc.term_ids) for doc in documents])
+
+        # Agrupar por término (orden estable: documentos ascendentes dentro de cada término)
+        order = np.argsort(term_ids, kind='stable')
+        self.postings_docs = doc_ids[order]
+        self.postings_tf = freqs[order]
+        doc_freq = np.bincount(term_ids, minlength=n_terms)
+        self.postings_ptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(doc_freq, out=self.postings_ptr[1:])
+
+        self.idf = np.log(1 + (self.n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        # Normalización por longitud precalculada por posting: k1 * (1 - b + b * dl / avgdl)
+        avgdl = self.avgdl or 1.0
+        self.postings_norm = k1 * (1 - b + b * self.doc_len[self.postings_docs] / avgdl)
+
+    # Arrays que definen el índice (los que se guardan en el artefacto precalculado)
+    ARRAYS = ('doc_len', 'postings_docs', 'postings_tf', 'postings_ptr', 'idf', 'postings_norm')
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], k1: float, b: float) -> 'BM25Index':
+        """Reconstruye el índice a partir de sus arrays ya calculados (sin recorrer documentos)"""
+        index = cls.__new__(cls)
+        index.k1 = k1
+        index.b = b
+        for name in cls.ARRAYS:
+            setattr(index, name, arrays[name])
+        index.n_docs = len(index.doc_len)
+        index.avgdl = float(index.doc_len.mean()) if index.n_docs else 0.0
+        return index
+
+    def score(self, query_weights: Dict[int, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Devuelve (ids de documento, scores) solo de los documentos que contienen algún término"""
+        docs_parts = []
+        score_parts = []
+        for term_id, weight in query_weights.items():
+            lo, hi = self.postings_ptr[term_id], self.postings_ptr[term_id + 1]
+            if lo == hi:
+                continue
+            tf = self.postings_tf[lo:hi]
+            docs_parts.append(self.postings_docs[lo:hi])
+            score_parts.append(weight * self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.postings_norm[lo:hi]))
+
+        if not docs_parts:
+            return np.empty(0, dtype=np.int32), np.empty(0)
+        docs, inverse = np.unique(np.concatenate(docs_parts), return_inverse=True)
+        return docs, np.bincount(inverse, weights=np.concatenate(score_parts))
+
+    def reference_score(self, query_weights: Dict[int, float]) -> float:
+        """Score de un documento de longitud media con cada término una vez (para normalizar a ~[0, 1])"""
+        return float(sum(weight * self.idf[term_id] for term_id, weight in query_weights.items()))
+
+
+class QueryTerms:
+    """Términos de una query tokenizada una sola vez: originales, stemmed y expansión por sinónimos"""
+
+    __slots__ = ('tokens', 'tokens_stemmed', 'all_tokens', 'synonyms')
+
+    def __init__(self, tokens: List[str], tokens_stemmed: List[str],
+                 synonyms: List[Tuple[str, int, float]]):
+        self.tokens = tokens
+        self.tokens_stemmed = tokens_stemmed
+        self.all_tokens: Set[str] = set(tokens) | set(tokens_stemmed)
+        # (término normalizado, id en vocabulario o -1, peso)
+        self.synonyms = synonyms
+
+
 class RAGEngine:
     """Motor de búsqueda RAG mejorado con stemming, sinónimos y búsqueda híbrida"""
 
-    def __init__(self, knowledge_base_path: str):
+    # Motores de scoring disponibles (RAG_SCORING)
+    SCORING_ENGINES = ('hybrid', 'bm25')
+
+    def __init__(self, knowledge_base_path: str, scoring: Optional[str] = None,
+                 index_dir: Optional[str] = None):
+        started = time.perf_counter()
+        self.knowledge_base_path = knowledge_base_path
+        # Directorio de artefactos precalculados ('' = construir siempre en memoria)
+        self.index_dir = RAG_INDEX_DIR if index_dir is None else index_dir
+        self.index_source = "built"
+        # 'hybrid' = TF-IDF 60% + keywords 40% (por defecto); 'bm25' = BM25 sobre postings
+        self.scoring = scoring or os.getenv("RAG_SCORING", "hybrid")
+        if self.scoring not in self.SCORING_ENGINES:
+            raise ValueError(f"RAG_SCORING desconocido: {self.scoring}")
         self.qa_pairs = []
-        self.embeddings = []
+        self.kb_version = ""  # Hash del contenido de knowledge_base.json
+        # Registros completos por documento: solo existen si el índice se construye aquí
+        self.documents: List[DocumentRecord] = []
+        # Pregunta normalizada de cada documento (boost de keywords en la pregunta)
+        self.pregunta_norm: List[str] = []
+        self.embeddings: Optional[SparseMatrix] = None
         self.vocab = []
         self.word_to_idx = {}
         self.idf = {}
         self.stemmer = SpanishStemmer()
 
-        # Índice invertido para búsqueda por keywords
-        self.keyword_index: Dict[str, Set[int]] = {}
+        # Categoría de cada documento codificada como entero (para máscaras vectorizadas)
+        self.category_codes = np.empty(0, dtype=np.int32)
+        self.category_to_code: Dict[str, int] = {}
+        self._category_masks: Dict[Tuple[str, ...], np.ndarray] = {}
+
+        # Nivel de coincidencia de concentración por documento (0 = ninguna, 3 = en la pregunta)
+        self.concentration_tier = np.empty(0, dtype=np.int8)
+
+        # Patrones de query normalizados una vez
+        self._query_patterns_norm = {
+            intent: [self._normalize(p) for p in patterns]
+            for intent, patterns in QUERY_PATTERNS.items()
+        }
+
+        # Índice invertido para búsqueda por keywords: término → ids de documento (ascendentes),
+        # vistas sobre los postings contiguos keyword_docs/keyword_ptr
+        self.keyword_index: Dict[str, np.ndarray] = {}
+        self.keyword_terms: List[str] = []
+        self.keyword_docs = np.empty(0, dtype=np.int32)
+        self.keyword_ptr = np.zeros(1, dtype=np.int64)
+
+        # Sinónimos compilados: token normalizado → [(término, id vocabulario, peso)]
+        self.synonym_map: Dict[str, List[Tuple[str, int, float]]] = {}
+        self.idf_array = np.empty(0)
+        self.bm25: Optional[BM25Index] = None
 
         self.load_knowledge_base(knowledge_base_path)
-        self.compute_embeddings()
-        self.build_keyword_index()
+        with self._artifact_lock():
+            if self.load_index_artifact():
+                self.index_source = "artifact"
+            else:
+                self.build_document_records()
+                self.compute_embeddings()
+                self.build_keyword_index()
+                self.bm25 = BM25Index(self.documents, len(self.vocab))
+                self.save_index_artifact()
+        self.build_synonym_index()
+
+        # Tiempo de construcción del índice y momento en que quedó listo
+        self.build_ms = (time.perf_counter() - started) * 1000
+        self.loaded_at = time.time()
 
     def load_knowledge_base(self, path: str):
         """Carga la base de conocimiento desde JSON"""
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        self.kb_version = kb_content_version(raw)
+        data = json.loads(raw.decode('utf-8'))
         self.qa_pairs = data['qa_pairs']
+
+        for qa in self.qa_pairs:
+            self.category_to_code.setdefault(qa['categoria'], len(self.category_to_code))
+        self.category_codes = np.array(
+            [self.category_to_code[qa['categoria']] for qa in self.qa_pairs], dtype=np.int32
+        )
+        self._category_masks = {}
         print(f"[RAG] Cargadas {len(self.qa_pairs)} preguntas")
 
+    def _category_mask(self, categories: Optional[List[str]]) -> Optional[np.ndarray]:
+        """Máscara booleana de documentos en las categorías dadas (None = sin filtro)"""
+        if not categories:
+            return None
+        key = tuple(categories)
+        mask = self._category_masks.get(key)
+        if mask is None:
+            codes = [self.category_to_code[c] for c in categories if c in self.category_to_code]
+            mask = np.isin(self.category_codes, codes)
+            self._category_masks[key] = mask
+        return mask
+
     # Nombres de producto con guion → forma canónica (sin guion)
     PRODUCT_ALIASES = {
         'omega-3': 'omega3',
@@ -150,150 +422,344 @@ class RAGEngine:
         'puro-omega': 'puro omega',
     }
 
+    # Quitar acentos para búsqueda
+    ACCENT_TABLE = str.maketrans({
+        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
+        'ü': 'u', 'ñ': 'n'
+    })
+
+    STOPWORDS = frozenset({
+        'el', 'la', 'los', 'las', 'de', 'del', 'en', 'un', 'una',
+        'y', 'a', 'que', 'es', 'por', 'para', 'con', 'se', 'su',
+        'al', 'lo', 'como', 'mas', 'pero', 'sus', 'le', 'ya', 'o',
+        'cual', 'cuales', 'donde', 'cuando', 'si',
+        'no', 'muy', 'sin', 'sobre', 'este', 'esta', 'esto', 'eso',
+        'mi', 'tu', 'me', 'te', 'nos', 'les', 'tiene', 'hay'
+    })
+
+    PUNCTUATION_RE = re.compile(r'[^\w\s]')
+
     def _normalize(self, text: str) -> str:
         """Normaliza texto: minúsculas, sin acentos, unifica nombres de producto"""
         text = text.lower()
         # Unificar nombres de producto con/sin guion ANTES de quitar acentos
         for alias, canonical in self.PRODUCT_ALIASES.items():
             text = text.replace(alias, canonical)
-        # Quitar acentos para búsqueda
-        replacements = {
-            'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u',
-            'ü': 'u', 'ñ': 'n'
-        }
-        for acc, plain in replacements.items():
-            text = text.replace(acc, plain)
-        return text
+        return text.translate(self.ACCENT_TABLE)
 
     def _tokenize(self, text: str, apply_stemming: bool = True) -> List[str]:
         """Tokeniza texto con normalización y stemming opcional"""
-        text = self._normalize(text)
-        text = re.sub(r'[^\w\s]', ' ', text)
-        words = text.split()
-
-        stopwords = {
-            'el', 'la', 'los', 'las', 'de', 'del', 'en', 'un', 'una',
-            'y', 'a', 'que', 'es', 'por', 'para', 'con', 'se', 'su',
-            'al', 'lo', 'como', 'mas', 'pero', 'sus', 'le', 'ya', 'o',
-            'que', 'como', 'cual', 'cuales', 'donde', 'cuando', 'si',
-            'no', 'muy', 'sin', 'sobre', 'este', 'esta', 'esto', 'eso',
-            'mi', 'tu', 'me', 'te', 'nos', 'les', 'tiene', 'hay'
-        }
-
-        tokens = [w for w in words if w not in stopwords and len(w) > 2]
-
+        tokens = self._tokenize_normalized(self._normalize(text))
         if apply_stemming:
             tokens = [self.stemmer.stem(w) for w in tokens]
-
         return tokens
 
-    def _expand_query(self, query: str) -> str:
-        """Expande la query con sinónimos"""
-        words = self._tokenize(query, apply_stemming=False)
-        expanded = list(words)
-
-        for word in words:
-            word_lower = word.lower()
-            if word_lower in SYNONYMS:
-                expanded.extend(SYNONYMS[word_lower][:3])  # Max 3 sinónimos por palabra
+    def _tokenize_normalized(self, text: str) -> List[str]:
+        """Tokeniza texto ya normalizado, sin stemming"""
+        words = self.PUNCTUATION_RE.sub(' ', text).split()
+        return [w for w in words if w not in self.STOPWORDS and len(w) > 2]
+
+    def _tokenize_both(self, text: str) -> Tuple[List[str], List[str]]:
+        """Tokeniza una sola vez y devuelve (tokens, tokens con stemming)"""
+        tokens = self._tokenize(text, apply_stemming=False)
+        return tokens, [self.stemmer.stem(w) for w in tokens]
+
+    def build_synonym_index(self):
+        """Compila SYNONYMS una vez: claves normalizadas y sinónimos (incluidos los
+        multi-palabra como 'omega 3') ya tokenizados y resueltos a ids de vocabulario"""
+        self.synonym_map = {}
+        for key, synonyms in SYNONYMS.items():
+            key_tokens = self._tokenize(key, apply_stemming=False)
+            if len(key_tokens) != 1:
+                continue  # la clave es stopword tras normalizar (p. ej. 'más')
+            key_norm = key_tokens[0]
+            if key_norm in self.synonym_map:
+                continue  # variantes con/sin acento ('cáncer'/'cancer'): gana la primera
+
+            entries = []
+            for synonym in synonyms[:MAX_SYNONYMS]:
+                for term in self._tokenize(synonym, apply_stemming=False):
+                    term_id = self.word_to_idx.get(self.stemmer.stem(term), -1)
+                    entries.append((term, term_id, SYNONYM_WEIGHT))
+            self.synonym_map[key_norm] = entries
+
+        print(f"[RAG] Sinónimos compilados: {len(self.synonym_map)} claves")
+
+    def _analyze_query(self, query: str) -> QueryTerms:
+        """Tokeniza la query una vez y la expande con el mapa de sinónimos"""
+        tokens, tokens_stemmed = self._tokenize_both(query)
+        synonyms = []
+        seen = set()
+        for token in tokens + tokens_stemmed:
+            if token in self.synonym_map and token not in seen:
+                seen.add(token)
+                synonyms.extend(self.synonym_map[token])
+        return QueryTerms(tokens, tokens_stemmed, synonyms)
+
+    def _query_vector(self, terms: QueryTerms) -> np.ndarray:
+        """Vector TF-IDF denso de la query expandida (originales peso 1, sinónimos SYNONYM_WEIGHT)"""
+        tf = np.zeros(len(self.vocab))
+        for word in terms.tokens_stemmed:
+            idx = self.word_to_idx.get(word)
+            if idx is not None:
+                tf[idx] += 1.0
+        for _, idx, weight in terms.synonyms:
+            if idx >= 0:
+                tf[idx] += weight
+        vec = tf * self.idf_array
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec = vec / norm
+        return vec
 
-        return ' '.join(expanded)
+    def build_document_records(self):
+        """Precalcula textos normalizados, tokens y frecuencias de cada Q&A"""
+        self.documents = []
+        self.pregunta_norm = []
+        tiers = []
+        for qa in self.qa_pairs:
+            tokens, tokens_stemmed = self._tokenize_both(qa['pregunta'] + ' ' + qa['respuesta'])
+            record = DocumentRecord(
+                self._normalize(qa['pregunta']),
+                self._normalize(qa['respuesta']),
+                tokens,
+                tokens_stemmed,
+            )
+            self.documents.append(record)
+            self.pregunta_norm.append(record.pregunta_norm)
+
+            if 'concentracion' in record.pregunta_norm:
+                tiers.append(3)
+            elif 'concentrado' in record.pregunta_norm or 'potente' in record.pregunta_norm:
+                tiers.append(2)
+            elif 'concentracion' in record.respuesta_norm or 'concentrado' in record.respuesta_norm:
+                tiers.append(1)
+            else:
+                tiers.append(0)
+        self.concentration_tier = np.array(tiers, dtype=np.int8)
 
     def build_keyword_index(self):
         """Construye índice invertido para búsqueda por keywords"""
-        for i, qa in enumerate(self.qa_pairs):
-            text = qa['pregunta'] + ' ' + qa['respuesta']
-            tokens = set(self._tokenize(text, apply_stemming=False))
-            tokens_stemmed = set(self._tokenize(text, apply_stemming=True))
-            all_tokens = tokens | tokens_stemmed
+        postings: Dict[str, List[int]] = {}
+        for i, doc in enumerate(self.documents):
+            all_tokens = doc.tokens | doc.tokens_stemmed
 
             for token in all_tokens:
-                if token not in self.keyword_index:
-                    self.keyword_index[token] = set()
-                self.keyword_index[token].add(i)
+                postings.setdefault(token, []).append(i)
+
+        self.keyword_terms = sorted(postings)
+        self.keyword_ptr = np.zeros(len(self.keyword_terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings[t]) for t in self.keyword_terms], out=self.keyword_ptr[1:])
+        self.keyword_docs = np.array(
+            [i for t in self.keyword_terms for i in postings[t]], dtype=np.int32
+        )
+        self._index_keyword_postings()
 
         print(f"[RAG] Índice de keywords: {len(self.keyword_index)} términos únicos")
 
+    def _index_keyword_postings(self):
+        """Diccionario término → vista de sus postings (no copia los ids de documento)"""
+        ptr = self.keyword_ptr.tolist()
+        self.keyword_index = {
+            term: self.keyword_docs[ptr[i]:ptr[i + 1]] for i, term in enumerate(self.keyword_terms)
+        }
+
     def compute_embeddings(self):
         """Calcula embeddings TF-IDF para todas las Q&A"""
-        documents = [qa['pregunta'] + ' ' + qa['respuesta'] for qa in self.qa_pairs]
-
         # Construir vocabulario con stemming
-        all_words = []
-        for doc in documents:
-            all_words.extend(self._tokenize(doc))
+        vocab = set()
+        for doc in self.documents:
+            vocab.update(doc.tokens_stemmed)
 
-        self.vocab = list(set(all_words))
+        self.vocab = list(vocab)
         self.word_to_idx = {word: idx for idx, word in enumerate(self.vocab)}
 
         # Calcular IDF
         doc_freq = Counter()
-        for doc in documents:
-            unique_words = set(self._tokenize(doc))
-            for word in unique_words:
-                doc_freq[word] += 1
+        for doc in self.documents:
+            doc_freq.update(doc.tokens_stemmed)
 
-        n_docs = len(documents)
+        n_docs = len(self.documents)
         self.idf = {word: math.log(n_docs / (freq + 1)) for word, freq in doc_freq.items()}
+        self.idf_array = np.array([self.idf[word] for word in self.vocab])
 
-        # Calcular embeddings
-        self.embeddings = []
-        for doc in documents:
-            vec = self._get_vector(doc)
-            self.embeddings.append(vec)
+        # Calcular embeddings como matriz dispersa documento-término
+        rows = []
+        for doc in self.documents:
+            doc.term_ids = np.array([self.word_to_idx[w] for w in doc.term_counts], dtype=np.int32)
+            doc.term_freqs = np.array(list(doc.term_counts.values()), dtype=np.float64)
+            rows.append(self._weights_from_counts(doc.term_counts))
+        self.embeddings = SparseMatrix.from_rows(rows, len(self.vocab))
 
         print(f"[RAG] Embeddings calculados: {len(self.vocab)} palabras en vocabulario")
 
-    def _get_vector(self, text: str) -> np.ndarray:
-        """Obtiene vector TF-IDF de un texto"""
-        words = self._tokenize(text)
-        tf = Counter(words)
-        vec = np.zeros(len(self.vocab))
+    # ---------- Artefacto precalculado ----------
+
+    def _artifact_path(self) -> Optional[str]:
+        if not self.index_dir:
+            return None
+        return os.path.join(self.index_dir, f"{self.kb_version}-v{INDEX_FORMAT_VERSION}")
+
+    @contextmanager
+    def _artifact_lock(self):
+        """Bloqueo entre procesos sobre el directorio de artefactos: si varios workers
+        arrancan (o recargan) a la vez, uno construye y escribe el índice y el resto lo carga"""
+        if not self.index_dir or fcntl is None:
+            yield
+            return
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            lock_file = open(os.path.join(self.index_dir, '.lock'), 'a')
+        except OSError:
+            yield  # directorio de solo lectura: cada proceso construye por su cuenta
+            return
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def load_index_artifact(self) -> bool:
+        """Carga vocabulario, IDF, matriz documento-término, postings y textos normalizados
+        del artefacto de esta versión de la KB. Los arrays se abren con mmap, así que varios
+        procesos comparten las mismas páginas. Devuelve False si no existe o no es válido."""
+        path = self._artifact_path()
+        if path is None or not os.path.isdir(path):
+            return False
+        try:
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['format'] != INDEX_FORMAT_VERSION or meta['kb_version'] != self.kb_version:
+                raise ValueError("artefacto de otra versión")
+            if len(meta['pregunta_norm']) != len(self.qa_pairs):
+                raise ValueError("número de documentos distinto")
+            arrays = {
+                name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                for name in ARTIFACT_ARRAYS
+            }
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[RAG] Artefacto de índice no válido en {path}, se reconstruye: {e}")
+            return False
+
+        self.vocab = meta['vocab']
+        self.word_to_idx = {word: idx for idx, word in enumerate(self.vocab)}
+        self.idf_array = arrays['idf']
+        self.idf = dict(zip(self.vocab, self.idf_array.tolist()))
+        self.embeddings = SparseMatrix(
+            arrays['embeddings_data'], arrays['embeddings_indices'], arrays['embeddings_indptr'],
+            len(self.vocab), row_ids=arrays['embeddings_row_ids'],
+        )
+        self.pregunta_norm = meta['pregunta_norm']
+        self.concentration_tier = arrays['concentration_tier']
+        self.keyword_terms = meta['keyword_terms']
+        self.keyword_docs = arrays['keyword_docs']
+        self.keyword_ptr = arrays['keyword_ptr']
+        self._index_keyword_postings()
+        self.bm25 = BM25Index.from_arrays(
+            {name: arrays['bm25_' + name] for name in BM25Index.ARRAYS}, meta['bm25_k1'], meta['bm25_b'],
+        )
+        print(f"[RAG] Índice cargado de {path}: {len(self.vocab)} palabras en vocabulario")
+        return True
+
+    def save_index_artifact(self):
+        """Escribe el índice recién construido como artefacto de esta versión de la KB.
+
+        Se escribe en un directorio temporal y se publica con un rename, así que otro
+        proceso nunca ve un artefacto a medias. Si no se puede escribir (disco de solo
+        lectura, otro proceso lo publicó antes) se sigue con el índice en memoria."""
+        path = self._artifact_path()
+        if path is None or os.path.isdir(path):
+            return
+        arrays = {
+            'idf': self.idf_array,
+            'embeddings_data': self.embeddings.data,
+            'embeddings_indices': self.embeddings.indices,
+            'embeddings_indptr': self.embeddings.indptr,
+            'embeddings_row_ids': self.embeddings.row_ids,
+            'concentration_tier': self.concentration_tier,
+            'keyword_docs': self.keyword_docs,
+            'keyword_ptr': self.keyword_ptr,
+        }
+        for name in BM25Index.ARRAYS:
+            arrays['bm25_' + name] = getattr(self.bm25, name)
+        meta = {
+            'format': INDEX_FORMAT_VERSION,
+            'kb_version': self.kb_version,
+            'vocab': self.vocab,
+            'keyword_terms': self.keyword_terms,
+            'pregunta_norm': self.pregunta_norm,
+            'bm25_k1': self.bm25.k1,
+            'bm25_b': self.bm25.b,
+        }
+
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(tmp_path)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, name + '.npy'), np.ascontiguousarray(array))
+            with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                print(f"[RAG] No se pudo guardar el artefacto de índice en {path}: {e}")
+            return
+        print(f"[RAG] Artefacto de índice guardado en {path}")
+        self._prune_artifacts(keep=os.path.basename(path))
+
+    def _prune_artifacts(self, keep: str):
+        """Borra los artefactos de versiones anteriores de la KB (los procesos que aún
+        los tengan mapeados conservan sus páginas hasta soltarlos)"""
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if name != keep and not name.endswith('.tmp') and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _weights_from_counts(self, tf: Counter) -> Dict[int, float]:
+        """Pesos TF-IDF normalizados a partir de frecuencias de términos stemmed"""
+        vec = {}
         for word, count in tf.items():
             if word in self.word_to_idx:
-                vec[self.word_to_idx[word]] = count * self.idf.get(word, 0)
-        norm = np.linalg.norm(vec)
+                weight = count * self.idf.get(word, 0)
+                if weight != 0:
+                    vec[self.word_to_idx[word]] = weight
+        norm = math.sqrt(sum(w * w for w in vec.values()))
         if norm > 0:
-            vec = vec / norm
+            vec = {idx: w / norm for idx, w in vec.items()}
         return vec
 
-    def _keyword_search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
-        """Búsqueda por keywords con boost por coincidencias múltiples"""
-        tokens = set(self._tokenize(query, apply_stemming=False))
-        tokens_stemmed = set(self._tokenize(query, apply_stemming=True))
-        all_tokens = tokens | tokens_stemmed
+    # Palabras clave de alta importancia (boost extra en keywords)
+    HIGH_VALUE_TERMS = frozenset({'concentrado', 'concentracion', 'potente', 'embarazo',
+                                  'cardiovascular', 'corazon', 'cerebro', 'precio'})
 
-        # Palabras clave de alta importancia (boost extra)
-        high_value_terms = {'concentrado', 'concentracion', 'potente', 'embarazo',
-                           'cardiovascular', 'corazon', 'cerebro', 'precio'}
+    def _keyword_search(self, terms: QueryTerms, top_k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Búsqueda por keywords con boost por coincidencias múltiples"""
+        all_tokens = terms.all_tokens
 
-        # Expandir con sinónimos
-        expanded_tokens = set(all_tokens)
-        for token in list(all_tokens):
-            if token in SYNONYMS:
-                expanded_tokens.update(SYNONYMS[token][:3])  # más sinónimos
+        # Peso por término: originales 1.0, sinónimos SYNONYM_WEIGHT (como en TF-IDF)
+        term_weights = {token: 1.0 for token in all_tokens}
+        for term, _, weight in terms.synonyms:
+            term_weights.setdefault(term, weight)
 
         # Contar matches por documento
+        # Orden fijo de tokens: la suma y los empates no dependen del hash de strings
         doc_scores: Dict[int, float] = {}
-        for token in expanded_tokens:
+        for token in sorted(term_weights):
             if token in self.keyword_index:
-                for doc_idx in self.keyword_index[token]:
-                    if doc_idx not in doc_scores:
-                        doc_scores[doc_idx] = 0
-                    # Boost para tokens originales vs sinónimos
-                    boost = 2.0 if token in all_tokens else 1.0
-                    # Boost extra para términos de alta importancia
-                    if token in high_value_terms:
-                        boost *= 1.5
-                    doc_scores[doc_idx] += boost
+                # Boost para tokens originales vs sinónimos
+                boost = 2.0 * term_weights[token]
+                # Boost extra para términos de alta importancia
+                if token in self.HIGH_VALUE_TERMS:
+                    boost *= 1.5
+                for doc_idx in self.keyword_index[token].tolist():
+                    doc_scores[doc_idx] = doc_scores.get(doc_idx, 0) + boost
 
         # Boost adicional por coincidencia directa en pregunta
-        query_normalized = self._normalize(query)
-        for i, qa in enumerate(self.qa_pairs):
-            pregunta_norm = self._normalize(qa['pregunta'])
+        long_tokens = [t for t in all_tokens if len(t) > 3]
+        for i in doc_scores:
+            pregunta_norm = self.pregunta_norm[i]
             # Si palabras clave de la query aparecen en la pregunta
-            matches = sum(1 for t in all_tokens if t in pregunta_norm and len(t) > 3)
-            if matches > 0 and i in doc_scores:
+            matches = sum(1 for t in long_tokens if t in pregunta_norm)
+            if matches > 0:
                 doc_scores[i] *= (1 + matches * 0.3)
 
         # Normalizar scores
@@ -302,17 +768,17 @@ class RAGEngine:
             doc_scores = {k: v / max_score for k, v in doc_scores.items()}
 
         # Ordenar por score
-        sorted_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-        return sorted_docs[:top_k]
+        sorted_docs = sorted(doc_scores.items(), key=lambda x: (-x[1], x[0]))
+        return sorted_docs[:top_k] if top_k is not None else sorted_docs
 
     def _detect_intent(self, query: str) -> Optional[str]:
         """Detecta la intención de la query basado en keywords"""
         query_lower = self._normalize(query)
 
         # Primero verificar patrones de query completos
-        for intent, patterns in QUERY_PATTERNS.items():
+        for intent, patterns in self._query_patterns_norm.items():
             for pattern in patterns:
-                if self._normalize(pattern) in query_lower:
+                if pattern in query_lower:
                     return intent
 
         for intent, keywords in INTENT_KEYWORDS.items():
@@ -333,80 +799,219 @@ class RAGEngine:
         Returns:
             Lista de (qa_pair, score)
         """
-        # 1. Expandir query con sinónimos
-        expanded_query = self._expand_query(query)
+        return self.score_query(query).top(top_k, categories)
 
-        # 2. Búsqueda TF-IDF con query expandida
-        query_vec = self._get_vector(expanded_query)
+    def search_with_global(self, query: str, top_k: int = 5,
+                           categories: Optional[List[str]] = None) -> Tuple[List[Tuple[dict, float]], List[Tuple[dict, float]]]:
+        """Una sola pasada de scoring para (top-k filtrado, top-k global con boost de categorías nativas)"""
+        return self.score_query(query).top_with_global(top_k, categories)
 
-        tfidf_results = []
-        for i, (qa, emb) in enumerate(zip(self.qa_pairs, self.embeddings)):
-            if categories and qa['categoria'] not in categories:
-                continue
-            score = float(np.dot(query_vec, emb))
-            tfidf_results.append((i, score))
+    def score_query(self, query: str) -> 'QueryScores':
+        """
+        Puntúa la query contra todo el corpus (pasos 1-4 de search, sin filtro de categorías).
 
-        # 3. Búsqueda por keywords
-        keyword_results = self._keyword_search(query, top_k=top_k * 2)
-        keyword_dict = dict(keyword_results)
+        El resultado permite sacar después el top-k de cualquier conjunto de categorías
+        sin volver a puntuar, p. ej. cuando el agente se decide después de buscar.
+        """
+        # 1. Tokenizar y expandir query con sinónimos (una sola vez para todos los canales)
+        terms = self._analyze_query(query)
 
-        # 4. Combinar scores (híbrido)
-        # TF-IDF tiene más peso pero keywords ayuda cuando TF-IDF falla
-        combined_scores: Dict[int, float] = {}
+        # 2-4. Score base por documento según el motor configurado
+        if self.scoring == 'bm25':
+            combined = self._bm25_scores(terms)
+        else:
+            combined = self._hybrid_scores(terms)
 
         # Detectar intent una vez
         intent = self._detect_intent(query)
 
-        for i, tfidf_score in tfidf_results:
-            keyword_score = keyword_dict.get(i, 0)
-            # Ponderación: 60% TF-IDF, 40% keywords
-            combined = (tfidf_score * 0.6) + (keyword_score * 0.4)
-
-            qa = self.qa_pairs[i]
-
-            # Boost adicional si coincide con categoría de intent detectado
-            if intent:
-                category = qa.get('categoria', '')
-                if intent in category or any(kw in category for kw in INTENT_KEYWORDS.get(intent, [])):
-                    combined *= 1.2
-
-            # Boost especial para intent de concentración: buscar en pregunta/respuesta
-            if intent == 'concentracion':
-                pregunta_norm = self._normalize(qa['pregunta'])
-                respuesta_norm = self._normalize(qa['respuesta'])
-                if 'concentracion' in pregunta_norm:
-                    combined = max(combined * 4.0, 0.5)  # boost muy significativo
-                elif 'concentrado' in pregunta_norm or 'potente' in pregunta_norm:
-                    combined = max(combined * 3.0, 0.4)
-                elif 'concentracion' in respuesta_norm or 'concentrado' in respuesta_norm:
-                    combined *= 2.0
-
-            combined_scores[i] = combined
-
-        # 5. Ordenar y devolver top_k
-        sorted_results = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)
-
-        results = []
-        for i, score in sorted_results[:top_k]:
-            if categories and self.qa_pairs[i]['categoria'] not in categories:
-                continue
-            results.append((self.qa_pairs[i], score))
+        # Boost adicional si coincide con categoría de intent detectado
+        if intent:
+            intent_categories = [
+                category for category in self.category_to_code
+                if intent in category or any(kw in category for kw in INTENT_KEYWORDS.get(intent, []))
+            ]
+            intent_mask = self._category_mask(intent_categories)
+            if intent_mask is not None:
+                combined[intent_mask] *= 1.2
+
+        # Boost especial para intent de concentración: buscar en pregunta/respuesta
+        if intent == 'concentracion':
+            tier = self.concentration_tier
+            # 'concentracion' en la pregunta: boost muy significativo
+            combined[tier == 3] = np.maximum(combined[tier == 3] * 4.0, 0.5)
+            # 'concentrado'/'potente' en la pregunta
+            combined[tier == 2] = np.maximum(combined[tier == 2] * 3.0, 0.4)
+            # mención en la respuesta
+            combined[tier == 1] *= 2.0
+
+        return QueryScores(self, combined)
+
+    def _hybrid_scores(self, terms: QueryTerms) -> np.ndarray:
+        """Score híbrido por documento: 60% TF-IDF + 40% keywords"""
+        # Búsqueda TF-IDF con query expandida: un solo producto matriz-vector
+        query_vec = self._query_vector(terms)
+        tfidf_scores = self.embeddings.dot(query_vec)
+
+        # Búsqueda por keywords (todos los documentos con algún término, sin recorte a top-k:
+        # los sinónimos normalizados llegan a más documentos y el recorte global dejaba fuera
+        # documentos relevantes de la categoría pedida)
+        keyword_scores = np.zeros(len(self.qa_pairs))
+        for i, score in self._keyword_search(terms):
+            keyword_scores[i] = score
 
-        return results[:top_k]
+        # TF-IDF tiene más peso pero keywords ayuda cuando TF-IDF falla
+        return (tfidf_scores * 0.6) + (keyword_scores * 0.4)
+
+    def _bm25_scores(self, terms: QueryTerms) -> np.ndarray:
+        """Score BM25 por documento, normalizado por el de un documento medio con todos los términos"""
+        weights: Dict[int, float] = {}
+        for word in terms.tokens_stemmed:
+            idx = self.word_to_idx.get(word)
+            if idx is not None:
+                weights[idx] = weights.get(idx, 0.0) + 1.0
+        for _, idx, weight in terms.synonyms:
+            if idx >= 0:
+                weights[idx] = weights.get(idx, 0.0) + weight
+
+        scores = np.zeros(len(self.qa_pairs))
+        docs, doc_scores = self.bm25.score(weights)
+        reference = self.bm25.reference_score(weights)
+        if reference > 0:
+            scores[docs] = doc_scores / reference
+        return scores
 
     def get_categories(self) -> List[str]:
         """Retorna todas las categorías disponibles"""
         return list(set(qa['categoria'] for qa in self.qa_pairs))
 
 
-# Singleton del motor RAG
+class QueryScores:
+    """Scores de una query sobre todo el corpus de un RAGEngine concreto.
+
+    Guarda la instancia con la que se puntuó: aunque la KB se recargue después,
+    los ids de documento siguen refiriéndose a sus qa_pairs.
+    """
+
+    __slots__ = ('engine', 'scores')
+
+    def __init__(self, engine: RAGEngine, scores: np.ndarray):
+        self.engine = engine
+        self.scores = scores
+
+    def top(self, top_k: int = 5, categories: Optional[List[str]] = None) -> List[Tuple[dict, float]]:
+        """Top-k entre los documentos de las categorías pedidas (None = todas)"""
+        top = self._top_ids(top_k, categories)
+        return [(self.engine.qa_pairs[i], float(self.scores[i])) for i in top]
+
+    def top_with_global(self, top_k: int = 5, categories: Optional[List[str]] = None,
+                        native_boost: float = NATIVE_CATEGORY_BOOST) -> Tuple[List[Tuple[dict, float]], List[Tuple[dict, float]]]:
+        """
+        Top-k filtrado por categorías y top-k global fusionado con él, por id de documento.
+
+        En la fusión, los documentos del top-k filtrado que también están en el global
+        reciben `native_boost` (si mejora su score); los que solo están en el filtrado
+        entran con su score.
+        """
+        filtered_ids = self._top_ids(top_k, categories).tolist()
+        merged = {i: float(self.scores[i]) for i in self._top_ids(top_k, None).tolist()}
+        for i in filtered_ids:
+            score = float(self.scores[i])
+            merged[i] = max(score * native_boost, merged[i]) if i in merged else score
+
+        qa_pairs = self.engine.qa_pairs
+        merged_ids = sorted(merged, key=lambda i: (-merged[i], i))[:top_k]
+        return (
+            [(qa_pairs[i], float(self.scores[i])) for i in filtered_ids],
+            [(qa_pairs[i], merged[i]) for i in merged_ids],
+        )
+
+    def _top_ids(self, top_k: int, categories: Optional[List[str]]) -> np.ndarray:
+        mask = self.engine._category_mask(categories)
+        if mask is None:
+            return top_k_indices(self.scores, top_k)
+        candidates = np.flatnonzero(mask)
+        return candidates[top_k_indices(self.scores[candidates], top_k)]
+
+
+def kb_content_version(raw: bytes) -> str:
+    """Versión de la base de conocimiento: hash del contenido del JSON"""
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+ARTIFACT_ARRAYS = (
+    'idf', 'embeddings_data', 'embeddings_indices', 'embeddings_indptr', 'embeddings_row_ids',
+    'concentration_tier', 'keyword_docs', 'keyword_ptr',
+) + tuple('bm25_' + name for name in BM25Index.ARRAYS)
+
+KNOWLEDGE_BASE_PATH = os.getenv(
+    "KNOWLEDGE_BASE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'knowledge_base.json')
+)
+
+# Artefactos de índice precalculados (uno por versión de la KB); vacío = desactivado
+RAG_INDEX_DIR = os.getenv(
+    "RAG_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'index_cache')
+)
+# Subir al cambiar tokenización, stemming o el contenido del artefacto: invalida los existentes
+INDEX_FORMAT_VERSION = 1
+
+# Singleton del motor RAG. Una instancia no se modifica tras construirse: recargar la KB
+# crea otra y sustituye la referencia, así que las búsquedas en curso terminan sobre la anterior
 _rag_instance = None
+_rag_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_reload_stats = {"reloads": 0, "last_error": None, "failed_version": None}
 
 def get_rag_engine() -> RAGEngine:
     """Obtiene la instancia singleton del RAG"""
     global _rag_instance
     if _rag_instance is None:
-        base_path = os.path.dirname(os.path.dirname(__file__))
-        kb_path = os.path.join(base_path, 'knowledge_base.json')
-        _rag_instance = RAGEngine(kb_path)
+        with _rag_lock:
+            if _rag_instance is None:
+                _rag_instance = RAGEngine(KNOWLEDGE_BASE_PATH)
     return _rag_instance
+
+
+def reload_rag_engine(force: bool = False) -> bool:
+    """Reconstruye el índice desde el fichero de la KB y lo publica si el contenido cambió.
+
+    Pensado para ejecutarse en un hilo: la construcción no toca la instancia activa y el
+    cambio final es una sola asignación. Si el JSON no es válido se conserva la anterior."""
+    global _rag_instance
+    with _reload_lock:
+        current = get_rag_engine()
+        with open(KNOWLEDGE_BASE_PATH, 'rb') as f:
+            version = kb_content_version(f.read())
+        if not force and (version == current.kb_version or version == _reload_stats["failed_version"]):
+            return False
+
+        try:
+            engine = RAGEngine(KNOWLEDGE_BASE_PATH, scoring=current.scoring)
+        except (OSError, ValueError, KeyError) as e:
+            _reload_stats["last_error"] = f"{type(e).__name__}: {e}"
+            _reload_stats["failed_version"] = version
+            print(f"[RAG] Recarga fallida, se mantiene la versión {current.kb_version}: {e}")
+            return False
+
+        _rag_instance = engine
+        _reload_stats["reloads"] += 1
+        _reload_stats["last_error"] = None
+        _reload_stats["failed_version"] = None
+        print(f"[RAG] KB recargada: {current.kb_version} → {engine.kb_version} ({engine.build_ms:.0f} ms)")
+        return True
+
+
+def get_reload_status() -> dict:
+    """Versión activa de la KB y datos de la última construcción/recarga del índice"""
+    engine = get_rag_engine()
+    return {
+        "kb_version": engine.kb_version,
+        "documents": len(engine.qa_pairs),
+        "build_ms": round(engine.build_ms, 1),
+        "index": engine.index_source,
+        "loaded_at": engine.loaded_at,
+        "reloads": _reload_stats["reloads"],
+        "last_error": _reload_stats["last_error"],
+    }
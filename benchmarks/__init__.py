@@ -0,0 +1 @@
+# Benchmarks y herramientas de carga de Omia (no se incluyen en la imagen Docker)
@@ -0,0 +1,147 @@
+"""
+Servidor LLM falso compatible con la API de OpenAI (chat.completions)
+Responde en streaming SSE con latencia y velocidad de tokens configurables,
+para medir el backend sin depender de Groq. También imita la transcripción
+Whisper de Groq (/openai/v1/audio/transcriptions) devolviendo el hash del audio.
+
+Uso:
+    python -m benchmarks.fake_llm_server --port 8001 --tokens-per-sec 50 --latency 0.3
+    LLM_BASE_URL=http://127.0.0.1:8001/v1 GROQ_BASE_URL=http://127.0.0.1:8001 GROQ_API_KEY=bench uvicorn main:app
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+SAMPLE_TEXT = (
+    "## Natural DHA\n\n"
+    "| Parámetro | Valor |\n|-----------|-------|\n| DHA | 500 mg |\n| Forma | rTG |\n\n"
+    "**Indicación principal**: embarazo y lactancia, desarrollo cerebral y visual del bebé. "
+    "**Posología**: una perla al día con la comida principal. "
+    "> Doctor, el DHA en forma rTG se absorbe mejor y su pureza está certificada por IFOS. "
+)
+
+SAMPLE_INFOGRAPHIC = {
+    "titulo": "Natural DHA",
+    "subtitulo": "DHA de alta pureza para embarazo y lactancia",
+    "color_tema": "productos",
+    "secciones": [
+        {"icono": "pill", "titulo": "Composición", "puntos": ["500 mg de DHA por perla", "Forma rTG"]},
+    ],
+    "producto_destacado": {"nombre": "Natural DHA", "dosis": "1 perla/día", "indicacion": "Embarazo"},
+    "frase_clave": "Pureza certificada IFOS 5 estrellas",
+    "datos_tabla": [{"etiqueta": "DHA", "valor": "500 mg"}, {"etiqueta": "Forma", "valor": "rTG"}],
+}
+
+
+def build_app(tokens_per_sec: float = 50.0, latency: float = 0.3, n_tokens: int = 200) -> FastAPI:
+    """Crea la app del servidor falso con la configuración de velocidad dada"""
+    app = FastAPI(title="Fake LLM")
+    words = SAMPLE_TEXT.split(" ")
+    stats = {"requests": 0, "streams": 0, "transcriptions": 0, "max_concurrent_transcriptions": 0}
+    active = {"transcriptions": 0}
+
+    def response_tokens(max_tokens: int) -> list:
+        count = min(n_tokens, max_tokens or n_tokens)
+        return [words[i % len(words)] + " " for i in range(count)]
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/openai/v1/audio/transcriptions")
+    async def transcriptions(file: UploadFile = File(...), model: str = Form("whisper-large-v3")):
+        data = await file.read()
+        stats["transcriptions"] += 1
+        active["transcriptions"] += 1
+        stats["max_concurrent_transcriptions"] = max(
+            stats["max_concurrent_transcriptions"], active["transcriptions"]
+        )
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            active["transcriptions"] -= 1
+        # El texto identifica el audio recibido: permite detectar uploads cruzados
+        return {"text": hashlib.sha256(data).hexdigest()}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        model = body.get("model", "fake")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps(SAMPLE_INFOGRAPHIC, ensure_ascii=False)
+            tokens = [content]
+        else:
+            tokens = response_tokens(body.get("max_tokens"))
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency + len(tokens) / tokens_per_sec)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+            })
+
+        stats["streams"] += 1
+
+        def sse(delta: dict, finish_reason=None) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+        async def event_stream():
+            await asyncio.sleep(latency)
+            yield sse({"role": "assistant", "content": ""})
+            for token in tokens:
+                yield sse({"content": token})
+                await asyncio.sleep(1.0 / tokens_per_sec)
+            yield sse({}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor LLM falso OpenAI-compatible")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--latency", type=float, default=0.3, help="Segundos hasta el primer token")
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens por respuesta")
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(
+        build_app(args.tokens_per_sec, args.latency, args.tokens),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
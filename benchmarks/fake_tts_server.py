@@ -0,0 +1,74 @@
+"""
+Servidor TTS falso con la ruta de streaming de ElevenLabs
+Devuelve bytes "MP3" en trozos con latencia configurable y cuenta las
+conexiones TCP distintas que recibe (para comprobar la reutilización del pool).
+
+Uso:
+    python -m benchmarks.fake_tts_server --port 8002 --latency 0.2
+    ELEVENLABS_BASE_URL=http://127.0.0.1:8002 ELEVENLABS_API_KEY=bench uvicorn main:app
+"""
+import argparse
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def build_app(latency: float = 0.2, bytes_per_char: int = 200, chunk_size: int = 4096,
+              chunk_delay: float = 0.005) -> FastAPI:
+    """Crea la app: `latency` hasta el primer byte y `bytes_per_char` de audio por carácter de texto"""
+    app = FastAPI(title="Fake TTS")
+    peers = set()
+    stats = {"requests": 0, "connections": 0, "chars": 0}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/v1/text-to-speech/{voice_id}/stream")
+    async def text_to_speech(voice_id: str, request: Request):
+        body = await request.json()
+        text = body.get("text", "")
+        stats["requests"] += 1
+        stats["chars"] += len(text)
+        # Cada conexión keep-alive conserva su puerto de origen
+        peer = (request.client.host, request.client.port) if request.client else None
+        if peer not in peers:
+            peers.add(peer)
+            stats["connections"] = len(peers)
+
+        total = max(1, len(text)) * bytes_per_char
+
+        async def audio():
+            await asyncio.sleep(latency)
+            sent = 0
+            while sent < total:
+                size = min(chunk_size, total - sent)
+                yield b"\xff" * size
+                sent += size
+                await asyncio.sleep(chunk_delay)
+
+        return StreamingResponse(audio(), media_type="audio/mpeg")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor TTS falso (API de streaming de ElevenLabs)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--latency", type=float, default=0.2, help="Segundos hasta el primer byte")
+    parser.add_argument("--bytes-per-char", type=int, default=200)
+    args = parser.parse_args()
+
+    import uvicorn
+    uvicorn.run(
+        build_app(args.latency, args.bytes_per_char),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
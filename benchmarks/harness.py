@@ -0,0 +1,124 @@
+"""
+Utilidades comunes de los benchmarks: puertos libres y arranque de
+subprocesos (servidores LLM/TTS falsos y backend de Omia) con espera a que respondan.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    """Devuelve un puerto TCP libre en localhost"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_http(url: str, timeout: float = 30.0):
+    """Espera hasta que la URL responda (cualquier status HTTP)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Timeout esperando a {url}")
+
+
+@contextmanager
+def run_process(args: List[str], ready_url: str, env: Optional[Dict[str, str]] = None,
+                quiet: bool = True) -> Iterator[subprocess.Popen]:
+    """Lanza un subproceso Python desde la raíz del repo y lo termina al salir"""
+    proc_env = dict(os.environ)
+    proc_env.update(env or {})
+    proc = subprocess.Popen(
+        [sys.executable] + args,
+        cwd=REPO_ROOT,
+        env=proc_env,
+        stdout=subprocess.DEVNULL if quiet else None,
+        stderr=subprocess.DEVNULL if quiet else None,
+    )
+    try:
+        wait_for_http(ready_url)
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+@contextmanager
+def fake_llm_server(tokens_per_sec: float = 50.0, latency: float = 0.3,
+                    tokens: int = 200) -> Iterator[str]:
+    """Arranca el servidor LLM falso y devuelve su base_url OpenAI-compatible"""
+    port = free_port()
+    args = [
+        "-m", "benchmarks.fake_llm_server", "--port", str(port),
+        "--tokens-per-sec", str(tokens_per_sec), "--latency", str(latency), "--tokens", str(tokens),
+    ]
+    with run_process(args, f"http://127.0.0.1:{port}/stats"):
+        yield f"http://127.0.0.1:{port}/v1"
+
+
+@contextmanager
+def fake_tts_server(latency: float = 0.2, bytes_per_char: int = 200) -> Iterator[str]:
+    """Arranca el servidor TTS falso y devuelve su URL base (ELEVENLABS_BASE_URL)"""
+    port = free_port()
+    args = [
+        "-m", "benchmarks.fake_tts_server", "--port", str(port),
+        "--latency", str(latency), "--bytes-per-char", str(bytes_per_char),
+    ]
+    with run_process(args, f"http://127.0.0.1:{port}/stats"):
+        yield f"http://127.0.0.1:{port}"
+
+
+@contextmanager
+def omia_app(llm_base_url: str, env: Optional[Dict[str, str]] = None,
+             extra_args: Optional[List[str]] = None) -> Iterator[str]:
+    """Arranca el backend (uvicorn main:app) apuntando al LLM dado y devuelve su URL base"""
+    port = free_port()
+    app_env = {"GROQ_API_KEY": "bench", "LLM_BASE_URL": llm_base_url}
+    app_env.update(env or {})
+    args = ["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    args += extra_args or []
+    with run_process(args, f"http://127.0.0.1:{port}/api/health", env=app_env):
+        yield f"127.0.0.1:{port}"
+
+
+def scaled_kb(source: str, scale: int, directory: str) -> str:
+    """Copia de la KB replicada `scale` veces (ids nuevos y un sufijo por copia en la pregunta)"""
+    with open(source, encoding='utf-8') as f:
+        data = json.load(f)
+    pairs = []
+    for copy in range(scale):
+        for qa in data['qa_pairs']:
+            suffix = f" lote{copy}" if copy else ""
+            pairs.append({**qa, 'id': len(pairs) + 1, 'pregunta': qa['pregunta'] + suffix})
+    path = os.path.join(directory, f"kb_x{scale}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({**data, 'qa_pairs': pairs}, f, ensure_ascii=False)
+    return path
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por interpolación lineal (pct en 0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
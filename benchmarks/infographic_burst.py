@@ -0,0 +1,79 @@
+"""
+Ráfaga de infografías contra el límite del upstream.
+
+Lanza N peticiones /api/infographic simultáneas con un LLM falso lento y
+muestra cuántas se atienden, cuántas reciben 429 y las métricas de
+/api/upstreams/stats (cola y espera) para dimensionar
+INFOGRAPHIC_MAX_CONCURRENT / INFOGRAPHIC_MAX_QUEUE. Mide también
+/api/health durante la ráfaga: el resto de la app no debe notarla.
+
+Uso:
+    python -m benchmarks.infographic_burst --requests 30 --max-concurrent 4 --max-queue 8
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.harness import fake_llm_server, omia_app, percentile
+
+
+AGENT_RESPONSE = "Natural DHA aporta 500 mg de DHA por perla en forma rTG, indicado en embarazo y lactancia."
+
+
+async def burst(host: str, n_requests: int) -> dict:
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        async def infographic(i: int):
+            # Una respuesta distinta por petición: la caché y el single-flight no las agrupan
+            agent_response = f"{AGENT_RESPONSE} (consulta {i})"
+            resp = await client.post(f"http://{host}/api/infographic", json={"agent_response": agent_response})
+            return resp.status_code
+
+        async def health():
+            t0 = time.perf_counter()
+            await client.get(f"http://{host}/api/health")
+            return time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        tasks = [asyncio.create_task(infographic(i)) for i in range(n_requests)]
+        health_latencies = []
+        while not all(t.done() for t in tasks):
+            health_latencies.append(await health())
+            await asyncio.sleep(0.05)
+        statuses = [t.result() for t in tasks]
+        wall = time.perf_counter() - t0
+        stats = (await client.get(f"http://{host}/api/upstreams/stats")).json()
+
+    return {
+        "requests": n_requests,
+        "ok": statuses.count(200),
+        "rejected_429": statuses.count(429),
+        "other": len(statuses) - statuses.count(200) - statuses.count(429),
+        "wall_s": round(wall, 3),
+        "health_p99_s": round(percentile(health_latencies, 99), 3),
+        "infographic": stats["infographic"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ráfaga de /api/infographic contra el límite del upstream")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--max-concurrent", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=1.0, help="Latencia del LLM falso (s)")
+    args = parser.parse_args()
+
+    env = {
+        "INFOGRAPHIC_MAX_CONCURRENT": str(args.max_concurrent),
+        "INFOGRAPHIC_MAX_QUEUE": str(args.max_queue),
+    }
+    with fake_llm_server(latency=args.latency) as llm_url:
+        with omia_app(llm_url, env=env) as host:
+            result = asyncio.run(burst(host, args.requests))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
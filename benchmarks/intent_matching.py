@@ -0,0 +1,83 @@
+"""
+Micro-benchmark del clasificador por reglas y del detector de saludos/vagos.
+
+Compara la implementación anterior (un re.search por patrón) con las
+alternancias compiladas y verifica que clasifican igual cada mensaje.
+
+Uso:
+    python -m benchmarks.intent_matching --rounds 200
+"""
+import argparse
+import json
+import re
+import time
+import unicodedata
+
+from benchmarks.rep_messages import load_messages
+
+import main
+from agents.orchestrator import Orchestrator
+
+
+def legacy_classify_intent_rules(message: str) -> str:
+    """Versión anterior: re.search patrón por patrón"""
+    message_lower = message.lower()
+    for pattern in Orchestrator.OBJECTION_PATTERNS:
+        if re.search(pattern, message_lower):
+            return "objeciones"
+    for pattern in Orchestrator.ARGUMENT_PATTERNS:
+        if re.search(pattern, message_lower):
+            return "argumentos"
+    return "productos"
+
+
+def legacy_is_greeting_or_vague(message: str) -> bool:
+    """Versión anterior: re.search patrón por patrón"""
+    t = unicodedata.normalize('NFD', message.lower().strip())
+    t = re.sub(r'[\u0300-\u036f]', '', t)
+    if any(re.search(p, t) for p in main.FOLLOWUP_PATTERNS):
+        return False
+    return not any(re.search(p, t) for p in main.PHARMA_PATTERNS)
+
+
+def per_message_us(fn, messages, rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for m in messages:
+            fn(m)
+    return (time.perf_counter() - t0) / (rounds * len(messages)) * 1e6
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Coste por mensaje de los matchers de intención")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    messages = load_messages()
+    orchestrator = Orchestrator.__new__(Orchestrator)  # solo reglas: sin agentes ni RAG
+
+    mismatches = [
+        m for m in messages
+        if legacy_classify_intent_rules(m) != orchestrator.classify_intent_rules(m)
+        or legacy_is_greeting_or_vague(m) != main.is_greeting_or_vague(m)
+    ]
+
+    result = {
+        "messages": len(messages),
+        "mismatches": len(mismatches),
+        "classify_intent_rules_us": {
+            "before": round(per_message_us(legacy_classify_intent_rules, messages, args.rounds), 2),
+            "after": round(per_message_us(orchestrator.classify_intent_rules, messages, args.rounds), 2),
+        },
+        "is_greeting_or_vague_us": {
+            "before": round(per_message_us(legacy_is_greeting_or_vague, messages, args.rounds), 2),
+            "after": round(per_message_us(main.is_greeting_or_vague, messages, args.rounds), 2),
+        },
+    }
+    print(json.dumps(result, indent=2))
+    if mismatches:
+        raise SystemExit(f"Clasificación distinta en: {mismatches[:5]}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,107 @@
+"""
+Escalado de /ws/chat con varios workers de uvicorn (WEB_CONCURRENCY).
+
+Para cada número de workers arranca el backend con `--workers N` contra un LLM
+falso rápido (sin latencia, para que el coste sea el CPU del backend: RAG,
+orquestador y frames), espera a que respondan todos los procesos y lanza
+`--clients` clientes en bucle cerrado durante `--duration` segundos: cada
+iteración abre un socket, hace una pregunta distinta de la KB y lo cierra.
+Mide sesiones por segundo y su escalado respecto a 1 worker; el escalado solo
+puede ser casi lineal si la máquina tiene al menos tantos núcleos como workers
+(más el del servidor LLM falso y el del propio cliente).
+
+La caché de respuestas se desactiva para que cada sesión pase por el LLM.
+
+Uso:
+    python -m benchmarks.multiworker --workers 1 2 4 --clients 32 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from benchmarks.harness import REPO_ROOT, fake_llm_server, omia_app, percentile
+from benchmarks.ws_concurrency import run_session
+
+
+def kb_questions() -> list:
+    with open(os.path.join(REPO_ROOT, 'knowledge_base.json'), encoding='utf-8') as f:
+        return [qa['pregunta'] for qa in json.load(f)['qa_pairs']]
+
+
+def wait_for_workers(host: str, workers: int, timeout: float = 60.0) -> int:
+    """Consulta /api/health con conexiones nuevas hasta ver `workers` pids distintos"""
+    pids = set()
+    deadline = time.monotonic() + timeout
+    while len(pids) < workers and time.monotonic() < deadline:
+        try:
+            pids.add(httpx.get(f"http://{host}/api/health", timeout=5.0).json()["pid"])
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    return len(pids)
+
+
+async def closed_loop(host: str, questions: list, clients: int, duration: float) -> dict:
+    deadline = time.perf_counter() + duration
+    latencies = []
+    errors = 0
+    counter = 0
+
+    async def client():
+        nonlocal errors, counter
+        while time.perf_counter() < deadline:
+            question = questions[counter % len(questions)]
+            counter += 1
+            try:
+                session = await run_session(host, question)
+            except Exception:
+                errors += 1
+                continue
+            if session["error"]:
+                errors += 1
+            else:
+                latencies.append(session["total"])
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    wall = time.perf_counter() - t0
+    return {
+        "sessions": len(latencies),
+        "errors": errors,
+        "sessions_per_s": round(len(latencies) / wall, 1),
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p99_s": round(percentile(latencies, 99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sesiones de chat por segundo según el número de workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=32, help="Clientes concurrentes en bucle cerrado")
+    parser.add_argument("--duration", type=float, default=10.0, help="Segundos de carga por configuración")
+    parser.add_argument("--tokens", type=int, default=60, help="Tokens por respuesta del LLM falso")
+    parser.add_argument("--tokens-per-sec", type=float, default=5000.0)
+    args = parser.parse_args()
+
+    questions = kb_questions()
+    env = {"ANSWER_CACHE_MAX_ENTRIES": "0", "KB_WATCH_INTERVAL": "0"}
+    result = {"cpu_count": os.cpu_count(), "clients": args.clients, "runs": {}}
+    with fake_llm_server(args.tokens_per_sec, 0.0, args.tokens) as llm_url:
+        for workers in args.workers:
+            with omia_app(llm_url, env=env, extra_args=["--workers", str(workers)]) as host:
+                ready = wait_for_workers(host, workers)
+                run = asyncio.run(closed_loop(host, questions, args.clients, args.duration))
+            result["runs"][f"workers_{workers}"] = {"workers": workers, "workers_seen": ready, **run}
+
+    base = result["runs"][f"workers_{args.workers[0]}"]["sessions_per_s"] or 1e-6
+    for run in result["runs"].values():
+        run["scaling"] = round(run["sessions_per_s"] / base, 2)
+        run["efficiency"] = round(run["scaling"] * args.workers[0] / run["workers"], 2)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
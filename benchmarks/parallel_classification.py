@@ -0,0 +1,87 @@
+"""
+Latencia de Orchestrator.process_message con clasificación por LLM:
+clasificar y después buscar vs buscar en paralelo con la clasificación.
+
+Usa el LLM falso (latencia de clasificación configurable) y la KB replicada
+`--scale` veces para que la búsqueda tenga un coste apreciable. En modo
+paralelo la latencia debe acercarse a max(clasificación, búsqueda) en vez de
+a su suma, con el mismo contexto en ambos modos.
+
+Uso:
+    python -m benchmarks.parallel_classification --scale 50 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.harness import REPO_ROOT, fake_llm_server, percentile, scaled_kb
+
+
+async def run(orchestrator, questions: list, parallel: bool) -> dict:
+    orchestrator.parallel_classification = parallel
+    latencies = []
+    contexts = []
+    for question in questions:
+        t0 = time.perf_counter()
+        intent, _, context = await orchestrator.process_message(question)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        contexts.append((intent, context))
+    return {
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "contexts": contexts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="process_message secuencial vs clasificación y búsqueda en paralelo")
+    parser.add_argument("--scale", type=int, default=50, help="Copias de la KB (coste de la búsqueda)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Latencia del LLM clasificador (s)")
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_ROOT, 'knowledge_base.json'), encoding='utf-8') as f:
+        questions = [qa['pregunta'] for qa in json.load(f)['qa_pairs']][:args.queries]
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            fake_llm_server(tokens_per_sec=1000.0, latency=args.latency, tokens=2) as llm_url:
+        # Configuración leída al importar los agentes
+        os.environ.update({
+            "KNOWLEDGE_BASE_PATH": scaled_kb(os.path.join(REPO_ROOT, 'knowledge_base.json'), args.scale, tmp),
+            "RAG_INDEX_DIR": "",
+            "LLM_BASE_URL": llm_url,
+            "GROQ_API_KEY": "bench",
+        })
+        from agents.orchestrator import Orchestrator
+        from agents.rag_engine import get_rag_engine
+
+        rag = get_rag_engine()
+        t0 = time.perf_counter()
+        for question in questions:
+            rag.score_query(question)
+        search_ms = (time.perf_counter() - t0) * 1000 / len(questions)
+
+        async def bench():
+            orchestrator = Orchestrator()
+            await orchestrator.classify_intent("calentamiento")
+            return await run(orchestrator, questions, False), await run(orchestrator, questions, True)
+
+        sequential, parallel = asyncio.run(bench())
+
+    result = {
+        "documents": len(rag.qa_pairs),
+        "search_ms": round(search_ms, 1),
+        "classify_latency_ms": args.latency * 1000,
+        "sequential": {k: v for k, v in sequential.items() if k != "contexts"},
+        "parallel": {k: v for k, v in parallel.items() if k != "contexts"},
+        "saved_ms_p50": round(sequential["p50_ms"] - parallel["p50_ms"], 1),
+        "same_context": sequential["contexts"] == parallel["contexts"],
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Arranque del motor RAG: construir el índice desde el JSON vs cargar el artefacto precalculado.
+
+Replica la KB `--scale` veces (ids nuevos, mismo texto con un sufijo por copia
+para que el vocabulario crezca) en un directorio temporal y mide, para cada
+tamaño, la construcción completa, la construcción + escritura del artefacto y
+la carga con mmap. Comprueba además que ambos índices devuelven lo mismo.
+
+Uso:
+    python -m benchmarks.rag_cold_start
+    python -m benchmarks.rag_cold_start --scale 1 10 50
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.harness import REPO_ROOT, percentile, scaled_kb
+
+from agents.rag_engine import RAGEngine
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return percentile(samples, 50)
+
+
+def measure(kb_path: str, index_dir: str, repeat: int) -> dict:
+    build_ms = timed(lambda: RAGEngine(kb_path, index_dir=""), repeat)
+
+    t0 = time.perf_counter()
+    built = RAGEngine(kb_path, index_dir=index_dir)
+    build_and_save_ms = (time.perf_counter() - t0) * 1000
+
+    load_ms = timed(lambda: RAGEngine(kb_path, index_dir=index_dir), repeat)
+    loaded = RAGEngine(kb_path, index_dir=index_dir)
+    assert loaded.index_source == "artifact"
+
+    mismatches = 0
+    for qa in built.qa_pairs[:200]:
+        expected = [(r['id'], round(s, 9)) for r, s in built.search(qa['pregunta'])]
+        got = [(r['id'], round(s, 9)) for r, s in loaded.search(qa['pregunta'])]
+        mismatches += expected != got
+
+    artifact = loaded._artifact_path()
+    artifact_bytes = sum(os.path.getsize(os.path.join(artifact, n)) for n in os.listdir(artifact))
+    return {
+        "documents": len(built.qa_pairs),
+        "vocab": len(built.vocab),
+        "build_ms": round(build_ms, 1),
+        "build_and_save_ms": round(build_and_save_ms, 1),
+        "artifact_load_ms": round(load_ms, 1),
+        "speedup": round(build_ms / max(load_ms, 1e-6), 1),
+        "artifact_kb": round(artifact_bytes / 1024, 1),
+        "search_mismatches": mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construcción del índice RAG vs carga del artefacto")
+    parser.add_argument("--kb", default=os.path.join(REPO_ROOT, 'knowledge_base.json'))
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    result = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in args.scale:
+            kb_path = scaled_kb(args.kb, scale, tmp)
+            index_dir = os.path.join(tmp, f"index_x{scale}")
+            result[f"x{scale}"] = measure(kb_path, index_dir, args.repeat)
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
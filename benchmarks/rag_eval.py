@@ -0,0 +1,103 @@
+"""
+Evaluación offline de los motores de scoring del RAG (híbrido TF-IDF+keywords vs BM25).
+
+Las queries etiquetadas se derivan de las preguntas de la KB (el documento
+esperado es el de la propia pregunta):
+  - original:   la pregunta tal cual
+  - content:    solo palabras de contenido, sin tildes ni signos
+  - partial:    la primera mitad de las palabras de contenido
+
+Uso:
+    python -m benchmarks.rag_eval
+    python -m benchmarks.rag_eval --engines bm25 --top-k 10
+"""
+import argparse
+import json
+import os
+import time
+import unicodedata
+from typing import Dict, List, Tuple
+
+from benchmarks.harness import REPO_ROOT, percentile
+
+from agents.rag_engine import RAGEngine
+
+
+def _content_words(engine: RAGEngine, text: str) -> List[str]:
+    text = unicodedata.normalize('NFD', text.lower())
+    text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+    text = engine.PUNCTUATION_RE.sub(' ', text)
+    return [w for w in text.split() if len(w) > 2 and w not in engine.STOPWORDS]
+
+
+def build_queries(engine: RAGEngine) -> List[Tuple[str, str, int]]:
+    """(variante, query, id esperado) para cada pregunta de la KB"""
+    queries = []
+    for qa in engine.qa_pairs:
+        words = _content_words(engine, qa['pregunta'])
+        queries.append(("original", qa['pregunta'], qa['id']))
+        if words:
+            queries.append(("content", ' '.join(words), qa['id']))
+        if len(words) >= 4:
+            queries.append(("partial", ' '.join(words[:len(words) // 2]), qa['id']))
+    return queries
+
+
+def evaluate(engine: RAGEngine, queries: List[Tuple[str, str, int]], top_k: int) -> Dict:
+    by_variant: Dict[str, Dict[str, float]] = {}
+    latencies = []
+    for variant, query, expected in queries:
+        t0 = time.perf_counter()
+        results = engine.search(query, top_k=top_k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+        ids = [qa['id'] for qa, _ in results]
+        stats = by_variant.setdefault(variant, {"n": 0, "recall": 0.0, "mrr": 0.0})
+        stats["n"] += 1
+        if expected in ids:
+            stats["recall"] += 1
+            stats["mrr"] += 1 / (ids.index(expected) + 1)
+
+    total = {"n": 0, "recall": 0.0, "mrr": 0.0}
+    for stats in by_variant.values():
+        for key in total:
+            total[key] += stats[key]
+
+    def summary(stats):
+        n = stats["n"] or 1
+        return {"n": int(stats["n"]), f"recall@{top_k}": round(stats["recall"] / n, 4),
+                "mrr": round(stats["mrr"] / n, 4)}
+
+    return {
+        "overall": summary(total),
+        "by_variant": {variant: summary(stats) for variant, stats in by_variant.items()},
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p99": round(percentile(latencies, 99), 3),
+        },
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="recall@k / MRR / latencia de los motores de scoring")
+    parser.add_argument("--kb", default=os.path.join(REPO_ROOT, 'knowledge_base.json'))
+    parser.add_argument("--engines", nargs="+", default=list(RAGEngine.SCORING_ENGINES),
+                        choices=RAGEngine.SCORING_ENGINES)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    result = {}
+    queries = None
+    for scoring in args.engines:
+        t0 = time.perf_counter()
+        engine = RAGEngine(args.kb, scoring=scoring, index_dir="")
+        build_ms = (time.perf_counter() - t0) * 1000
+        if queries is None:
+            queries = build_queries(engine)
+        result[scoring] = {"build_ms": round(build_ms, 1), **evaluate(engine, queries, args.top_k)}
+
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,262 @@
+"""
+Suite reproducible del motor RAG: KBs sintéticas, rendimiento y calidad, con salida JSON.
+
+1. Genera KBs con el esquema de knowledge_base.json: 215 (la KB real), 5k y 50k
+   Q&A. Las sintéticas contienen la KB real más distractores que mezclan
+   mitades de preguntas y frases de respuestas reales, con nombres de producto
+   inventados para que el vocabulario crezca con el corpus. Misma semilla =
+   mismas KBs.
+2. Mide construcción del índice, carga del artefacto, memoria (tracemalloc:
+   retenida por el motor y pico durante la construcción) y latencia p50/p99
+   de `search`.
+3. Mide recall@k y MRR con paráfrasis de las preguntas reales (el documento
+   esperado es el de la pregunta original):
+     - synonyms:  sustitución de palabras por sinónimos
+     - reworded:  sinónimos, muletilla inicial, sin signos y una palabra menos
+     - keywords:  subconjunto desordenado de las palabras de contenido
+
+Con `--baseline` compara con un JSON anterior de la suite y sale con código 1
+si la latencia o la construcción empeoran más de `--tolerance` (relativo) o
+recall/MRR bajan más de `--quality-tolerance` (absoluto).
+
+Uso:
+    python -m benchmarks.rag_suite --output rag_suite.json
+    python -m benchmarks.rag_suite --sizes 215 5000 --baseline rag_suite.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from benchmarks.harness import REPO_ROOT, percentile
+
+from agents.rag_engine import RAGEngine
+
+
+# Sustituciones para las paráfrasis (palabra en minúsculas → alternativa)
+PARAPHRASES = {
+    'qué': 'cuál', 'cuál': 'qué', 'cuáles': 'qué', 'cómo': 'de qué forma', 'cuánto': 'qué cantidad',
+    'cuándo': 'en qué momento', 'sirve': 'se usa', 'tomar': 'consumir', 'toma': 'consume',
+    'producto': 'suplemento', 'productos': 'suplementos', 'dosis': 'cantidad', 'embarazo': 'gestación',
+    'embarazadas': 'gestantes', 'precio': 'coste', 'beneficios': 'ventajas', 'diferencia': 'distingue',
+    'recomendar': 'aconsejar', 'recomienda': 'aconseja', 'paciente': 'persona', 'pacientes': 'personas',
+    'médico': 'doctor', 'médicos': 'doctores', 'tiene': 'contiene', 'puede': 'podría', 'mejor': 'más adecuado',
+    'niños': 'pequeños', 'calidad': 'pureza', 'ayuda': 'contribuye', 'debe': 'tiene que',
+    'cardiovascular': 'del corazón', 'cerebro': 'cerebral', 'diferencias': 'distinciones',
+    'indicado': 'recomendado', 'efectos': 'consecuencias', 'seguro': 'fiable', 'hacer': 'realizar',
+}
+PREFIXES = ['oye, ', 'me podrías decir ', 'una duda: ', 'necesito saber ', 'explícame ']
+WORD_RE = re.compile(r'\w+')
+
+# Sílabas para inventar nombres de producto de los distractores
+SYLLABLES = ['li', 'po', 'max', 'ne', 'ra', 'vi', 'ta', 'lo', 'mu', 'sen', 'cor', 'dia', 'fle', 'xo', 'zen']
+
+
+def _coined_name(rng: random.Random) -> str:
+    return ''.join(rng.choice(SYLLABLES) for _ in range(3)) + str(rng.randint(1, 99))
+
+
+def synthetic_kb(base: dict, size: int, seed: int) -> dict:
+    """KB de `size` Q&A: las reales primero (mismos ids) y después distractores deterministas"""
+    rng = random.Random(seed)
+    real = base['qa_pairs']
+    pairs = [dict(qa) for qa in real[:size]]
+    names = [_coined_name(rng) for _ in range(max(1, (size - len(real)) // 10))]
+    sentences = [s.strip() for qa in real for s in qa['respuesta'].split('. ') if s.strip()]
+
+    while len(pairs) < size:
+        a, b = rng.sample(real, 2)
+        words_a, words_b = a['pregunta'].split(), b['pregunta'].split()
+        name = rng.choice(names)
+        pregunta = ' '.join(words_a[:len(words_a) // 2] + [name] + words_b[len(words_b) // 2:])
+        respuesta = f"{name}: " + '. '.join(rng.sample(sentences, 3))
+        pairs.append({
+            'id': len(pairs) + 1,
+            'categoria': rng.choice((a, b))['categoria'],
+            'pregunta': pregunta,
+            'respuesta': respuesta,
+        })
+
+    metadata = dict(base.get('metadata', {}), total_preguntas=len(pairs))
+    return {'metadata': metadata, 'qa_pairs': pairs}
+
+
+def _content_words(text: str) -> List[str]:
+    return [w for w in WORD_RE.findall(text.lower()) if len(w) > 2 and w not in RAGEngine.STOPWORDS]
+
+
+def _substitute(words: List[str]) -> List[str]:
+    return [PARAPHRASES.get(w, w) for w in words]
+
+
+def paraphrase_queries(base: dict, seed: int) -> List[Tuple[str, str, int]]:
+    """(variante, query, id esperado) para cada pregunta de la KB real"""
+    rng = random.Random(seed)
+    queries = []
+    for qa in base['qa_pairs']:
+        words = WORD_RE.findall(qa['pregunta'].lower())
+        content = _content_words(qa['pregunta'])
+
+        queries.append(("synonyms", ' '.join(_substitute(words)), qa['id']))
+
+        reworded = _substitute(words)
+        if len(reworded) > 4:
+            del reworded[rng.randrange(len(reworded))]
+        queries.append(("reworded", rng.choice(PREFIXES) + ' '.join(reworded), qa['id']))
+
+        if len(content) >= 3:
+            subset = rng.sample(content, max(2, round(len(content) * 0.6)))
+            queries.append(("keywords", ' '.join(subset), qa['id']))
+    return queries
+
+
+def measure_build(kb_path: str, index_dir: str) -> Dict:
+    """Construcción sin artefacto, memoria (con tracemalloc, escribiendo el artefacto) y carga"""
+    t0 = time.perf_counter()
+    RAGEngine(kb_path, index_dir="")
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    engine = RAGEngine(kb_path, index_dir=index_dir)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del engine
+
+    t0 = time.perf_counter()
+    loaded = RAGEngine(kb_path, index_dir=index_dir)
+    load_ms = (time.perf_counter() - t0) * 1000
+    assert loaded.index_source == "artifact"
+
+    return {
+        "build_ms": round(build_ms, 1),
+        "artifact_load_ms": round(load_ms, 1),
+        "memory_mb": {
+            "retained": round((retained - before) / 2 ** 20, 2),
+            "build_peak": round((peak - before) / 2 ** 20, 2),
+        },
+    }
+
+
+def evaluate(engine: RAGEngine, queries: List[Tuple[str, str, int]], ks: List[int]) -> Dict:
+    max_k = max(ks)
+    latencies = []
+    by_variant: Dict[str, Dict[str, float]] = {}
+    for variant, query, expected in queries:
+        t0 = time.perf_counter()
+        results = engine.search(query, top_k=max_k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+        ids = [qa['id'] for qa, _ in results]
+        for name in (variant, "overall"):
+            stats = by_variant.setdefault(name, {"n": 0, "mrr": 0.0, **{f"recall@{k}": 0.0 for k in ks}})
+            stats["n"] += 1
+            if expected in ids:
+                rank = ids.index(expected) + 1
+                stats["mrr"] += 1 / rank
+                for k in ks:
+                    stats[f"recall@{k}"] += rank <= k
+
+    quality = {
+        name: {key: (int(v) if key == "n" else round(v / stats["n"], 4)) for key, v in stats.items()}
+        for name, stats in by_variant.items()
+    }
+    return {
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+        },
+        "quality": quality,
+    }
+
+
+def regressions(current: Dict, baseline: Dict, tolerance: float, quality_tolerance: float) -> List[str]:
+    """Empeoramientos frente a una ejecución anterior (solo tamaños y motores presentes en ambas)"""
+    found = []
+    for size, result in current["results"].items():
+        old = baseline.get("results", {}).get(size)
+        if old is None:
+            continue
+        if result["build_ms"] > old["build_ms"] * (1 + tolerance):
+            found.append(f"{size}: build_ms {old['build_ms']} -> {result['build_ms']}")
+        for engine, stats in result["engines"].items():
+            old_stats = old["engines"].get(engine)
+            if old_stats is None:
+                continue
+            for pct in ("p50", "p99"):
+                before, after = old_stats["latency_ms"][pct], stats["latency_ms"][pct]
+                if after > before * (1 + tolerance):
+                    found.append(f"{size}/{engine}: latency {pct} {before} -> {after} ms")
+            for metric, after in stats["quality"]["overall"].items():
+                before = old_stats["quality"]["overall"].get(metric)
+                if metric != "n" and before is not None and after < before - quality_tolerance:
+                    found.append(f"{size}/{engine}: {metric} {before} -> {after}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendimiento y calidad del RAG sobre KBs sintéticas")
+    parser.add_argument("--kb", default=os.path.join(REPO_ROOT, 'knowledge_base.json'))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[215, 5000, 50000])
+    parser.add_argument("--engines", nargs="+", default=list(RAGEngine.SCORING_ENGINES),
+                        choices=RAGEngine.SCORING_ENGINES)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10], help="Cortes de recall@k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Fichero JSON de resultados (por defecto, solo stdout)")
+    parser.add_argument("--baseline", help="JSON de una ejecución anterior para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Empeoramiento relativo admitido en tiempos")
+    parser.add_argument("--quality-tolerance", type=float, default=0.01, help="Caída absoluta admitida en recall/MRR")
+    args = parser.parse_args()
+
+    with open(args.kb, encoding='utf-8') as f:
+        base = json.load(f)
+    queries = paraphrase_queries(base, args.seed)
+
+    report = {
+        "config": {
+            "seed": args.seed, "sizes": args.sizes, "engines": args.engines, "k": args.k,
+            "queries": len(queries), "python": sys.version.split()[0],
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            kb_path = os.path.join(tmp, f"kb_{size}.json")
+            with open(kb_path, 'w', encoding='utf-8') as f:
+                json.dump(synthetic_kb(base, size, args.seed), f, ensure_ascii=False)
+            index_dir = os.path.join(tmp, f"index_{size}")
+
+            result = measure_build(kb_path, index_dir)
+            result["engines"] = {}
+            for scoring in args.engines:
+                engine = RAGEngine(kb_path, scoring=scoring, index_dir=index_dir)
+                result["documents"] = len(engine.qa_pairs)
+                result["vocab"] = len(engine.vocab)
+                result["engines"][scoring] = evaluate(engine, queries, args.k)
+            report["results"][str(size)] = result
+            print(f"[SUITE] {size} documentos listos", file=sys.stderr)
+
+    failed = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            failed = regressions(report, json.load(f), args.tolerance, args.quality_tolerance)
+        report["regressions"] = failed
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    print(output)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
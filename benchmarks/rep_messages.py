@@ -0,0 +1,35 @@
+"""
+Corpus de mensajes típicos de representantes para benchmarks:
+preguntas de la KB + saludos, objeciones, follow-ups y wake word.
+"""
+import json
+import os
+from typing import List
+
+from benchmarks.harness import REPO_ROOT
+
+
+REP_MESSAGES = [
+    "Hola Omia", "hola", "buenos días", "gracias", "ok", "hey omia, ¿qué tal?",
+    "¿es caro?", "El médico dice que es muy caro", "el doctor dice que no funciona",
+    "¿tiene metales pesados?", "¿hay interacción con anticoagulantes?",
+    "ya uso otra marca, ¿por qué cambiar?", "no me convence el precio",
+    "¿Qué es Natural DHA?", "¿Qué es Natural DHA y para qué sirve?",
+    "¿Cómo presento Puro Omega a un cardiólogo?", "argumentos para un ginecólogo",
+    "¿qué le digo a un psiquiatra?", "perfil de paciente para Pro-Resolving Mediators",
+    "cuéntame más", "dime más sobre eso", "¿y sobre la dosis?", "explícame mejor",
+    "no entendí", "repite por favor", "¿por qué?", "otra pregunta",
+    "dosis para triglicéridos altos", "omega 3 para embarazadas",
+    "¿cuál es el producto más concentrado?", "¿qué diferencia hay con la competencia?",
+    "Hola Omia, un médico me dice que el omega 3 no sirve para nada",
+    "¿Qué certificaciones tiene? IFOS", "omega-3 index, ¿cómo se hace el test?",
+    "¿puedo tomarlo con quimioterapia?", "ventajas frente a etil éster",
+    "qué tal el tiempo", "me voy a comer", "jajaja", "vale perfecto",
+]
+
+
+def load_messages() -> List[str]:
+    """Mensajes de rep + todas las preguntas de la base de conocimiento"""
+    with open(os.path.join(REPO_ROOT, 'knowledge_base.json'), 'r', encoding='utf-8') as f:
+        kb = json.load(f)
+    return REP_MESSAGES + [qa['pregunta'] for qa in kb['qa_pairs']]
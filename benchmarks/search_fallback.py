@@ -0,0 +1,92 @@
+"""
+Coste de BaseAgent.search_knowledge_with_fallback: dos búsquedas (filtrada + global
+fusionadas por texto de la pregunta) vs una sola pasada con search_with_global.
+
+Recorre las queries de rag_eval con cada agente, mide la latencia de ambas
+versiones (todas y solo las que activan el fallback) y cuenta las respuestas
+que difieren.
+
+Uso:
+    python -m benchmarks.search_fallback
+    python -m benchmarks.search_fallback --scale 50
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import List, Tuple
+
+from benchmarks.harness import REPO_ROOT, percentile, scaled_kb
+
+
+def legacy_fallback(rag, query: str, categories: List[str], top_k: int = 5,
+                    score_threshold: float = 0.25) -> Tuple[List[Tuple[dict, float]], bool]:
+    """Implementación anterior: segunda búsqueda sin filtro y fusión por qa['pregunta']"""
+    filtered = rag.search(query, top_k=top_k, categories=categories)
+    if max((score for _, score in filtered), default=0.0) >= score_threshold:
+        return filtered, False
+    unfiltered = rag.search(query, top_k=top_k, categories=None)
+    combined = {qa['pregunta']: (qa, score) for qa, score in unfiltered}
+    for qa, score in filtered:
+        key = qa['pregunta']
+        if key in combined:
+            combined[key] = (qa, max(score * 1.1, combined[key][1]))
+        else:
+            combined[key] = (qa, score)
+    return sorted(combined.values(), key=lambda x: x[1], reverse=True)[:top_k], True
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fallback de búsqueda: dos pasadas vs una")
+    parser.add_argument("--scale", type=int, default=1, help="Copias de la KB")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["KNOWLEDGE_BASE_PATH"] = scaled_kb(os.path.join(REPO_ROOT, 'knowledge_base.json'), args.scale, tmp)
+        os.environ["RAG_INDEX_DIR"] = ""
+        from agents.orchestrator import Orchestrator
+        from agents.rag_engine import get_rag_engine
+        from benchmarks.rag_eval import build_queries
+
+        rag = get_rag_engine()
+        agents = list(Orchestrator().agents.values())
+        queries = [query for _, query, _ in build_queries(rag)][:600]
+
+        legacy_ms, single_ms, legacy_fb_ms, single_fb_ms = [], [], [], []
+        fallbacks = 0
+        mismatches = 0
+        for agent in agents:
+            for query in queries:
+                (expected, fell_back), t_legacy = timed(legacy_fallback, rag, query, agent.categories)
+                got, t_single = timed(agent.search_knowledge_with_fallback, query)
+                legacy_ms.append(t_legacy)
+                single_ms.append(t_single)
+                if fell_back:
+                    fallbacks += 1
+                    legacy_fb_ms.append(t_legacy)
+                    single_fb_ms.append(t_single)
+                if [(qa['id'], round(s, 9)) for qa, s in expected] != [(qa['id'], round(s, 9)) for qa, s in got]:
+                    mismatches += 1
+
+    def summary(values):
+        return {"p50_ms": round(percentile(values, 50), 3), "p99_ms": round(percentile(values, 99), 3)}
+
+    print(json.dumps({
+        "documents": len(rag.qa_pairs),
+        "calls": len(legacy_ms),
+        "fallbacks": fallbacks,
+        "two_pass": {"all": summary(legacy_ms), "fallback": summary(legacy_fb_ms)},
+        "single_pass": {"all": summary(single_ms), "fallback": summary(single_fb_ms)},
+        "mismatches": mismatches,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
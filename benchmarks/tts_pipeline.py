@@ -0,0 +1,80 @@
+"""
+Tiempo hasta el primer audio de /api/tts: resumen completo + TTS vs pipeline por frases.
+
+Lanza el backend dos veces (TTS_PIPELINE=0 y 1) contra servidores LLM y TTS
+falsos, sin cachés de resumen ni de audio, y mide desde el cliente el tiempo
+hasta el primer byte de audio y hasta el final del MP3.
+
+Uso:
+    python -m benchmarks.tts_pipeline --requests 5 --tokens 120
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.harness import fake_llm_server, fake_tts_server, omia_app, percentile
+
+
+ANSWER = "Natural DHA aporta 500 mg de DHA por perla en forma rTG, indicado en embarazo y lactancia."
+
+
+async def tts_request(client: httpx.AsyncClient, host: str) -> dict:
+    t0 = time.perf_counter()
+    first_audio = None
+    size = 0
+    async with client.stream("POST", f"http://{host}/api/tts", json={"text": ANSWER}) as resp:
+        resp.raise_for_status()
+        async for chunk in resp.aiter_bytes():
+            if first_audio is None:
+                first_audio = time.perf_counter() - t0
+            size += len(chunk)
+    return {"first_audio": first_audio or 0.0, "total": time.perf_counter() - t0, "bytes": size}
+
+
+async def run(host: str, n_requests: int) -> dict:
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        results = [await tts_request(client, host) for _ in range(n_requests)]
+    first = [r["first_audio"] for r in results]
+    total = [r["total"] for r in results]
+    return {
+        "first_audio_p50_s": round(percentile(first, 50), 3),
+        "first_audio_max_s": round(max(first), 3),
+        "total_p50_s": round(percentile(total, 50), 3),
+        "audio_bytes": results[0]["bytes"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Primer audio de /api/tts con y sin pipeline por frases")
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0, help="Velocidad del LLM falso")
+    parser.add_argument("--latency", type=float, default=0.3, help="Latencia del LLM falso (s)")
+    parser.add_argument("--tokens", type=int, default=120, help="Tokens del resumen")
+    parser.add_argument("--tts-latency", type=float, default=0.3, help="Latencia del TTS falso (s)")
+    args = parser.parse_args()
+
+    result = {}
+    with fake_llm_server(args.tokens_per_sec, args.latency, args.tokens) as llm_url, \
+            fake_tts_server(args.tts_latency) as tts_url:
+        for pipeline in ("0", "1"):
+            env = {
+                "ELEVENLABS_API_KEY": "bench",
+                "ELEVENLABS_BASE_URL": tts_url,
+                "TTS_PIPELINE": pipeline,
+                "TTS_SUMMARY_CACHE_MAX_ENTRIES": "0",
+                "TTS_CACHE_MAX_MB": "0",
+            }
+            with omia_app(llm_url, env=env) as host:
+                result["pipeline" if pipeline == "1" else "sequential"] = asyncio.run(run(host, args.requests))
+
+    result["first_audio_speedup"] = round(
+        result["sequential"]["first_audio_p50_s"] / max(result["pipeline"]["first_audio_p50_s"], 1e-6), 2
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Reutilización de conexiones del proxy /api/tts hacia ElevenLabs.
+
+Lanza el backend contra un servidor TTS falso, hace N peticiones /api/tts
+(en tandas de --concurrency) y compara las conexiones TCP que ve el
+servidor falso con las peticiones recibidas. Con el cliente compartido
+del backend, las conexiones deben quedarse en ~concurrency, no en N.
+
+Es también una comprobación automática: sale con código 1 si no llegan las N
+peticiones al upstream, si abre más conexiones que la concurrencia, si hay
+errores de TTS o si algún cliente recibe el audio incompleto.
+
+Uso:
+    python -m benchmarks.tts_pool --requests 40 --concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import List, Tuple
+
+import httpx
+
+from benchmarks.harness import fake_llm_server, fake_tts_server, omia_app, percentile
+
+
+TEXT = "Natural DHA aporta quinientos miligramos de DHA por perla en forma de triglicérido."
+BYTES_PER_CHAR = 200
+EXPECTED_BYTES = len(TEXT) * BYTES_PER_CHAR
+
+
+async def tts_request(client: httpx.AsyncClient, host: str) -> Tuple[float, int]:
+    """Pide audio (sin resumen LLM) y devuelve el tiempo hasta el primer byte en ms y los bytes recibidos"""
+    t0 = time.perf_counter()
+    ttfb = None
+    received = 0
+    async with client.stream("POST", f"http://{host}/api/tts",
+                             json={"text": TEXT, "skip_summary": True}) as resp:
+        resp.raise_for_status()
+        async for chunk in resp.aiter_bytes():
+            if ttfb is None:
+                ttfb = (time.perf_counter() - t0) * 1000
+            received += len(chunk)
+    return ttfb or 0.0, received
+
+
+async def benchmark(host: str, tts_url: str, n_requests: int, concurrency: int) -> dict:
+    ttfbs = []
+    sizes = []
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        for start in range(0, n_requests, concurrency):
+            batch = min(concurrency, n_requests - start)
+            for ttfb, received in await asyncio.gather(*(tts_request(client, host) for _ in range(batch))):
+                ttfbs.append(ttfb)
+                sizes.append(received)
+
+        upstream = (await client.get(f"{tts_url}/stats")).json()
+        backend = (await client.get(f"http://{host}/api/tts/stats")).json()
+
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "upstream_requests": upstream["requests"],
+        "upstream_connections": upstream["connections"],
+        "incomplete_audio": sum(size != EXPECTED_BYTES for size in sizes),
+        "client_ttfb_p50_ms": round(percentile(ttfbs, 50), 1),
+        "client_ttfb_p99_ms": round(percentile(ttfbs, 99), 1),
+        "backend_time_to_first_audio_byte": backend["time_to_first_audio_byte"],
+    }
+
+
+def reuse_failures(result: dict) -> List[str]:
+    """Condiciones que invalidan la comprobación de reutilización (vacía = OK)"""
+    failures = []
+    if result["upstream_requests"] != result["requests"]:
+        failures.append(f"solo {result['upstream_requests']} de {result['requests']} peticiones llegaron "
+                        f"al TTS falso (¿caché de audio activa?)")
+    if result["upstream_connections"] > result["concurrency"]:
+        failures.append(f"{result['upstream_connections']} conexiones para concurrencia {result['concurrency']}: "
+                        f"el pool no reutiliza conexiones")
+    if result["backend_time_to_first_audio_byte"]["errors"]:
+        failures.append(f"{result['backend_time_to_first_audio_byte']['errors']} errores de TTS en el backend")
+    if result["incomplete_audio"]:
+        failures.append(f"{result['incomplete_audio']} respuestas con audio incompleto")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reutilización de conexiones del proxy TTS")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.1, help="Latencia del TTS falso (s)")
+    args = parser.parse_args()
+
+    with fake_llm_server() as llm_url, fake_tts_server(args.latency, BYTES_PER_CHAR) as tts_url:
+        # Sin caché de audio: si no, el mismo texto se sirve desde disco y no llega al upstream
+        env = {"ELEVENLABS_API_KEY": "bench", "ELEVENLABS_BASE_URL": tts_url, "TTS_CACHE_MAX_MB": "0"}
+        with omia_app(llm_url, env=env) as host:
+            result = asyncio.run(benchmark(host, tts_url, args.requests, args.concurrency))
+    print(json.dumps(result, indent=2))
+
+    failures = reuse_failures(result)
+    for failure in failures:
+        print(f"[CHECK] FALLO: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+    print(f"[CHECK] OK: {result['upstream_requests']} peticiones sobre {result['upstream_connections']} conexiones",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Concurrencia de /api/voice: N uploads de audio simultáneos.
+
+El Whisper falso devuelve el sha256 del audio recibido, así que cada
+respuesta se puede comprobar contra su propio upload (antes dos peticiones
+del mismo worker compartían fichero temporal y podían cruzarse). Si la
+transcripción bloqueara el event loop, el tiempo total crecería ~N veces.
+
+Uso:
+    python -m benchmarks.voice_concurrency --uploads 10 --size-kb 200
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import httpx
+
+from benchmarks.harness import fake_llm_server, omia_app
+
+
+async def upload(client: httpx.AsyncClient, host: str, payload: bytes) -> dict:
+    t0 = time.perf_counter()
+    resp = await client.post(
+        f"http://{host}/api/voice",
+        files={"audio": ("recording.webm", payload, "audio/webm")},
+    )
+    data = resp.json()
+    return {
+        "elapsed": time.perf_counter() - t0,
+        "ok": data.get("success", False),
+        "matches": data.get("text") == hashlib.sha256(payload).hexdigest(),
+    }
+
+
+async def benchmark(host: str, llm_stats_url: str, n_uploads: int, size: int) -> dict:
+    payloads = [os.urandom(size) for _ in range(n_uploads)]
+    async with httpx.AsyncClient(timeout=120.0) as client:
+        single = await upload(client, host, payloads[0])
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(upload(client, host, p) for p in payloads))
+        wall = time.perf_counter() - t0
+        upstream = (await client.get(llm_stats_url)).json()
+
+    return {
+        "uploads": n_uploads,
+        "size_kb": size // 1024,
+        "single_s": round(single["elapsed"], 3),
+        "concurrent_wall_s": round(wall, 3),
+        # ~1.0 = transcripciones en paralelo; ~N = serializadas
+        "serialization_ratio": round(wall / single["elapsed"], 2),
+        "max_concurrent_upstream": upstream["max_concurrent_transcriptions"],
+        "failed": sum(not r["ok"] for r in results),
+        "mismatched": sum(r["ok"] and not r["matches"] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Uploads simultáneos a /api/voice con Whisper falso")
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--size-kb", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5, help="Latencia de la transcripción falsa (s)")
+    args = parser.parse_args()
+
+    with fake_llm_server(latency=args.latency) as llm_url:
+        base = llm_url[:-len("/v1")]
+        with omia_app(llm_url, env={"GROQ_BASE_URL": base}) as host:
+            result = asyncio.run(benchmark(host, f"{base}/stats", args.uploads, args.size_kb * 1024))
+    print(json.dumps(result, indent=2))
+
+    if result["failed"] or result["mismatched"]:
+        raise SystemExit("Transcripciones fallidas o cruzadas entre uploads")
+
+
+if __name__ == "__main__":
+    main()
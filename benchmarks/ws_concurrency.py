@@ -0,0 +1,109 @@
+"""
+Benchmark de concurrencia de /ws/chat: N sockets simultáneos en streaming.
+
+Si el stream del LLM bloqueara el event loop, las respuestas se servirían
+una detrás de otra y el tiempo total crecería ~N veces. Con streaming async
+el tiempo total de N sockets debe ser similar al de uno solo.
+
+Uso:
+    python -m benchmarks.ws_concurrency --sockets 10
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import websockets
+
+from benchmarks.harness import fake_llm_server, omia_app, percentile
+
+
+QUERY = "¿Qué es Natural DHA y para qué sirve?"
+
+
+async def run_session(host: str, message: str = QUERY) -> dict:
+    """Abre un socket, envía una pregunta y mide primer token y fin de respuesta"""
+    start = time.perf_counter()
+    first_token = None
+    frames = 0
+    async with websockets.connect(f"ws://{host}/ws/chat") as ws:
+        await ws.send(json.dumps({"message": message, "response_mode": "full"}))
+        while True:
+            data = json.loads(await ws.recv())
+            if data["type"] == "token":
+                frames += 1
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+            elif data["type"] in ("end", "error"):
+                return {
+                    "ttft": first_token or 0.0,
+                    "total": time.perf_counter() - start,
+                    "frames": frames,
+                    "error": data["type"] == "error",
+                }
+
+
+async def probe_health(host: str, stop: asyncio.Event) -> list:
+    """Mide la latencia de /api/health mientras hay streams activos"""
+    latencies = []
+    async with httpx.AsyncClient() as client:
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await client.get(f"http://{host}/api/health")
+            latencies.append(time.perf_counter() - t0)
+            await asyncio.sleep(0.05)
+    return latencies
+
+
+async def benchmark(host: str, n_sockets: int) -> dict:
+    single = await run_session(host)
+
+    stop = asyncio.Event()
+    health_task = asyncio.create_task(probe_health(host, stop))
+    t0 = time.perf_counter()
+    sessions = await asyncio.gather(*(run_session(host) for _ in range(n_sockets)))
+    wall = time.perf_counter() - t0
+    stop.set()
+    health = await health_task
+
+    ttfts = [s["ttft"] for s in sessions]
+    return {
+        "sockets": n_sockets,
+        "single_stream_s": round(single["total"], 3),
+        "concurrent_wall_s": round(wall, 3),
+        # ~1.0 = sin bloqueo head-of-line; ~N = streams serializados
+        "blocking_ratio": round(wall / single["total"], 2),
+        "ttft_p50_s": round(percentile(ttfts, 50), 3),
+        "ttft_max_s": round(max(ttfts), 3),
+        "health_p99_s": round(percentile(health, 99), 3),
+        "token_frames_per_answer": round(sum(s["frames"] for s in sessions) / n_sockets, 1),
+        "errors": sum(s["error"] for s in sessions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrencia de /ws/chat con LLM falso")
+    parser.add_argument("--sockets", type=int, default=10)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--tokens", type=int, default=100)
+    parser.add_argument("--flush-chars", type=int, default=None, help="WS_TOKEN_FLUSH_CHARS del backend")
+    parser.add_argument("--flush-ms", type=int, default=None, help="WS_TOKEN_FLUSH_MS del backend")
+    args = parser.parse_args()
+
+    # Sin caché de respuestas: todos los sockets envían la misma pregunta y serían hits
+    env = {"ANSWER_CACHE_MAX_ENTRIES": "0"}
+    if args.flush_chars is not None:
+        env["WS_TOKEN_FLUSH_CHARS"] = str(args.flush_chars)
+    if args.flush_ms is not None:
+        env["WS_TOKEN_FLUSH_MS"] = str(args.flush_ms)
+
+    with fake_llm_server(args.tokens_per_sec, args.latency, args.tokens) as llm_url:
+        with omia_app(llm_url, env=env) as host:
+            result = asyncio.run(benchmark(host, args.sockets))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Prueba de carga de /ws/chat con sesiones de representante realistas.
+
+Abre `--sockets` conexiones simultáneas (con rampa opcional); cada una es una
+sesión de `--messages` mensajes con pausas entre ellos, de tipos elegidos
+según `--mix`:
+  - greeting:  saludos y mensajes vagos (camino sin RAG ni LLM)
+  - product:   preguntas de producto de la KB
+  - objection: objeciones de médicos
+  - argument:  argumentos de venta por especialidad
+  - followup:  "cuéntame más" y similares; si es el primer mensaje del socket
+               se envía con `prior_context` (conversación restaurada)
+
+Por defecto arranca el servidor LLM falso y el backend; con `--host` ataca un
+backend ya levantado (p. ej. el contenedor). Informa de throughput, tiempo
+hasta el primer token, hueco entre frames de tokens (un máximo alto delata
+bloqueos del event loop), errores por tipo y latencia de /api/health
+durante la carga.
+
+Uso:
+    python -m benchmarks.ws_load --sockets 50 --messages 4
+    python -m benchmarks.ws_load --sockets 200 --ramp 10 --mix product=0.5,objection=0.3,followup=0.2
+    python -m benchmarks.ws_load --host 127.0.0.1:7860 --sockets 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import websockets
+
+from benchmarks.harness import REPO_ROOT, fake_llm_server, omia_app, percentile
+
+
+GREETINGS = [
+    "buenos días, ¿qué puedes hacer?", "hey omia, ¿qué tal?", "vale perfecto", "qué tal el tiempo",
+    "buenas tardes, necesito ayuda", "jajaja",
+]
+OBJECTIONS = [
+    "El médico dice que es muy caro", "el doctor dice que no funciona", "¿tiene metales pesados?",
+    "¿hay interacción con anticoagulantes?", "ya uso otra marca, ¿por qué cambiar?",
+    "no me convence el precio", "Hola Omia, un médico me dice que el omega 3 no sirve para nada",
+]
+ARGUMENTS = [
+    "¿Cómo presento Puro Omega a un cardiólogo?", "argumentos para un ginecólogo",
+    "¿qué le digo a un psiquiatra?", "perfil de paciente para Pro-Resolving Mediators",
+    "¿qué diferencia hay con la competencia?", "ventajas frente a etil éster",
+]
+FOLLOWUPS = ["cuéntame más", "dime más sobre eso", "¿y sobre la dosis?", "explícame mejor"]
+
+DEFAULT_MIX = "greeting=0.1,product=0.45,objection=0.2,argument=0.15,followup=0.1"
+
+
+def load_pools() -> Dict[str, List]:
+    with open(os.path.join(REPO_ROOT, 'knowledge_base.json'), encoding='utf-8') as f:
+        qa_pairs = json.load(f)['qa_pairs']
+    products = [qa['pregunta'] for qa in qa_pairs if qa['categoria'].startswith(('productos', 'indicaciones'))]
+    return {
+        "greeting": GREETINGS,
+        "product": products,
+        "objection": OBJECTIONS,
+        "argument": ARGUMENTS,
+        "followup": FOLLOWUPS,
+        # Conversaciones previas para prior_context
+        "prior": [(qa['pregunta'], qa['respuesta']) for qa in qa_pairs],
+    }
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        kind, _, weight = part.partition("=")
+        weights[kind.strip()] = float(weight)
+    unknown = set(weights) - {"greeting", "product", "objection", "argument", "followup"}
+    if unknown:
+        raise ValueError(f"Tipos de mensaje desconocidos en --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+class LoadStats:
+    """Muestras de todos los sockets (una sola tarea de asyncio escribe cada vez)"""
+
+    def __init__(self):
+        self.ttft: List[float] = []
+        self.total: List[float] = []
+        self.gaps: List[float] = []
+        self.chars = 0
+        self.errors: Dict[str, int] = {}
+        self.by_kind: Dict[str, Dict[str, list]] = {}
+        self.sessions = 0
+
+    def record(self, kind: str, ttft: Optional[float], total: float, gaps: List[float], chars: int):
+        self.ttft.append(ttft or total)
+        self.total.append(total)
+        self.gaps.extend(gaps)
+        self.chars += chars
+        entry = self.by_kind.setdefault(kind, {"ttft": [], "total": [], "errors": []})
+        entry["ttft"].append(ttft or total)
+        entry["total"].append(total)
+
+    def error(self, kind: str, reason: str):
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+        self.by_kind.setdefault(kind, {"ttft": [], "total": [], "errors": []})["errors"].append(reason)
+
+
+async def send_message(ws, payload: dict, timeout: float) -> dict:
+    """Envía un mensaje y lee frames hasta 'end'/'error': primer token, huecos entre frames y total"""
+    start = time.perf_counter()
+    first_token = None
+    last_frame = None
+    gaps = []
+    chars = 0
+    await ws.send(json.dumps(payload))
+    while True:
+        data = json.loads(await asyncio.wait_for(ws.recv(), timeout))
+        now = time.perf_counter()
+        if data["type"] == "token":
+            chars += len(data.get("content", ""))
+            if first_token is None:
+                first_token = now - start
+            else:
+                gaps.append(now - last_frame)
+            last_frame = now
+        elif data["type"] in ("end", "error"):
+            return {"ttft": first_token, "total": now - start, "gaps": gaps, "chars": chars,
+                    "error": data["type"] == "error"}
+
+
+async def run_socket(host: str, pools: Dict[str, List], weights: Dict[str, float], n_messages: int,
+                     think: float, timeout: float, rng: random.Random, stats: LoadStats):
+    kinds = list(weights)
+    try:
+        async with websockets.connect(f"ws://{host}/ws/chat", max_size=None) as ws:
+            for i in range(n_messages):
+                kind = rng.choices(kinds, weights=[weights[k] for k in kinds])[0]
+                payload = {"message": rng.choice(pools[kind]), "response_mode": rng.choice(["full", "short"])}
+                if kind == "followup" and i == 0:
+                    question, answer = rng.choice(pools["prior"])
+                    payload["prior_context"] = {"question": question, "answer": answer}
+                try:
+                    result = await send_message(ws, payload, timeout)
+                except asyncio.TimeoutError:
+                    stats.error(kind, "timeout")
+                    return
+                if result["error"]:
+                    stats.error(kind, "error_frame")
+                else:
+                    stats.record(kind, result["ttft"], result["total"], result["gaps"], result["chars"])
+                if i < n_messages - 1:
+                    await asyncio.sleep(think * rng.uniform(0.5, 1.5))
+        stats.sessions += 1
+    except (OSError, websockets.exceptions.WebSocketException):
+        stats.error("connection", "connection")
+
+
+async def probe_health(host: str, stop: asyncio.Event) -> List[float]:
+    latencies = []
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                await client.get(f"http://{host}/api/health")
+                latencies.append(time.perf_counter() - t0)
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    return latencies
+
+
+async def load_test(host: str, args) -> dict:
+    pools = load_pools()
+    weights = parse_mix(args.mix)
+    stats = LoadStats()
+    rng = random.Random(args.seed)
+
+    stop = asyncio.Event()
+    health_task = asyncio.create_task(probe_health(host, stop))
+    t0 = time.perf_counter()
+    tasks = []
+    for i in range(args.sockets):
+        if args.ramp > 0:
+            await asyncio.sleep(args.ramp / args.sockets)
+        socket_rng = random.Random(rng.random())
+        tasks.append(asyncio.create_task(
+            run_socket(host, pools, weights, args.messages, args.think, args.timeout, socket_rng, stats)
+        ))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - t0
+    stop.set()
+    health = await health_task
+
+    messages = len(stats.total)
+    failed = sum(stats.errors.values())
+
+    def dist(values: List[float], scale: float = 1.0, digits: int = 3) -> dict:
+        return {
+            "p50": round(percentile(values, 50) * scale, digits),
+            "p95": round(percentile(values, 95) * scale, digits),
+            "p99": round(percentile(values, 99) * scale, digits),
+            "max": round(max(values, default=0.0) * scale, digits),
+        }
+
+    return {
+        "sockets": args.sockets,
+        "sessions_completed": stats.sessions,
+        "messages": messages,
+        "wall_s": round(wall, 2),
+        "throughput_msgs_per_s": round(messages / wall, 2),
+        "throughput_chars_per_s": round(stats.chars / wall, 1),
+        "ttft_s": dist(stats.ttft),
+        "inter_token_gap_ms": dist(stats.gaps, 1000, 1),
+        "message_total_s": dist(stats.total),
+        "errors": stats.errors,
+        "error_rate": round(failed / max(messages + failed, 1), 4),
+        "health_s": dist(health),
+        "by_kind": {
+            kind: {
+                "messages": len(entry["total"]),
+                "errors": len(entry["errors"]),
+                "ttft_p50_s": round(percentile(entry["ttft"], 50), 3),
+                "total_p50_s": round(percentile(entry["total"], 50), 3),
+            }
+            for kind, entry in sorted(stats.by_kind.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga de /ws/chat con sesiones de representante")
+    parser.add_argument("--host", help="Backend ya levantado (host:puerto); si no, se arranca uno local")
+    parser.add_argument("--sockets", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=4, help="Mensajes por sesión")
+    parser.add_argument("--think", type=float, default=0.5, help="Pausa media entre mensajes (s)")
+    parser.add_argument("--ramp", type=float, default=0.0, help="Segundos para abrir todos los sockets")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Pesos por tipo de mensaje")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Espera máxima por respuesta (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="Velocidad del LLM falso")
+    parser.add_argument("--latency", type=float, default=0.3, help="Latencia del LLM falso (s)")
+    parser.add_argument("--tokens", type=int, default=150, help="Tokens por respuesta del LLM falso")
+    parser.add_argument("--no-answer-cache", action="store_true", help="ANSWER_CACHE_MAX_ENTRIES=0")
+    parser.add_argument("--output", help="Fichero JSON de resultados")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    if args.host:
+        result = asyncio.run(load_test(args.host, args))
+    else:
+        env = {"ANSWER_CACHE_MAX_ENTRIES": "0"} if args.no_answer_cache else {}
+        with fake_llm_server(args.tokens_per_sec, args.latency, args.tokens) as llm_url:
+            with omia_app(llm_url, env=env) as host:
+                result = asyncio.run(load_test(host, args))
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
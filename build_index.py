@@ -0,0 +1,28 @@
+"""
+Precalcula el índice RAG de la base de conocimiento y lo guarda como artefacto
+en RAG_INDEX_DIR, para que cada proceso lo cargue con mmap al arrancar en vez
+de tokenizar toda la KB.
+
+Uso:
+    python build_index.py
+    python build_index.py --kb otra_kb.json --index-dir /data/index_cache
+"""
+import argparse
+
+from agents.rag_engine import KNOWLEDGE_BASE_PATH, RAG_INDEX_DIR, RAGEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precalcula el artefacto del índice RAG")
+    parser.add_argument("--kb", default=KNOWLEDGE_BASE_PATH, help="Fichero JSON de la KB")
+    parser.add_argument("--index-dir", default=RAG_INDEX_DIR, help="Directorio de artefactos")
+    args = parser.parse_args()
+
+    if not args.index_dir:
+        parser.error("RAG_INDEX_DIR está vacío: no hay dónde guardar el artefacto")
+    engine = RAGEngine(args.kb, index_dir=args.index_dir)
+    print(f"[RAG] Índice {engine.kb_version} listo ({engine.index_source}, {engine.build_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,20 +7,30 @@ import os
 import re
 import json
 import asyncio
-from typing import Optional
+import hashlib
+import hmac
+import time
+import unicodedata
+from typing import Optional, Tuple
 from contextlib import asynccontextmanager
 
 import httpx
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, HTTPException
+import anyio
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, UploadFile, File, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from openai import OpenAI
-from groq import Groq
+from groq import AsyncGroq
 
 # Importar sistema de agentes
-from agents.orchestrator import Orchestrator
+from agents.orchestrator import Orchestrator, LLM_BASE_URL, get_llm_client
+from agents.rag_engine import KNOWLEDGE_BASE_PATH, get_reload_status, reload_rag_engine
+from services import (
+    AudioCache, Counter, Histogram, LRUCache, HistoryStore, JSONHistoryStore, LatencyTracker, SingleFlight,
+    UpstreamBusy, UpstreamLimiter, create_history_store, render_metric,
+)
 
 load_dotenv()
 
@@ -28,9 +38,11 @@ load_dotenv()
 groq_api_key = os.getenv("GROQ_API_KEY")
 
 # Cliente Groq para LLM (Kimi K2) — usando OpenAI SDK compatible
+# Síncrono: solo para llamadas que ya se ejecutan en thread pool (infografía, resumen TTS).
+# El chat en streaming usa el cliente async compartido de agents.orchestrator.get_llm_client()
 llm_client = OpenAI(
     api_key=groq_api_key,
-    base_url="https://api.groq.com/openai/v1"
+    base_url=LLM_BASE_URL
 ) if groq_api_key else None
 
 LLM_MODEL = "moonshotai/kimi-k2-instruct"
@@ -80,8 +92,12 @@ SCHEMA JSON:
 
 Extrae la información más relevante y visual. Si no hay producto específico, pon null. datos_tabla debe tener 2-4 entradas con los KPIs más impactantes."""
 
-# Cliente Groq nativo (para transcripción de voz con Whisper)
-groq_client = Groq(api_key=groq_api_key) if groq_api_key else None
+# Cliente Groq nativo async (transcripción de voz con Whisper sin bloquear el event loop)
+# GROQ_BASE_URL (leída por el SDK) permite apuntarlo a un servidor local en benchmarks
+groq_client = AsyncGroq(api_key=groq_api_key) if groq_api_key else None
+
+# Tamaño máximo de audio aceptado en /api/voice (Whisper en Groq admite hasta 25 MB)
+VOICE_MAX_UPLOAD_MB = float(os.getenv("VOICE_MAX_UPLOAD_MB", "25"))
 
 if not groq_api_key:
     print("⚠️  GROQ_API_KEY no configurada - LLM y transcripción deshabilitados")
@@ -90,23 +106,212 @@ if not groq_api_key:
 elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
 elevenlabs_voice_id = os.getenv("ELEVENLABS_VOICE_ID", "NWqMOQLlMBaUbjKYdhbW")
 
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io")
+
 if not elevenlabs_api_key:
     print("⚠️  ELEVENLABS_API_KEY no configurada - TTS deshabilitado")
 
+# Parámetros de síntesis (forman parte de la clave de la caché de audio)
+TTS_MODEL_ID = "eleven_multilingual_v2"
+TTS_OUTPUT_FORMAT = "mp3_44100_128"
+TTS_VOICE_SETTINGS = {
+    "stability": 0.35,          # Más bajo = más expresiva y natural
+    "similarity_boost": 0.80,   # Mantener la voz reconocible
+    "style": 0.45,              # Más estilo = más emocional/cálida
+    "use_speaker_boost": True,
+}
+
+# Caché de audio en disco (mismo resumen + misma voz = mismo MP3). 0 MB = desactivada
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "tts_cache")
+TTS_CACHE_MAX_MB = float(os.getenv("TTS_CACHE_MAX_MB", "200"))
+
+# Memo de resúmenes TTS (hash de la respuesta → resumen limpio). 0 entradas = desactivado
+# TTS_SUMMARY_PRECOMPUTE=1 genera el resumen en segundo plano tras cada respuesta del chat
+TTS_SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("TTS_SUMMARY_CACHE_MAX_ENTRIES", "256"))
+TTS_SUMMARY_CACHE_TTL = float(os.getenv("TTS_SUMMARY_CACHE_TTL", "86400"))
+TTS_SUMMARY_PRECOMPUTE = os.getenv("TTS_SUMMARY_PRECOMPUTE", "0") == "1"
+
+# Pipeline por frases: el resumen se pide en streaming y cada frase completa se envía
+# a ElevenLabs sin esperar al resto (una petición por frase). Opt-in: multiplica las peticiones
+# a ElevenLabs. Frases de menos de N caracteres se juntan con la siguiente
+TTS_PIPELINE = os.getenv("TTS_PIPELINE", "0") == "1"
+TTS_SENTENCE_MIN_CHARS = int(os.getenv("TTS_SENTENCE_MIN_CHARS", "40"))
+
+# Cliente HTTP compartido para ElevenLabs: conexiones keep-alive reutilizadas entre
+# peticiones (sin handshake TCP+TLS por cada audio). HTTP/2 requiere el paquete h2
+TTS_HTTP2 = os.getenv("TTS_HTTP2", "1") == "1"
+TTS_MAX_CONNECTIONS = int(os.getenv("TTS_MAX_CONNECTIONS", "20"))
+TTS_KEEPALIVE_EXPIRY = float(os.getenv("TTS_KEEPALIVE_EXPIRY", "60"))
+
+
+def _create_tts_http_client() -> httpx.AsyncClient:
+    """AsyncClient con pool acotado; HTTP/2 solo si está instalado h2"""
+    http2 = TTS_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            print("[TTS] Paquete h2 no instalado - usando HTTP/1.1 con keep-alive")
+            http2 = False
+    return httpx.AsyncClient(
+        base_url=ELEVENLABS_BASE_URL,
+        http2=http2,
+        timeout=httpx.Timeout(60.0, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=TTS_MAX_CONNECTIONS,
+            max_keepalive_connections=TTS_MAX_CONNECTIONS,
+            keepalive_expiry=TTS_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+# Agrupación de tokens en /ws/chat: se envía un frame cuando se acumulan N caracteres
+# o pasan M ms desde el primer token pendiente (lo que ocurra antes). 0 caracteres = un frame por token
+WS_TOKEN_FLUSH_CHARS = int(os.getenv("WS_TOKEN_FLUSH_CHARS", "64"))
+WS_TOKEN_FLUSH_MS = int(os.getenv("WS_TOKEN_FLUSH_MS", "60"))
+
+# Caché de respuestas del chat (solo primeras preguntas, sin historial)
+# ANSWER_CACHE_MAX_ENTRIES=0 desactiva; ANSWER_CACHE_PATH vacío = solo memoria
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+
+# Caché de infografías (hash de la respuesta → JSON ya parseado). 0 entradas = desactivada
+INFOGRAPHIC_CACHE_MAX_ENTRIES = int(os.getenv("INFOGRAPHIC_CACHE_MAX_ENTRIES", "256"))
+INFOGRAPHIC_CACHE_TTL = float(os.getenv("INFOGRAPHIC_CACHE_TTL", "86400"))
+# INFOGRAPHIC_PRECOMPUTE=1 genera la infografía en segundo plano tras cada respuesta del chat
+INFOGRAPHIC_PRECOMPUTE = os.getenv("INFOGRAPHIC_PRECOMPUTE", "0") == "1"
+
+# Recarga en caliente de la KB: cada N segundos se comprueba si knowledge_base.json
+# cambió (0 = sin vigilancia). ADMIN_TOKEN habilita POST /api/admin/reload-kb
+KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "5"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Procesos worker de uvicorn (la CLI de uvicorn también lee WEB_CONCURRENCY). Todos abren con
+# mmap el mismo artefacto del índice RAG; cachés, límites por upstream y métricas son por worker
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Límites por upstream: llamadas simultáneas y peticiones en espera. Con la cola llena
+# se responde 429 (o infographic_error) en lugar de acumular trabajo sin límite
+infographic_limiter = UpstreamLimiter(
+    "infographic",
+    max_concurrent=int(os.getenv("INFOGRAPHIC_MAX_CONCURRENT", "4")),
+    max_queue=int(os.getenv("INFOGRAPHIC_MAX_QUEUE", "8")),
+)
+tts_summary_limiter = UpstreamLimiter(
+    "tts_summary",
+    max_concurrent=int(os.getenv("TTS_SUMMARY_MAX_CONCURRENT", "8")),
+    max_queue=int(os.getenv("TTS_SUMMARY_MAX_QUEUE", "16")),
+)
+voice_limiter = UpstreamLimiter(
+    "voice",
+    max_concurrent=int(os.getenv("VOICE_MAX_CONCURRENT", "4")),
+    max_queue=int(os.getenv("VOICE_MAX_QUEUE", "16")),
+)
+# Presupuesto del precálculo especulativo de infografías (sin cola: si está lleno, no se precalcula)
+infographic_speculative_limiter = UpstreamLimiter(
+    "infographic_speculative",
+    max_concurrent=int(os.getenv("INFOGRAPHIC_PRECOMPUTE_MAX_CONCURRENT", "1")),
+    max_queue=0,
+)
+UPSTREAM_LIMITERS = (infographic_limiter, infographic_speculative_limiter, tts_summary_limiter, voice_limiter)
+
 # Orquestador de agentes
 orchestrator: Optional[Orchestrator] = None
+answer_cache: Optional[LRUCache] = None
+history_store: Optional[HistoryStore] = None
+tts_http_client: Optional[httpx.AsyncClient] = None
+audio_cache: Optional[AudioCache] = None
+summary_cache: Optional[LRUCache] = None
+# Resúmenes TTS en curso por clave: el clic en el altavoz espera al precálculo en vez de repetirlo
+summary_flight = SingleFlight()
+infographic_cache: Optional[LRUCache] = None
+# Infografías en curso por clave: un doble clic comparte la misma generación. Si todos los
+# que esperan se cancelan (p. ej. precálculo descartado), se cancela también la llamada al LLM
+infographic_flight = SingleFlight(cancel_when_abandoned=True)
+# Referencias a tareas en segundo plano (evita que el GC las cancele)
+_background_tasks: set = set()
+# Tiempo hasta el primer byte de audio de ElevenLabs (ms)
+tts_ttfb = LatencyTracker()
+# Desde que llega la petición /api/tts hasta el primer byte de audio enviado (sin aciertos de caché)
+tts_first_audio = LatencyTracker()
+# Duración de cada etapa de /ws/chat y contadores del chat (exportados en /metrics)
+chat_stage_seconds = Histogram(
+    "omia_chat_stage_seconds", "Duración de cada etapa de un mensaje de /ws/chat", "stage"
+)
+chat_messages = Counter("omia_chat_messages_total", "Mensajes de /ws/chat por camino", "path")
+chat_rag_coverage = Counter("omia_chat_rag_coverage_total", "Mensajes de /ws/chat por cobertura RAG", "level")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Inicializar el orquestador al arrancar"""
-    global orchestrator
+    global orchestrator, answer_cache, history_store, tts_http_client, audio_cache, summary_cache
+    global infographic_cache
+    history_store = create_history_store(HISTORY_BACKEND, HISTORY_DB_PATH, USER_DATA_FILE)
+    if WEB_CONCURRENCY > 1 and isinstance(history_store, JSONHistoryStore):
+        print("⚠️  Historial en JSON con varios workers: las escrituras de un proceso pueden pisar las de otro")
+    tts_http_client = _create_tts_http_client()
+    if INFOGRAPHIC_CACHE_MAX_ENTRIES > 0:
+        infographic_cache = LRUCache(max_entries=INFOGRAPHIC_CACHE_MAX_ENTRIES, ttl=INFOGRAPHIC_CACHE_TTL)
+    if TTS_SUMMARY_CACHE_MAX_ENTRIES > 0:
+        summary_cache = LRUCache(max_entries=TTS_SUMMARY_CACHE_MAX_ENTRIES, ttl=TTS_SUMMARY_CACHE_TTL)
+    if TTS_CACHE_MAX_MB > 0:
+        try:
+            audio_cache = AudioCache(TTS_CACHE_DIR, int(TTS_CACHE_MAX_MB * 1024 * 1024))
+            print(f"[TTS] Caché de audio: {len(audio_cache)} ficheros en {TTS_CACHE_DIR}")
+        except OSError as e:
+            print(f"⚠️  Caché de audio TTS deshabilitada ({e})")
     print("Inicializando sistema multi-agente...")
     orchestrator = Orchestrator()
     # Acceder al RAG a través de cualquier agente (comparten la misma instancia singleton)
     rag = orchestrator.agents['productos'].rag
+    watcher = asyncio.create_task(watch_knowledge_base()) if KB_WATCH_INTERVAL > 0 else None
+    if ANSWER_CACHE_MAX_ENTRIES > 0:
+        # La versión de la KB invalida la caché (también la persistida) cuando cambia el JSON
+        answer_cache = LRUCache(
+            max_entries=ANSWER_CACHE_MAX_ENTRIES,
+            ttl=ANSWER_CACHE_TTL,
+            path=ANSWER_CACHE_PATH or None,
+            version=rag.kb_version,
+        )
     print(f"Sistema listo. Base de conocimiento: {len(rag.qa_pairs)} documentos")
     yield
     print("Cerrando aplicación...")
+    if watcher is not None:
+        watcher.cancel()
+    await tts_http_client.aclose()
+    for limiter in UPSTREAM_LIMITERS:
+        limiter.shutdown()
+    history_store.close()
+
+async def reload_knowledge_base(force: bool = False) -> bool:
+    """Reconstruye el índice RAG en un hilo y, si la KB cambió, invalida la caché de respuestas"""
+    reloaded = await asyncio.to_thread(reload_rag_engine, force)
+    if reloaded and answer_cache is not None:
+        answer_cache.set_version(orchestrator.agents['productos'].rag.kb_version)
+    return reloaded
+
+
+async def watch_knowledge_base():
+    """Sondea mtime/tamaño de la KB y recarga cuando cambian (sin reiniciar ni cortar sockets)"""
+    def file_signature():
+        try:
+            st = os.stat(KNOWLEDGE_BASE_PATH)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    last = file_signature()
+    while True:
+        await asyncio.sleep(KB_WATCH_INTERVAL)
+        current = file_signature()
+        if current is None or current == last:
+            continue
+        last = current
+        try:
+            await reload_knowledge_base()
+        except Exception as e:
+            print(f"[RAG] Error recargando la KB: {e}")
+
 
 app = FastAPI(
     title="Omia - Asistente de Ventas",
@@ -131,8 +336,84 @@ async def health_check():
         "status": "ok",
         "version": "3.0.0",
         "agents": ["productos", "objeciones", "argumentos"],
-        "knowledge_base_size": len(orchestrator.agents['productos'].rag.qa_pairs) if orchestrator else 0
+        "knowledge_base_size": len(orchestrator.agents['productos'].rag.qa_pairs) if orchestrator else 0,
+        "knowledge_base": get_reload_status() if orchestrator else None,
+        "pid": os.getpid(),
+    }
+
+
+@app.post("/api/admin/reload-kb")
+async def admin_reload_kb(request: Request):
+    """Fuerza la recarga de la base de conocimiento (cabecera X-Admin-Token = ADMIN_TOKEN)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Recarga por API deshabilitada (falta ADMIN_TOKEN)")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+    reloaded = await reload_knowledge_base(force=True)
+    return {"reloaded": reloaded, **get_reload_status()}
+
+
+@app.get("/api/tts/stats")
+async def tts_stats():
+    """Tiempo hasta el primer byte de audio de ElevenLabs (ventana de las últimas 1000 peticiones)"""
+    return {
+        "time_to_first_audio_byte": tts_ttfb.summary(),
+        "request_to_first_audio": tts_first_audio.summary(),
+        "audio_cache": audio_cache.stats() if audio_cache is not None else None,
+        "summary_cache": summary_cache.stats() if summary_cache is not None else None,
+    }
+
+
+@app.get("/api/upstreams/stats")
+async def upstream_stats():
+    """Llamadas activas, cola, rechazos y espera (ms) por upstream, para dimensionar los límites"""
+    return {limiter.name: limiter.stats() for limiter in UPSTREAM_LIMITERS}
+
+
+@app.get("/api/infographic/stats")
+async def infographic_stats():
+    """Aciertos/fallos de la caché de infografías y peticiones unidas a una generación en curso"""
+    return {
+        "cache": infographic_cache.stats() if infographic_cache is not None else None,
+        "coalesced": infographic_flight.coalesced,
+        "abandoned": infographic_flight.abandoned,
+        "in_flight": len(infographic_flight),
+    }
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Métricas en formato de texto de Prometheus: latencia por etapa del chat, fallback del RAG,
+    cobertura, cachés y upstreams. Son del worker que responde (con WEB_CONCURRENCY > 1, uno por scrape)"""
+    agents = orchestrator.agents.items() if orchestrator else []
+    caches = {
+        "answer": answer_cache,
+        "infographic": infographic_cache,
+        "tts_summary": summary_cache,
+        "tts_audio": audio_cache,
     }
+    cache_stats = [(name, cache.stats()) for name, cache in caches.items() if cache is not None]
+    limiter_stats = [(limiter.name, limiter.stats()) for limiter in UPSTREAM_LIMITERS]
+    blocks = [
+        chat_stage_seconds.render(),
+        chat_messages.render(),
+        chat_rag_coverage.render(),
+        render_metric("omia_rag_searches_total", "counter", "Búsquedas del chat por agente", "agent",
+                      [(name, agent.searches) for name, agent in agents]),
+        render_metric("omia_rag_fallbacks_total", "counter", "Búsquedas que recurrieron a la KB completa",
+                      "agent", [(name, agent.fallbacks) for name, agent in agents]),
+        render_metric("omia_cache_hits_total", "counter", "Aciertos por caché", "cache",
+                      [(name, stats["hits"]) for name, stats in cache_stats]),
+        render_metric("omia_cache_misses_total", "counter", "Fallos por caché", "cache",
+                      [(name, stats["misses"]) for name, stats in cache_stats]),
+        render_metric("omia_upstream_active", "gauge", "Llamadas activas por upstream", "upstream",
+                      [(name, stats["active"]) for name, stats in limiter_stats]),
+        render_metric("omia_upstream_queue_depth", "gauge", "Peticiones en cola por upstream", "upstream",
+                      [(name, stats["queue_depth"]) for name, stats in limiter_stats]),
+        render_metric("omia_upstream_rejected_total", "counter", "Peticiones rechazadas (cola llena)", "upstream",
+                      [(name, stats["rejected"]) for name, stats in limiter_stats]),
+    ]
+    return PlainTextResponse("\n".join(blocks) + "\n", media_type="text/plain; version=0.0.4")
 
 
 @app.get("/api/test-infographic")
@@ -144,7 +425,8 @@ async def test_infographic():
     test_text = "Puro Omega 3 TG contiene 900mg de EPA+DHA por cápsula. Indicado para hipertrigliceridemia. Reducción de triglicéridos del 30% en 8 semanas según estudios clínicos."
 
     try:
-        data = await asyncio.to_thread(_generate_infographic_sync, test_text)
+        async with infographic_limiter:
+            data = await _generate_infographic(test_text)
         return {"success": True, "model": INFOGRAPHIC_MODEL, "data": data}
     except Exception as e:
         import traceback
@@ -170,8 +452,10 @@ async def generate_infographic(req: InfographicRequest):
         raise HTTPException(status_code=400, detail="agent_response vacío")
 
     try:
-        data = await asyncio.to_thread(_generate_infographic_sync, req.agent_response)
+        data = await get_infographic(req.agent_response)
         return {"success": True, "data": data}
+    except UpstreamBusy:
+        raise HTTPException(status_code=429, detail="Demasiadas infografías en curso, reintenta en unos segundos")
     except Exception as e:
         print(f"[Infographic] Error: {e}")
         return {"success": False, "error": str(e)}
@@ -188,39 +472,41 @@ async def transcribe_voice(audio: UploadFile = File(...)):
         return {"text": "", "success": False, "error": "GROQ_API_KEY no configurada"}
 
     try:
-        # Leer el archivo de audio
-        audio_bytes = await audio.read()
+        # El upload ya está en un SpooledTemporaryFile (memoria hasta 1 MB, luego disco):
+        # se mide y se pasa tal cual a Groq, sin copiarlo ni escribir ficheros propios
+        upload = audio.file
+        upload.seek(0, os.SEEK_END)
+        size = upload.tell()
+        upload.seek(0)
 
         # Log para debug iOS
-        print(f"[VOICE] Received audio: filename={audio.filename}, size={len(audio_bytes)} bytes, content_type={audio.content_type}")
+        print(f"[VOICE] Received audio: filename={audio.filename}, size={size} bytes, content_type={audio.content_type}")
 
         # Si el audio está vacío, devolver error claro
-        if len(audio_bytes) < 100:
-            print(f"[VOICE] Audio too small ({len(audio_bytes)} bytes), likely empty recording")
-            return {"text": "", "success": False, "error": f"Audio vacío ({len(audio_bytes)} bytes)"}
+        if size < 100:
+            print(f"[VOICE] Audio too small ({size} bytes), likely empty recording")
+            return {"text": "", "success": False, "error": f"Audio vacío ({size} bytes)"}
 
-        # Crear archivo temporal para Groq (usar /tmp para permisos en Docker)
-        import tempfile
-        ext = audio.filename.split('.')[-1] if audio.filename else 'webm'
-        temp_filename = os.path.join(tempfile.gettempdir(), f"temp_audio_{os.getpid()}.{ext}")
+        if size > VOICE_MAX_UPLOAD_MB * 1024 * 1024:
+            print(f"[VOICE] Audio too large ({size} bytes)")
+            return {"text": "", "success": False, "error": f"Audio demasiado grande (máx. {VOICE_MAX_UPLOAD_MB:g} MB)"}
 
-        with open(temp_filename, "wb") as f:
-            f.write(audio_bytes)
+        # Groq deduce el formato por la extensión del nombre
+        ext = audio.filename.split('.')[-1] if audio.filename else 'webm'
 
-        # Transcribir con Whisper via Groq
-        with open(temp_filename, "rb") as audio_file:
-            transcription = groq_client.audio.transcriptions.create(
+        # Transcribir con Whisper via Groq (async: no bloquea otras peticiones)
+        async with voice_limiter:
+            transcription = await groq_client.audio.transcriptions.create(
                 model="whisper-large-v3",
-                file=audio_file,
+                file=(f"audio.{ext}", upload),
                 language="es"
             )
 
-        # Limpiar archivo temporal
-        os.remove(temp_filename)
-
         print(f"[VOICE] Transcription result: '{transcription.text}'")
         return {"text": transcription.text, "success": True}
 
+    except UpstreamBusy:
+        raise HTTPException(status_code=429, detail="Demasiadas transcripciones en curso")
     except Exception as e:
         print(f"[VOICE] ERROR: {e}")
         return {"text": "", "success": False, "error": str(e)}
@@ -242,6 +528,28 @@ REGLAS:
 10. NUNCA incluyas caracteres especiales como |, *, #, >, -, ni guiones al inicio de líneas. El texto debe sonar 100% natural al escucharlo."""
 
 
+def _clean_tts_text(text: str) -> str:
+    """Quita el markdown residual para que el texto suene natural al leerlo"""
+    text = text.strip()
+    text = re.sub(r'\*+', '', text)           # bold/italic
+    text = re.sub(r'#{1,6}\s+', '', text)     # headings
+    text = re.sub(r'^>\s*', '', text, flags=re.MULTILINE)  # blockquotes
+    text = re.sub(r'\|', ' ', text)            # table pipes
+    text = re.sub(r'^[\s\-:]+$', '', text, flags=re.MULTILINE)  # table separators (---|---)
+    text = re.sub(r'^[-•]\s+', '', text, flags=re.MULTILINE)    # list bullets
+    text = re.sub(r'^\d+\.\s+', '', text, flags=re.MULTILINE)   # numbered lists
+    text = re.sub(r'\s{2,}', ' ', text)       # collapse multiple spaces
+    text = re.sub(r'\n{2,}', '. ', text)      # multiple newlines → period
+    return text.strip()
+
+
+def _summary_messages(agent_response: str) -> list:
+    return [
+        {"role": "system", "content": TTS_SUMMARY_PROMPT},
+        {"role": "user", "content": agent_response}
+    ]
+
+
 def _generate_tts_summary(agent_response: str) -> str:
     """Genera un resumen conversacional corto del texto del agente para TTS."""
     if not llm_client:
@@ -250,26 +558,12 @@ def _generate_tts_summary(agent_response: str) -> str:
     try:
         response = llm_client.chat.completions.create(
             model=LLM_MODEL,
-            messages=[
-                {"role": "system", "content": TTS_SUMMARY_PROMPT},
-                {"role": "user", "content": agent_response}
-            ],
+            messages=_summary_messages(agent_response),
             stream=False,
             max_tokens=200,
             temperature=0.6
         )
-        summary = response.choices[0].message.content.strip()
-        # Limpiar cualquier markdown residual
-        summary = re.sub(r'\*+', '', summary)           # bold/italic
-        summary = re.sub(r'#{1,6}\s+', '', summary)     # headings
-        summary = re.sub(r'^>\s*', '', summary, flags=re.MULTILINE)  # blockquotes
-        summary = re.sub(r'\|', ' ', summary)            # table pipes
-        summary = re.sub(r'^[\s\-:]+$', '', summary, flags=re.MULTILINE)  # table separators (---|---)
-        summary = re.sub(r'^[-•]\s+', '', summary, flags=re.MULTILINE)    # list bullets
-        summary = re.sub(r'^\d+\.\s+', '', summary, flags=re.MULTILINE)   # numbered lists
-        summary = re.sub(r'\s{2,}', ' ', summary)       # collapse multiple spaces
-        summary = re.sub(r'\n{2,}', '. ', summary)      # multiple newlines → period
-        summary = summary.strip()
+        summary = _clean_tts_text(response.choices[0].message.content)
         print(f"[TTS] Summary ({len(summary)} chars): {summary[:100]}...")
         return summary
     except Exception as e:
@@ -277,35 +571,67 @@ def _generate_tts_summary(agent_response: str) -> str:
         return ""
 
 
-class TTSRequest(BaseModel):
-    text: str
-    skip_summary: bool = False  # True = send text directly to ElevenLabs without LLM summary
+def _summary_key(agent_response: str) -> str:
+    raw = json.dumps([LLM_MODEL, TTS_SUMMARY_PROMPT, agent_response.strip()], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
 
 
-# ============================================
-# Sincronización de historial entre dispositivos
-# ============================================
-USER_DATA_FILE = "user_data.json"
+async def get_tts_summary(agent_response: str) -> str:
+    """Resumen TTS memoizado: caché → resumen en curso (precálculo) → llamada al LLM"""
+    key = _summary_key(agent_response)
+    if summary_cache is not None:
+        cached = summary_cache.get(key)
+        if cached is not None:
+            return cached
 
+    async def generate():
+        # Se guarda dentro de la tarea: aunque el cliente cancele, queda para la próxima vez
+        summary = await tts_summary_limiter.run(_generate_tts_summary, agent_response)
+        if summary and summary_cache is not None:
+            summary_cache.set(key, summary)
+        return summary
+
+    return await summary_flight.do(key, generate)
+
+
+def _summary_ready(agent_response: str) -> bool:
+    """True si el resumen ya está en caché o generándose (no hace falta el pipeline)"""
+    key = _summary_key(agent_response)
+    if key in summary_flight:
+        return True
+    return summary_cache is not None and summary_cache.get(key) is not None
+
+
+def precompute_tts_summary(agent_response: str):
+    """Lanza el resumen TTS en segundo plano (tras 'end') para que el altavoz no espere al LLM"""
+    if not elevenlabs_api_key or not agent_response.strip():
+        return
+    if summary_cache is not None and summary_cache.get(_summary_key(agent_response)) is not None:
+        return
 
-def load_user_data() -> dict:
-    """Carga datos de usuarios desde archivo JSON"""
-    if os.path.exists(USER_DATA_FILE):
+    async def run():
         try:
-            with open(USER_DATA_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            await get_tts_summary(agent_response)
         except Exception as e:
-            print(f"[UserData] Error loading: {e}")
-    return {}
+            print(f"[TTS] Error precalculando resumen: {e}")
 
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
-def save_user_data(data: dict):
-    """Guarda datos de usuarios a archivo JSON"""
-    try:
-        with open(USER_DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"[UserData] Error saving: {e}")
+
+class TTSRequest(BaseModel):
+    text: str
+    skip_summary: bool = False  # True = send text directly to ElevenLabs without LLM summary
+
+
+# ============================================
+# Sincronización de historial entre dispositivos
+# ============================================
+# Backend: "sqlite" (por defecto, migra user_data.json la primera vez) o "json"
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "user_data.db")
+USER_DATA_FILE = os.getenv("USER_DATA_FILE", "user_data.json")
 
 
 class SearchHistoryRequest(BaseModel):
@@ -323,13 +649,8 @@ async def save_search_history(req: SearchHistoryRequest):
     if not req.username:
         raise HTTPException(status_code=400, detail="Username requerido")
 
-    user_data = load_user_data()
-    if req.username not in user_data:
-        user_data[req.username] = {}
-
-    user_data[req.username]["searches"] = req.searches
-    user_data[req.username]["last_sync"] = __import__('time').time()
-    save_user_data(user_data)
+    # I/O bloqueante fuera del event loop
+    await asyncio.to_thread(history_store.save, req.username, req.searches, time.time())
 
     return {"status": "ok", "saved": len(req.searches)}
 
@@ -340,78 +661,349 @@ async def load_search_history(req: GetHistoryRequest):
     if not req.username:
         raise HTTPException(status_code=400, detail="Username requerido")
 
-    user_data = load_user_data()
-    if req.username in user_data and "searches" in user_data[req.username]:
+    user = await asyncio.to_thread(history_store.load, req.username)
+    if user is not None:
         return {
             "status": "ok",
-            "searches": user_data[req.username]["searches"],
-            "last_sync": user_data[req.username].get("last_sync", 0)
+            "searches": user["searches"],
+            "last_sync": user["last_sync"]
         }
 
     return {"status": "ok", "searches": [], "last_sync": 0}
 
 
+def _parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Rango 'bytes=a-b' / 'bytes=a-' / 'bytes=-n' → (inicio, fin inclusive). None = fichero entero"""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_s, _, end_s = range_header[6:].strip().partition("-")
+    try:
+        if start_s:
+            start = int(start_s)
+            end = min(int(end_s), size - 1) if end_s else size - 1
+        else:
+            start = max(0, size - int(end_s))
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _cached_audio_response(path: str, range_header: Optional[str], key: str) -> Optional[StreamingResponse]:
+    """Sirve un MP3 de la caché en streaming, con soporte de Range (206).
+    None si el fichero ya no existe (expulsado por otra petición o worker tras audio_cache.get)"""
+    try:
+        # Abierto ya aquí: una expulsión posterior no afecta a la lectura
+        raw = open(path, "rb")
+    except OSError:
+        return None
+    try:
+        size = os.fstat(raw.fileno()).st_size
+        byte_range = _parse_range(range_header, size)
+    except BaseException:
+        raw.close()
+        raise
+    start, end = byte_range or (0, size - 1)
+
+    async def read_file():
+        async with anyio.wrap_file(raw) as f:
+            try:
+                await f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await f.read(min(65536, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            except OSError as e:
+                # Las cabeceras ya se enviaron: solo se puede cortar el stream
+                print(f"[TTS] Error leyendo audio cacheado: {e}")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(end - start + 1),
+        "Cache-Control": "no-cache",
+        "X-TTS-Cache": "hit",
+        "X-Audio-Key": key,
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        read_file(),
+        status_code=206 if byte_range else 200,
+        media_type="audio/mpeg",
+        headers=headers,
+    )
+
+
+@app.get("/api/tts/audio/{key}")
+async def cached_audio(key: str, request: Request):
+    """Reproduce (con Range) un audio ya generado, por su clave X-Audio-Key.
+    La clave es la del audio o, en respuestas del pipeline, la del resumen (el audio
+    se localiza a través del resumen cacheado cuando el stream ha terminado)"""
+    if audio_cache is None or not re.fullmatch(r"[0-9a-f]{64}", key):
+        raise HTTPException(status_code=404, detail="Audio no encontrado")
+    path = audio_cache.get(key)
+    if not path and summary_cache is not None:
+        summary = summary_cache.get(key)
+        if summary:
+            path = audio_cache.get(_audio_cache_key(summary))
+    if not path:
+        raise HTTPException(status_code=404, detail="Audio no encontrado")
+    response = _cached_audio_response(path, request.headers.get("range"), key)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Audio no encontrado")
+    return response
+
+
+class SentenceSplitter:
+    """Corta texto que llega en streaming en frases completas.
+
+    Una frase termina en . ! ? … seguido de espacio, o en salto de línea; las
+    frases más cortas que min_chars se juntan con la siguiente para no
+    trocear la entonación."""
+
+    SENTENCE_END_RE = re.compile(r'[.!?…]["»)\]]*\s+|\n+')
+
+    def __init__(self, min_chars: int = TTS_SENTENCE_MIN_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, token: str) -> list:
+        """Añade texto y devuelve las frases que ya están completas"""
+        self._buffer += token
+        sentences = []
+        start = 0
+        for match in self.SENTENCE_END_RE.finditer(self._buffer):
+            if match.end() - start >= self.min_chars:
+                sentences.append(self._buffer[start:match.end()])
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> str:
+        """Resto pendiente al terminar el stream"""
+        rest, self._buffer = self._buffer, ""
+        return rest
+
+
+async def _summarize_into_queue(agent_response: str, queue: asyncio.Queue) -> bool:
+    """Resumen TTS en streaming: cada frase limpia se encola en cuanto se completa (None = fin).
+    Devuelve True solo si el resumen llegó entero"""
+    stream = None
+    completed = False
+    try:
+        stream = await get_llm_client().chat.completions.create(
+            model=LLM_MODEL,
+            messages=_summary_messages(agent_response),
+            stream=True,
+            max_tokens=200,
+            temperature=0.6
+        )
+        splitter = SentenceSplitter()
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                for sentence in splitter.feed(chunk.choices[0].delta.content):
+                    sentence = _clean_tts_text(sentence)
+                    if sentence:
+                        await queue.put(sentence)
+        rest = _clean_tts_text(splitter.flush())
+        if rest:
+            await queue.put(rest)
+        completed = True
+    except Exception as e:
+        print(f"[TTS] Error generating summary: {e}")
+    finally:
+        if stream is not None:
+            await stream.close()
+        tts_summary_limiter.release()
+        await queue.put(None)
+    return completed
+
+
+class TTSStreamError(Exception):
+    """El stream de ElevenLabs falló o se cortó: el audio enviado está incompleto"""
+
+
+async def _elevenlabs_audio(text: str, previous_text: str = ""):
+    """Stream MP3 de ElevenLabs por el cliente compartido (previous_text da continuidad entre frases).
+    Lanza TTSStreamError si la respuesta no es 200 o la conexión se corta a mitad"""
+    url = (
+        f"/v1/text-to-speech/{elevenlabs_voice_id}/stream"
+        f"?output_format={TTS_OUTPUT_FORMAT}"
+    )
+    headers = {
+        "xi-api-key": elevenlabs_api_key,
+        "Content-Type": "application/json",
+    }
+    body = {
+        "text": text,
+        "model_id": TTS_MODEL_ID,
+        "language_code": "es",
+        "voice_settings": TTS_VOICE_SETTINGS,
+    }
+    if previous_text:
+        body["previous_text"] = previous_text
+
+    started = time.perf_counter()
+    first_chunk = True
+    try:
+        async with tts_http_client.stream("POST", url, headers=headers, json=body) as resp:
+            if resp.status_code != 200:
+                error_body = await resp.aread()
+                print(f"[TTS] ElevenLabs error {resp.status_code}: {error_body[:200]}")
+                tts_ttfb.record_error()
+                raise TTSStreamError(f"ElevenLabs respondió {resp.status_code}")
+            async for chunk in resp.aiter_bytes(chunk_size=4096):
+                if first_chunk:
+                    tts_ttfb.record((time.perf_counter() - started) * 1000)
+                    first_chunk = False
+                yield chunk
+    except httpx.HTTPError as e:
+        print(f"[TTS] Error de conexión con ElevenLabs: {e}")
+        tts_ttfb.record_error()
+        raise TTSStreamError(str(e)) from e
+
+
+def _audio_cache_key(summary: str) -> str:
+    return AudioCache.make_key(
+        summary, elevenlabs_voice_id, TTS_MODEL_ID, TTS_VOICE_SETTINGS, TTS_OUTPUT_FORMAT
+    )
+
+
+async def _store_audio(summary: str, chunks: list):
+    """Guarda en la caché de disco el audio completo de un resumen"""
+    if audio_cache is None or not chunks:
+        return
+    try:
+        await asyncio.to_thread(audio_cache.put, _audio_cache_key(summary), b"".join(chunks))
+    except OSError as e:
+        print(f"[TTS] No se pudo guardar el audio en caché: {e}")
+
+
 @app.post("/api/tts")
-async def text_to_speech(req: TTSRequest):
+async def text_to_speech(req: TTSRequest, request: Request):
     """Genera audio TTS via ElevenLabs.
     1. El LLM resume la respuesta en un discurso conversacional corto (unless skip_summary).
-    2. Ese resumen se envía a ElevenLabs para generar audio."""
+    2. Si ese resumen ya tiene audio en la caché de disco, se sirve desde ahí (con Range).
+    3. Si no, se envía a ElevenLabs y el audio se guarda en la caché al terminar.
+    Con TTS_PIPELINE, un resumen que aún no existe se genera en streaming y cada frase
+    se sintetiza en cuanto está completa (el audio empieza antes de acabar el resumen)."""
     if not elevenlabs_api_key:
         raise HTTPException(status_code=503, detail="ELEVENLABS_API_KEY no configurada")
 
     if not req.text or not req.text.strip():
         raise HTTPException(status_code=400, detail="Texto vacío")
 
+    request_started = time.perf_counter()
+
     # Paso 1: Generar resumen conversacional con el LLM (or use text directly)
+    summary = None
     if req.skip_summary:
         summary = req.text.strip()
-    else:
-        summary = await asyncio.to_thread(_generate_tts_summary, req.text)
+    elif not TTS_PIPELINE or not llm_client or _summary_ready(req.text):
+        try:
+            summary = await get_tts_summary(req.text)
+        except UpstreamBusy:
+            raise HTTPException(status_code=429, detail="Demasiados resúmenes TTS en curso")
         if not summary:
             raise HTTPException(status_code=500, detail="No se pudo generar resumen para TTS")
 
-    # Paso 2: Enviar resumen a ElevenLabs
-    url = (
-        f"https://api.elevenlabs.io/v1/text-to-speech/{elevenlabs_voice_id}/stream"
-        f"?output_format=mp3_44100_128"
+    if summary is None:
+        return await _pipelined_tts_response(req.text, request_started)
+
+    # Paso 2: Audio ya generado para este resumen y esta voz → servir desde disco
+    cache_key = _audio_cache_key(summary)
+    if audio_cache is not None:
+        path = audio_cache.get(cache_key)
+        response = _cached_audio_response(path, request.headers.get("range"), cache_key) if path else None
+        if response is not None:
+            print(f"[TTS] Audio cacheado ({cache_key[:12]})")
+            return response
+
+    # Paso 3: Enviar resumen a ElevenLabs
+    async def stream_audio():
+        # Copia del audio para la caché; solo se guarda si el stream termina completo
+        chunks = []
+        try:
+            async for chunk in _elevenlabs_audio(summary):
+                if not chunks:
+                    tts_first_audio.record((time.perf_counter() - request_started) * 1000)
+                chunks.append(chunk)
+                yield chunk
+        except TTSStreamError:
+            return
+        await _store_audio(summary, chunks)
+
+    return StreamingResponse(
+        stream_audio(),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-cache", "X-TTS-Cache": "miss", "X-Audio-Key": cache_key},
     )
-    headers = {
-        "xi-api-key": elevenlabs_api_key,
-        "Content-Type": "application/json",
-    }
-    body = {
-        "text": summary,
-        "model_id": "eleven_multilingual_v2",
-        "language_code": "es",
-        "voice_settings": {
-            "stability": 0.35,          # Más bajo = más expresiva y natural
-            "similarity_boost": 0.80,   # Mantener la voz reconocible
-            "style": 0.45,              # Más estilo = más emocional/cálida
-            "use_speaker_boost": True,
-        },
-    }
+
+
+async def _pipelined_tts_response(agent_response: str, request_started: float) -> StreamingResponse:
+    """Resumen en streaming → frases → una petición ElevenLabs por frase, concatenadas en un solo MP3"""
+    try:
+        # El hueco se libera al terminar el stream del resumen (en _summarize_into_queue)
+        await tts_summary_limiter.acquire()
+    except UpstreamBusy:
+        raise HTTPException(status_code=429, detail="Demasiados resúmenes TTS en curso")
+    queue: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.create_task(_summarize_into_queue(agent_response, queue))
+
+    first_sentence = await queue.get()
+    if first_sentence is None:
+        raise HTTPException(status_code=500, detail="No se pudo generar resumen para TTS")
 
     async def stream_audio():
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            async with client.stream("POST", url, headers=headers, json=body) as resp:
-                if resp.status_code != 200:
-                    error_body = await resp.aread()
-                    print(f"[TTS] ElevenLabs error {resp.status_code}: {error_body[:200]}")
+        sentences = []
+        chunks = []
+        sentence = first_sentence
+        try:
+            while sentence is not None:
+                try:
+                    async for chunk in _elevenlabs_audio(sentence, " ".join(sentences)):
+                        if not chunks:
+                            tts_first_audio.record((time.perf_counter() - request_started) * 1000)
+                        chunks.append(chunk)
+                        yield chunk
+                except TTSStreamError:
                     return
-                async for chunk in resp.aiter_bytes(chunk_size=4096):
-                    yield chunk
+                sentences.append(sentence)
+                sentence = await queue.get()
+            summary_completed = await producer
+        finally:
+            # Cliente desconectado a mitad: no seguir generando el resumen
+            producer.cancel()
+
+        # Misma limpieza que _generate_tts_summary sobre el resumen entero: ambos caminos
+        # guardan el mismo valor en summary_cache y la misma clave de audio
+        summary = _clean_tts_text(" ".join(sentences))
+        if not summary_completed:
+            # Resumen cortado por un error del LLM: ni el resumen ni su audio se cachean
+            print(f"[TTS] Resumen incompleto ({len(sentences)} frases), no se guarda en caché")
+            return
+        print(f"[TTS] Summary ({len(summary)} chars, {len(sentences)} frases): {summary[:100]}...")
+        if summary_cache is not None:
+            summary_cache.set(_summary_key(agent_response), summary)
+        await _store_audio(summary, chunks)
 
     return StreamingResponse(
         stream_audio(),
         media_type="audio/mpeg",
-        headers={"Cache-Control": "no-cache"},
+        # El resumen (y la clave del audio) aún no existe: se da la clave del resumen
+        headers={"Cache-Control": "no-cache", "X-TTS-Cache": "miss", "X-Audio-Key": _summary_key(agent_response)},
     )
 
 
-def _generate_infographic_sync(agent_response: str) -> dict:
-    """Llamada sincrónica al LLM para generar infografía (se ejecuta en thread pool)"""
+async def _generate_infographic(agent_response: str) -> dict:
+    """Llamada al LLM para generar infografía con el cliente async (cancelable)"""
     print(f"[Infographic] Llamando a {INFOGRAPHIC_MODEL} con {len(agent_response)} chars...")
-    response = llm_client.chat.completions.create(
+    response = await get_llm_client().chat.completions.create(
         model=INFOGRAPHIC_MODEL,
         messages=[
             {"role": "system", "content": INFOGRAPHIC_PROMPT},
@@ -432,15 +1024,65 @@ def _generate_infographic_sync(agent_response: str) -> dict:
     return json.loads(raw)
 
 
+async def get_infographic(agent_response: str) -> dict:
+    """Infografía cacheada por hash de la respuesta; peticiones idénticas simultáneas comparten la llamada"""
+    raw = json.dumps([INFOGRAPHIC_MODEL, INFOGRAPHIC_PROMPT, agent_response.strip()], ensure_ascii=False)
+    key = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    if infographic_cache is not None:
+        cached = infographic_cache.get(key)
+        if cached is not None:
+            print("[Infographic] Infografía cacheada")
+            return cached
+
+    async def generate():
+        async with infographic_limiter:
+            data = await _generate_infographic(agent_response)
+        if infographic_cache is not None:
+            infographic_cache.set(key, data)
+        return data
+
+    return await infographic_flight.do(key, generate)
+
+
+def start_speculative_infographic(agent_response: str) -> Optional[asyncio.Task]:
+    """Genera en segundo plano la infografía de una respuesta recién enviada (INFOGRAPHIC_PRECOMPUTE).
+
+    Baja prioridad: solo arranca si hay hueco en su propio presupuesto y el límite de
+    infografías deja al menos un hueco libre para peticiones reales. Cuando llega la
+    petición, get_infographic la encuentra en caché o se une a la generación en curso."""
+    if not INFOGRAPHIC_PRECOMPUTE or not llm_client or not agent_response.strip():
+        return None
+    if infographic_limiter.waiting or infographic_limiter.active + 1 >= infographic_limiter.max_concurrent:
+        return None
+
+    async def run():
+        try:
+            async with infographic_speculative_limiter:
+                await get_infographic(agent_response)
+            print("[Infographic] Infografía precalculada")
+        except UpstreamBusy:
+            pass
+        except Exception as e:
+            print(f"[Infographic] Error precalculando: {e}")
+
+    return asyncio.create_task(run())
+
+
 async def handle_infographic_request(websocket: WebSocket, agent_response: str):
     """Genera una infografía resumida a partir de la respuesta del agente"""
     print(f"[Infographic] Recibida solicitud ({len(agent_response)} chars)")
     await websocket.send_json({"type": "infographic_loading"})
     try:
-        # Ejecutar en thread pool para no bloquear el event loop
-        data = await asyncio.to_thread(_generate_infographic_sync, agent_response)
+        # Caché por hash, single-flight para peticiones idénticas y cliente async bajo infographic_limiter
+        # (UpstreamBusy si la cola está llena)
+        data = await get_infographic(agent_response)
         print(f"[Infographic] JSON generado: {data.get('titulo', '?')}")
         await websocket.send_json({"type": "infographic_data", "data": data})
+    except UpstreamBusy:
+        await websocket.send_json({
+            "type": "infographic_error",
+            "message": "Demasiadas infografías en curso, reintenta en unos segundos"
+        })
     except json.JSONDecodeError as e:
         await websocket.send_json({
             "type": "infographic_error",
@@ -453,92 +1095,241 @@ async def handle_infographic_request(websocket: WebSocket, agent_response: str):
         })
 
 
+# Wake word "Hola Omia" y variantes
+WAKE_WORD_RE = re.compile(r'(?:hola|hey|oye|ok|ola)\s*om[ií]a', re.IGNORECASE)
+WAKE_WORD_BARE_RE = re.compile(r'\bom[ií]a\b', re.IGNORECASE)
+BARE_GREETING_RE = re.compile(
+    r'^(hola|hey|oye|ok|buenas?|buenos?|que tal|como estas?|gracias?|adios|hasta luego)?[.!?,\s]*$'
+)
+ACCENTS_RE = re.compile(r'[\u0300-\u036f]')
+
+
+def _strip_accents(text: str) -> str:
+    """Minúsculas y sin acentos (NFD + quitar diacríticos)"""
+    return ACCENTS_RE.sub('', unicodedata.normalize('NFD', text.lower()))
+
+
 def strip_wake_word(message: str) -> str:
     """Elimina variantes del wake word 'Hola Omia' del mensaje.
     Si lo que queda es solo un saludo vacío, retorna cadena vacía."""
-    import unicodedata
     t = message.strip()
     # Remove wake word patterns (case-insensitive)
-    wake_patterns = [
-        r'(?:hola|hey|oye|ok|ola)\s*om[ií]a',
-        r'\bom[ií]a\b',
-    ]
-    for p in wake_patterns:
-        t = re.sub(p, '', t, flags=re.IGNORECASE).strip()
+    for p in (WAKE_WORD_RE, WAKE_WORD_BARE_RE):
+        t = p.sub('', t).strip()
     # Remove leftover punctuation/whitespace
     t = re.sub(r'^[,\s.!?]+', '', t).strip()
     # If only a bare greeting remains, return empty
-    bare = unicodedata.normalize('NFD', t.lower())
-    bare = re.sub(r'[\u0300-\u036f]', '', bare).strip()
-    if re.match(r'^(hola|hey|oye|ok|buenas?|buenos?|que tal|como estas?|gracias?|adios|hasta luego)?[.!?,\s]*$', bare):
+    bare = _strip_accents(t).strip()
+    if BARE_GREETING_RE.match(bare):
         return ''
     return t
 
 
+# Follow-ups conversacionales — NUNCA son greetings aunque no tengan keywords pharma
+FOLLOWUP_PATTERNS = [
+    r'cuentame', r'cuenteme', r'dime\s+mas', r'dame\s+mas', r'amplia',
+    r'profundiza', r'explica', r'explicame', r'detalla', r'detallame',
+    r'elabora', r'desarrolla', r'resume', r'resumeme', r'resumi',
+    r'continua', r'sigue', r'prosigue', r'mas\s+informacion',
+    r'mas\s+detalles', r'mas\s+sobre', r'que\s+mas', r'algo\s+mas',
+    r'otra\s+cosa', r'otra\s+pregunta', r'y\s+sobre', r'tambien',
+    r'ademas', r'aparte', r'igualmente', r'por\s+otro\s+lado',
+    r'en\s+cuanto\s+a', r'respecto\s+a', r'sobre\s+eso',
+    r'y\s+eso', r'por\s+que', r'como\s+asi', r'a\s+que\s+te\s+refieres',
+    r'no\s+entiendo', r'no\s+entendi', r'repite', r'repetir',
+    r'otra\s+vez', r'de\s+nuevo',
+]
+
+# Palabras clave que indican consulta real sobre el dominio pharma/ventas
+PHARMA_PATTERNS = [
+    # Productos y sustancias
+    r'omega', r'\bepa\b', r'\bdha\b', r'capsul', r'suplemento',
+    r'aceite', r'pescado', r'\brtg\b', r'etil', r'triglicerido',
+    r'natural dha', r'puro epa', r'resolving', r'\bprm\b',
+    # Médico / clínico
+    r'medico', r'doctor', r'paciente', r'prescri', r'dosis',
+    r'posologi', r'indicaci', r'tratamiento', r'clinico',
+    r'embaraz', r'cardio', r'gineco', r'neuro', r'pediatr',
+    r'psiquiatr', r'reumat', r'dermato', r'oftalmol', r'urolog',
+    r'endocrino', r'gastro', r'neumol', r'oncol', r'geriatr',
+    r'traumat', r'internist', r'medicina general',
+    # Especialidades y condiciones
+    r'especialidad', r'especialista', r'colesterol', r'inflamac',
+    r'cardiovascular', r'diabetes', r'hipertens', r'artritis',
+    r'cerebr', r'cognitiv', r'depres', r'ansiedad', r'retina',
+    r'fertil', r'gestacion', r'prenatal', r'menopausia',
+    # Objeciones
+    r'\bcaro\b', r'costoso', r'precio', r'barato', r'coste',
+    r'no funciona', r'no sirve', r'metales pesados',
+    r'efecto.? secundario', r'interacci', r'contraindicac',
+    r'otra marca', r'competencia', r'objecion',
+    # Ventas y argumentos
+    r'argumento', r'vender', r'\bventa\b', r'presentar', r'visita',
+    r'represent', r'estrategi', r'perfil', r'diferenci',
+    r'ventaja', r'evidencia', r'estudio', r'ensayo',
+    # Marca
+    r'puro omega', r'omega.?3 index', r'\bifos\b', r'certificac',
+    # Producto genérico
+    r'producto', r'composici', r'concentraci', r'biodisponib',
+    r'absorci', r'calidad', r'pureza',
+    # Acciones del dominio
+    r'recomiend', r'recomendar', r'prescrib', r'comparar', r'comparativ',
+    r'que es\b', r'para que sirve', r'como funciona', r'como respondo',
+    r'como presento', r'como vendo',
+]
+
+# Compiladas una vez en alternancias: un solo escaneo por tabla
+FOLLOWUP_RE = re.compile('|'.join(f'(?:{p})' for p in FOLLOWUP_PATTERNS))
+PHARMA_RE = re.compile('|'.join(f'(?:{p})' for p in PHARMA_PATTERNS))
+
+
 def is_greeting_or_vague(message: str) -> bool:
     """Detecta si un mensaje NO contiene consulta pharma real.
     Usa whitelist: si no hay ninguna palabra clave del dominio, es vago.
     Excluye follow-ups conversacionales que indican continuación de charla."""
-    import unicodedata
-    t = unicodedata.normalize('NFD', message.lower().strip())
-    t = re.sub(r'[\u0300-\u036f]', '', t)  # quitar acentos
-
-    # Follow-ups conversacionales — NUNCA son greetings aunque no tengan keywords pharma
-    followup_patterns = [
-        r'cuentame', r'cuenteme', r'dime\s+mas', r'dame\s+mas', r'amplia',
-        r'profundiza', r'explica', r'explicame', r'detalla', r'detallame',
-        r'elabora', r'desarrolla', r'resume', r'resumeme', r'resumi',
-        r'continua', r'sigue', r'prosigue', r'mas\s+informacion',
-        r'mas\s+detalles', r'mas\s+sobre', r'que\s+mas', r'algo\s+mas',
-        r'otra\s+cosa', r'otra\s+pregunta', r'y\s+sobre', r'tambien',
-        r'ademas', r'aparte', r'igualmente', r'por\s+otro\s+lado',
-        r'en\s+cuanto\s+a', r'respecto\s+a', r'sobre\s+eso',
-        r'y\s+eso', r'por\s+que', r'como\s+asi', r'a\s+que\s+te\s+refieres',
-        r'no\s+entiendo', r'no\s+entendi', r'repite', r'repetir',
-        r'otra\s+vez', r'de\s+nuevo',
-    ]
-    if any(re.search(p, t) for p in followup_patterns):
+    t = _strip_accents(message.strip())  # quitar acentos
+
+    if FOLLOWUP_RE.search(t):
         return False
 
-    # Palabras clave que indican consulta real sobre el dominio pharma/ventas
-    pharma_patterns = [
-        # Productos y sustancias
-        r'omega', r'\bepa\b', r'\bdha\b', r'capsul', r'suplemento',
-        r'aceite', r'pescado', r'\brtg\b', r'etil', r'triglicerido',
-        r'natural dha', r'puro epa', r'resolving', r'\bprm\b',
-        # Médico / clínico
-        r'medico', r'doctor', r'paciente', r'prescri', r'dosis',
-        r'posologi', r'indicaci', r'tratamiento', r'clinico',
-        r'embaraz', r'cardio', r'gineco', r'neuro', r'pediatr',
-        r'psiquiatr', r'reumat', r'dermato', r'oftalmol', r'urolog',
-        r'endocrino', r'gastro', r'neumol', r'oncol', r'geriatr',
-        r'traumat', r'internist', r'medicina general',
-        # Especialidades y condiciones
-        r'especialidad', r'especialista', r'colesterol', r'inflamac',
-        r'cardiovascular', r'diabetes', r'hipertens', r'artritis',
-        r'cerebr', r'cognitiv', r'depres', r'ansiedad', r'retina',
-        r'fertil', r'gestacion', r'prenatal', r'menopausia',
-        # Objeciones
-        r'\bcaro\b', r'costoso', r'precio', r'barato', r'coste',
-        r'no funciona', r'no sirve', r'metales pesados',
-        r'efecto.? secundario', r'interacci', r'contraindicac',
-        r'otra marca', r'competencia', r'objecion',
-        # Ventas y argumentos
-        r'argumento', r'vender', r'\bventa\b', r'presentar', r'visita',
-        r'represent', r'estrategi', r'perfil', r'diferenci',
-        r'ventaja', r'evidencia', r'estudio', r'ensayo',
-        # Marca
-        r'puro omega', r'omega.?3 index', r'\bifos\b', r'certificac',
-        # Producto genérico
-        r'producto', r'composici', r'concentraci', r'biodisponib',
-        r'absorci', r'calidad', r'pureza',
-        # Acciones del dominio
-        r'recomiend', r'recomendar', r'prescrib', r'comparar', r'comparativ',
-        r'que es\b', r'para que sirve', r'como funciona', r'como respondo',
-        r'como presento', r'como vendo',
-    ]
+    return not PHARMA_RE.search(t)
+
+
+class TokenCoalescer:
+    """Agrupa los tokens del LLM en menos frames WebSocket {"type": "token"}.
+
+    Vacía el buffer al llegar a max_chars o cuando pasan max_delay_ms desde el
+    primer token pendiente. El contenido concatenado es idéntico, así que el
+    frontend no necesita cambios."""
+
+    def __init__(self, websocket: WebSocket, max_chars: int = WS_TOKEN_FLUSH_CHARS,
+                 max_delay_ms: int = WS_TOKEN_FLUSH_MS):
+        self.websocket = websocket
+        self.max_chars = max_chars
+        self.max_delay = max_delay_ms / 1000
+        self.frames = 0
+        # Tiempo total dentro de websocket.send_json (s)
+        self.send_seconds = 0.0
+        self._buffer = []
+        self._size = 0
+        self._timer: Optional[asyncio.Task] = None
+        # Envíos por tiempo que ya vaciaron el buffer y esperan el lock o están enviando
+        self._inflight = set()
+        self._send_lock = asyncio.Lock()
+        self._error: Optional[BaseException] = None
+
+    async def add(self, token: str):
+        """Añade un token; envía el buffer si se alcanza el límite de caracteres"""
+        if self._error:
+            raise self._error
+        self._buffer.append(token)
+        self._size += len(token)
+        if self._size >= self.max_chars or self.max_delay <= 0:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        """Envía lo pendiente y espera a los envíos por tiempo en curso (llamar siempre antes de 'end')"""
+        self.cancel()
+        if self._error:
+            raise self._error
+        await self._send_buffer()
+        if self._inflight:
+            await asyncio.gather(*self._inflight)
+        # Errores del envío por tiempo que terminó mientras esperábamos
+        if self._error:
+            raise self._error
+
+    def cancel(self):
+        """Cancela el envío programado por tiempo"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        # Desde aquí el envío ya no se cancela: flush() lo espera
+        self._timer = None
+        task = asyncio.current_task()
+        self._inflight.add(task)
+        try:
+            await self._send_buffer()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._inflight.discard(task)
+
+    async def _send_buffer(self):
+        if not self._buffer:
+            return
+        content = "".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        async with self._send_lock:
+            started = time.perf_counter()
+            await self.websocket.send_json({
+                "type": "token",
+                "content": content
+            })
+            self.send_seconds += time.perf_counter() - started
+        self.frames += 1
+
+
+async def stream_llm_response(websocket: WebSocket, messages: list, max_tokens: int) -> str:
+    """Stream de la respuesta del LLM al WebSocket con el cliente async (sin bloquear el event loop).
+
+    Los tokens se agrupan en frames con TokenCoalescer.
+    Si el socket se cierra a mitad de respuesta, el envío falla y el stream
+    upstream se cierra en el finally, cancelando la generación.
+
+    Registra en chat_stage_seconds el primer token del LLM (llm_ttft), el stream completo
+    (llm_stream) y el tiempo enviando frames (ws_send)."""
+    started = time.perf_counter()
+    stream = await get_llm_client().chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        stream=True,
+        max_tokens=max_tokens,
+        temperature=0.3
+    )
 
-    return not any(re.search(p, t) for p in pharma_patterns)
+    full_response = ""
+    coalescer = TokenCoalescer(websocket)
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                token = chunk.choices[0].delta.content
+                if not full_response:
+                    chat_stage_seconds.observe("llm_ttft", time.perf_counter() - started)
+                full_response += token
+                await coalescer.add(token)
+        await coalescer.flush()
+    finally:
+        coalescer.cancel()
+        await stream.close()
+    chat_stage_seconds.observe("llm_stream", time.perf_counter() - started)
+    chat_stage_seconds.observe("ws_send", coalescer.send_seconds)
+    return full_response
+
+
+def answer_cache_key(rag, user_message: str, intent: str, response_mode: str,
+                     results: list) -> str:
+    """Clave de la caché de respuestas: query normalizada + intent + modo + ids de los docs RAG"""
+    normalized = " ".join(rag._normalize(user_message).split())
+    doc_ids = [qa.get('id') for qa, _ in results]
+    raw = json.dumps([LLM_MODEL, normalized, intent, response_mode, doc_ids], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+async def send_cached_response(websocket: WebSocket, text: str):
+    """Envía una respuesta cacheada con el mismo protocolo de frames 'token'"""
+    chunk_size = WS_TOKEN_FLUSH_CHARS if WS_TOKEN_FLUSH_CHARS > 0 else 20
+    for i in range(0, len(text), chunk_size):
+        await websocket.send_json({
+            "type": "token",
+            "content": text[i:i + chunk_size]
+        })
 
 
 GREETING_RESPONSE = """Soy **Omia**, tu asistente de ventas. Para poder ayudarte, cuéntame qué necesitas. Por ejemplo:
@@ -550,6 +1341,197 @@ GREETING_RESPONSE = """Soy **Omia**, tu asistente de ventas. Para poder ayudarte
 > Puedes usar las **preguntas sugeridas** en la pantalla de inicio o escribir tu consulta directamente."""
 
 
+def build_chat_messages(agent, intent: str, context: str, rag_coverage: str, response_mode: str,
+                        conversation_history: list, user_message: str) -> Tuple[list, int]:
+    """Construye los mensajes para el LLM (prompt del agente + contexto RAG + historial)
+    y el max_tokens según cobertura RAG y modo de respuesta."""
+    # Instrucciones dinámicas según cobertura RAG
+    if rag_coverage == "low":
+        rag_instruction = """⚠️ COBERTURA RAG: BAJA — Hay poca información específica para esta consulta.
+
+REGLAS:
+1. Respuesta CORTA (máximo 150 palabras). No generes un argumentario completo.
+2. NO inventes cifras, porcentajes ni datos específicos.
+3. SÍ puedes mencionar consenso médico general sin cifras exactas (ej: "El omega-3 podría contribuir a reducir el riesgo residual cardiovascular").
+4. Si HAY algún dato relevante en el contexto RAG de arriba (aunque sea tangencial), úsalo — son datos verificados de Puro Omega.
+5. Redirige al usuario hacia temas que SÍ puedes cubrir con preguntas sugeridas.
+6. NO muestres secciones vacías ni uses placeholders.
+
+FORMATO para cobertura baja:
+## [Tema consultado]
+
+[Si hay datos RAG relevantes, preséntalos de forma útil y persuasiva]
+
+[1-2 frases de consenso médico general SIN cifras inventadas si aplica]
+
+**Te puedo ayudar con:**
+- [Pregunta sugerida 1 sobre productos/indicaciones de Puro Omega]
+- [Pregunta sugerida 2]
+- [Pregunta sugerida 3]"""
+    elif rag_coverage == "medium":
+        rag_instruction = """⚠️ COBERTURA RAG: PARCIAL — Los datos verificados de arriba son limitados.
+
+REGLAS OBLIGATORIAS:
+1. Usa SOLO la información de los HECHOS VERIFICADOS de arriba.
+2. NO añadas datos externos. Si necesitas mencionar algo fuera del contexto, di "según consenso médico general" SIN cifras.
+3. Si una sección de tu formato no tiene datos verificados, OMÍTELA entera. No incluyas tablas con celdas vacías ni secciones sin contenido real.
+4. Aprovecha al MÁXIMO los datos que SÍ tienes: preséntelos de forma persuasiva, clara y útil para vender.
+5. PROHIBIDO EXTRAPOLAR INDICACIONES: Si un producto aparece en los datos verificados con indicación X, NO lo recomiendes para indicación Y. Solo recomienda cada producto para las indicaciones que EXPLÍCITAMENTE aparecen en los datos verificados. Ejemplo: si un producto está indicado para "función cardiovascular", NO lo recomiendes para oncología a menos que los datos verificados digan EXPLÍCITAMENTE que tiene indicación oncológica.
+6. Menciona SOLO los productos que tengan indicación EXPLÍCITA para la condición consultada en los datos verificados."""
+    else:
+        rag_instruction = """COBERTURA RAG: ALTA — Tienes buenos datos verificados arriba.
+Responde EXCLUSIVAMENTE con los datos verificados. NO complementes con conocimiento externo.
+Si alguna sección de tu formato no tiene datos verificados, OMÍTELA — no dejes huecos ni placeholders.
+Presenta TODA la información disponible de forma persuasiva, completa y útil para que el representante venda con confianza.
+PROHIBIDO EXTRAPOLAR INDICACIONES: Recomienda cada producto SOLO para las indicaciones que aparecen EXPLÍCITAMENTE en los datos verificados. No atribuyas indicaciones nuevas a un producto existente."""
+
+    # Instrucción de longitud según modo de respuesta
+    # Si cobertura baja, el formato ya está definido en rag_instruction — no aplicar templates de agente
+    if rag_coverage == "low":
+        length_instruction = ""  # El formato de respuesta corta ya está en rag_instruction
+    elif response_mode == "short":
+        # Formato resumido adaptado a cada agente — preserva los elementos de diseño clave
+        if intent == "productos":
+            length_instruction = """MODO RESUMIDO — Usa EXACTAMENTE este formato reducido (markdown):
+
+## [Nombre del producto o tema]
+
+| Parámetro | Valor |
+|-----------|-------|
+| (los 3-4 datos más importantes: EPA, DHA, forma, concentración) |
+
+**Indicación principal**: Una frase directa con FAB.
+
+**Posología**: Dosis y frecuencia en una línea.
+
+**Dato diferenciador**
+> Frase clave FAB que el representante puede usar literalmente con el médico. OBLIGATORIO.
+
+REGLAS DE MODO RESUMIDO:
+- Máximo 200-250 palabras totales.
+- La tabla, la indicación FAB y el dato diferenciador (blockquote) son OBLIGATORIOS.
+- NO incluyas evidencia clínica, caso clínico ni secciones adicionales.
+- El dato diferenciador SIEMPRE debe ser un blockquote (>) con una frase memorable."""
+        elif intent == "objeciones":
+            length_instruction = """MODO RESUMIDO — Usa EXACTAMENTE este formato reducido (markdown):
+
+## Objeción: "[Resumen breve]"
+
+### Reconocimiento
+> Frase empática Feel-Felt-Found condensada en 2 líneas máximo.
+
+### Datos clave
+| Dato | Valor |
+|------|-------|
+| (2-3 datos que desmonta la objeción) |
+
+### Reencuadre
+Una frase de Boomerang o aversión a la pérdida. Máximo 2 líneas.
+
+### Guion sugerido
+> "Doctor/a, [frase lista para usar literalmente]." OBLIGATORIO.
+
+REGLAS DE MODO RESUMIDO:
+- Máximo 200-250 palabras totales.
+- La tabla, el reconocimiento y el guion sugerido (blockquote) son OBLIGATORIOS.
+- No incluyas secciones adicionales."""
+        else:  # argumentos
+            length_instruction = """MODO RESUMIDO — Usa EXACTAMENTE este formato reducido (markdown):
+
+## Argumentario: [Especialidad]
+
+### Insight clave
+> Dato sorprendente en 1-2 líneas. OBLIGATORIO.
+
+### Producto recomendado
+| Producto | Dosis | Indicación |
+|----------|-------|------------|
+| (1 producto principal) |
+
+### Argumentos clave
+1. **[Argumento 1]**: Dato concreto en 1 línea.
+2. **[Argumento 2]**: Dato concreto en 1 línea.
+
+### Guion de apertura
+> "Doctor/a, [frase de apertura lista para usar]." OBLIGATORIO.
+
+REGLAS DE MODO RESUMIDO:
+- Máximo 200-250 palabras totales.
+- El insight (blockquote), la tabla y el guion de apertura (blockquote) son OBLIGATORIOS.
+- NO incluyas SPIN, perfil de paciente, caso clínico ni plan de prescripción."""
+    else:
+        length_instruction = "MODO EXTENDIDO: Responde con el formato completo y detallado según tu estructura habitual."
+
+    # Preparar prompt completo con anti-fabricación AL INICIO + contexto RAG
+    anti_fabrication = (
+        "══════════════════════════════════════════\n"
+        "REGLA #1 — LA MÁS IMPORTANTE DE TODAS:\n"
+        "══════════════════════════════════════════\n"
+        "USA SOLO datos de la sección 'DATOS VERIFICADOS DE PURO OMEGA' de abajo.\n"
+        "- NO inventes cifras (mg, %, ratios) ni estudios que no estén en los datos verificados.\n"
+        "- NO menciones productos que no aparezcan en los datos verificados.\n"
+        "- Si una sección de tu formato NO tiene datos verificados disponibles → OMITE esa sección ENTERA. No la incluyas.\n"
+        "- NUNCA pongas '—', 'No disponible', 'Consultar ficha técnica' ni celdas vacías. Si no hay dato, no pongas la fila/sección.\n"
+        "- SÍ usa técnicas de persuasión (FAB, SPIN, Feel-Felt-Found, storytelling) con los datos que SÍ tienes.\n"
+        "- Presenta los datos verificados de forma COMPLETA, ÚTIL y PERSUASIVA para que el representante pueda vender.\n"
+        "══════════════════════════════════════════\n\n"
+    )
+
+    full_prompt = f"""{anti_fabrication}{agent.system_prompt}
+
+{context}
+
+---
+{rag_instruction}
+
+{length_instruction}"""
+
+    # Tokens según modo (low coverage siempre corto)
+    if rag_coverage == "low":
+        max_tokens = 400
+    elif response_mode == "short":
+        max_tokens = 500
+    else:
+        max_tokens = 1000
+
+    # Construir mensajes con historial de conversación
+    messages = [{"role": "system", "content": full_prompt}]
+
+    # Añadir historial previo (para contexto de conversación)
+    for hist_msg in conversation_history:
+        messages.append(hist_msg)
+
+    # Instrucción de continuidad conversacional (inyectada justo antes del user msg)
+    if conversation_history:
+        # Extraer la última pregunta del historial para dar contexto explícito
+        last_user_q = ""
+        for h in reversed(conversation_history):
+            if h["role"] == "user":
+                last_user_q = h["content"][:120]
+                break
+        messages.append({"role": "system", "content": (
+            "CONTINUIDAD CONVERSACIONAL OBLIGATORIA:\n"
+            f"El usuario venía hablando sobre: \"{last_user_q}\"\n"
+            "Su nueva pregunta es un FOLLOW-UP de esa conversación.\n\n"
+            "REGLAS:\n"
+            "1. Tu respuesta DEBE conectar temáticamente con lo anterior. "
+            "Si antes hablaban de precio y ahora preguntan sobre duración, "
+            "conecta ambos temas (ej: el coste-beneficio a largo plazo).\n"
+            "2. NO uses frases genéricas como 'En relación con lo anterior...' o "
+            "'Continuando con el tema...'. En su lugar, conecta de forma ESPECÍFICA "
+            "mencionando el tema concreto (ej: 'Precisamente, uno de los argumentos "
+            "más potentes frente a la objeción del precio es el tiempo de respuesta...').\n"
+            "3. NO repitas información ya dada. Amplía, profundiza o conecta con ángulos nuevos.\n"
+            "4. Mantén tono conversacional natural, como un colega que te está explicando algo "
+            "y tú le haces otra pregunta — no como un chatbot que empieza de cero cada vez."
+        )})
+
+    # Añadir mensaje actual del usuario
+    messages.append({"role": "user", "content": user_message})
+
+    return messages, max_tokens
+
+
 @app.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
     """
@@ -561,6 +1543,9 @@ async def websocket_chat(websocket: WebSocket):
     conversation_history = []
     MAX_HISTORY = 10  # Mantener últimos 10 intercambios (20 mensajes)
 
+    # Infografía precalculada de la última respuesta (INFOGRAPHIC_PRECOMPUTE)
+    speculative_infographic: Optional[asyncio.Task] = None
+
     try:
         while True:
             # Recibir mensaje del usuario
@@ -575,6 +1560,11 @@ async def websocket_chat(websocket: WebSocket):
                     await handle_infographic_request(websocket, agent_response)
                 continue
 
+            # Nuevo mensaje: la infografía especulativa de la respuesta anterior ya no interesa
+            if speculative_infographic is not None:
+                speculative_infographic.cancel()
+                speculative_infographic = None
+
             user_message = message_data.get("message", "")
             response_mode = message_data.get("response_mode", "full")  # "short" o "full"
 
@@ -595,14 +1585,18 @@ async def websocket_chat(websocket: WebSocket):
             if not user_message.strip():
                 continue
 
+            message_started = time.perf_counter()
+
             # Strip wake word ("Hola Omia") from the message
-            cleaned = strip_wake_word(user_message)
+            with chat_stage_seconds.time("wake_word"):
+                cleaned = strip_wake_word(user_message)
             if not cleaned:
                 # Message was only a wake word — ignore silently
                 continue
             user_message = cleaned
 
-            is_vague = is_greeting_or_vague(user_message)
+            with chat_stage_seconds.time("vague"):
+                is_vague = is_greeting_or_vague(user_message)
             print(f"[WS] Mensaje recibido — historial: {len(conversation_history)} msgs — vague: {is_vague} — query: '{user_message[:60]}'")
 
             # Saludos y mensajes vagos: responder directamente sin agente ni RAG
@@ -625,21 +1619,25 @@ async def websocket_chat(websocket: WebSocket):
                     })
                     await asyncio.sleep(0.02)
                 await websocket.send_json({"type": "end"})
+                chat_messages.inc("greeting")
                 continue
 
             try:
                 # Clasificar intención con reglas (rápido y sin API call)
-                intent = orchestrator.classify_intent_rules(user_message)
+                with chat_stage_seconds.time("classify"):
+                    intent = orchestrator.classify_intent_rules(user_message)
 
                 # Obtener agente correspondiente
                 agent = orchestrator.get_agent(intent)
 
                 # Buscar contexto relevante en RAG (con fallback si score bajo)
-                results = agent.search_knowledge_with_fallback(user_message, top_k=5)
+                with chat_stage_seconds.time("search"):
+                    results = agent.search_knowledge_with_fallback(user_message, top_k=5)
                 context = agent.format_context(results, min_score=0.1)
 
                 # Enriquecer contexto con inteligencia del agente
-                enrichment = agent.enrich_context(user_message, results)
+                with chat_stage_seconds.time("enrich"):
+                    enrichment = agent.enrich_context(user_message, results)
                 if enrichment:
                     context += f"\n\n═══ CONTEXTO ADICIONAL DEL AGENTE ═══\n{enrichment}"
 
@@ -648,6 +1646,7 @@ async def websocket_chat(websocket: WebSocket):
                 strong_docs = [r for r in results if r[1] >= 0.35]
                 max_score = max((r[1] for r in results), default=0.0)
                 rag_coverage = "high" if (len(strong_docs) >= 2 or max_score >= 0.5 or (len(strong_docs) >= 1 and len(relevant_docs) >= 3)) else ("medium" if len(relevant_docs) >= 1 else "low")
+                chat_rag_coverage.inc(rag_coverage)
 
                 # Enviar info del agente + cobertura RAG al frontend
                 await websocket.send_json({
@@ -658,209 +1657,33 @@ async def websocket_chat(websocket: WebSocket):
                     "max_score": round(max_score, 2)
                 })
 
-                # Instrucciones dinámicas según cobertura RAG
-                if rag_coverage == "low":
-                    rag_instruction = """⚠️ COBERTURA RAG: BAJA — Hay poca información específica para esta consulta.
-
-REGLAS:
-1. Respuesta CORTA (máximo 150 palabras). No generes un argumentario completo.
-2. NO inventes cifras, porcentajes ni datos específicos.
-3. SÍ puedes mencionar consenso médico general sin cifras exactas (ej: "El omega-3 podría contribuir a reducir el riesgo residual cardiovascular").
-4. Si HAY algún dato relevante en el contexto RAG de arriba (aunque sea tangencial), úsalo — son datos verificados de Puro Omega.
-5. Redirige al usuario hacia temas que SÍ puedes cubrir con preguntas sugeridas.
-6. NO muestres secciones vacías ni uses placeholders.
-
-FORMATO para cobertura baja:
-## [Tema consultado]
-
-[Si hay datos RAG relevantes, preséntalos de forma útil y persuasiva]
-
-[1-2 frases de consenso médico general SIN cifras inventadas si aplica]
-
-**Te puedo ayudar con:**
-- [Pregunta sugerida 1 sobre productos/indicaciones de Puro Omega]
-- [Pregunta sugerida 2]
-- [Pregunta sugerida 3]"""
-                elif rag_coverage == "medium":
-                    rag_instruction = """⚠️ COBERTURA RAG: PARCIAL — Los datos verificados de arriba son limitados.
-
-REGLAS OBLIGATORIAS:
-1. Usa SOLO la información de los HECHOS VERIFICADOS de arriba.
-2. NO añadas datos externos. Si necesitas mencionar algo fuera del contexto, di "según consenso médico general" SIN cifras.
-3. Si una sección de tu formato no tiene datos verificados, OMÍTELA entera. No incluyas tablas con celdas vacías ni secciones sin contenido real.
-4. Aprovecha al MÁXIMO los datos que SÍ tienes: preséntelos de forma persuasiva, clara y útil para vender.
-5. PROHIBIDO EXTRAPOLAR INDICACIONES: Si un producto aparece en los datos verificados con indicación X, NO lo recomiendes para indicación Y. Solo recomienda cada producto para las indicaciones que EXPLÍCITAMENTE aparecen en los datos verificados. Ejemplo: si un producto está indicado para "función cardiovascular", NO lo recomiendes para oncología a menos que los datos verificados digan EXPLÍCITAMENTE que tiene indicación oncológica.
-6. Menciona SOLO los productos que tengan indicación EXPLÍCITA para la condición consultada en los datos verificados."""
+                # Caché de respuestas: solo primeras preguntas (sin historial de conversación)
+                cache_key = None
+                cached_response = None
+                if answer_cache is not None and not conversation_history:
+                    cache_key = answer_cache_key(agent.rag, user_message, intent, response_mode, results)
+                    cached_response = answer_cache.get(cache_key)
+
+                if cached_response is not None:
+                    print(f"[CACHE] Respuesta cacheada para: '{user_message[:60]}'")
+                    with chat_stage_seconds.time("ws_send"):
+                        await send_cached_response(websocket, cached_response)
+                    full_response = cached_response
+                    chat_messages.inc("cached")
                 else:
-                    rag_instruction = """COBERTURA RAG: ALTA — Tienes buenos datos verificados arriba.
-Responde EXCLUSIVAMENTE con los datos verificados. NO complementes con conocimiento externo.
-Si alguna sección de tu formato no tiene datos verificados, OMÍTELA — no dejes huecos ni placeholders.
-Presenta TODA la información disponible de forma persuasiva, completa y útil para que el representante venda con confianza.
-PROHIBIDO EXTRAPOLAR INDICACIONES: Recomienda cada producto SOLO para las indicaciones que aparecen EXPLÍCITAMENTE en los datos verificados. No atribuyas indicaciones nuevas a un producto existente."""
-
-                # Instrucción de longitud según modo de respuesta
-                # Si cobertura baja, el formato ya está definido en rag_instruction — no aplicar templates de agente
-                if rag_coverage == "low":
-                    length_instruction = ""  # El formato de respuesta corta ya está en rag_instruction
-                elif response_mode == "short":
-                    # Formato resumido adaptado a cada agente — preserva los elementos de diseño clave
-                    if intent == "productos":
-                        length_instruction = """MODO RESUMIDO — Usa EXACTAMENTE este formato reducido (markdown):
+                    # Construir prompt y mensajes (instrucciones según cobertura RAG y modo)
+                    with chat_stage_seconds.time("prompt"):
+                        messages, max_tokens = build_chat_messages(
+                            agent, intent, context, rag_coverage, response_mode,
+                            conversation_history, user_message
+                        )
 
-## [Nombre del producto o tema]
-
-| Parámetro | Valor |
-|-----------|-------|
-| (los 3-4 datos más importantes: EPA, DHA, forma, concentración) |
-
-**Indicación principal**: Una frase directa con FAB.
-
-**Posología**: Dosis y frecuencia en una línea.
-
-**Dato diferenciador**
-> Frase clave FAB que el representante puede usar literalmente con el médico. OBLIGATORIO.
+                    # Stream de respuesta con Kimi K2 (Groq) — async, no bloquea otros sockets
+                    full_response = await stream_llm_response(websocket, messages, max_tokens)
 
-REGLAS DE MODO RESUMIDO:
-- Máximo 200-250 palabras totales.
-- La tabla, la indicación FAB y el dato diferenciador (blockquote) son OBLIGATORIOS.
-- NO incluyas evidencia clínica, caso clínico ni secciones adicionales.
-- El dato diferenciador SIEMPRE debe ser un blockquote (>) con una frase memorable."""
-                    elif intent == "objeciones":
-                        length_instruction = """MODO RESUMIDO — Usa EXACTAMENTE este formato reducido (markdown):
-
-## Objeción: "[Resumen breve]"
-
-### Reconocimiento
-> Frase empática Feel-Felt-Found condensada en 2 líneas máximo.
-
-### Datos clave
-| Dato | Valor |
-|------|-------|
-| (2-3 datos que desmonta la objeción) |
-
-### Reencuadre
-Una frase de Boomerang o aversión a la pérdida. Máximo 2 líneas.
-
-### Guion sugerido
-> "Doctor/a, [frase lista para usar literalmente]." OBLIGATORIO.
-
-REGLAS DE MODO RESUMIDO:
-- Máximo 200-250 palabras totales.
-- La tabla, el reconocimiento y el guion sugerido (blockquote) son OBLIGATORIOS.
-- No incluyas secciones adicionales."""
-                    else:  # argumentos
-                        length_instruction = """MODO RESUMIDO — Usa EXACTAMENTE este formato reducido (markdown):
-
-## Argumentario: [Especialidad]
-
-### Insight clave
-> Dato sorprendente en 1-2 líneas. OBLIGATORIO.
-
-### Producto recomendado
-| Producto | Dosis | Indicación |
-|----------|-------|------------|
-| (1 producto principal) |
-
-### Argumentos clave
-1. **[Argumento 1]**: Dato concreto en 1 línea.
-2. **[Argumento 2]**: Dato concreto en 1 línea.
-
-### Guion de apertura
-> "Doctor/a, [frase de apertura lista para usar]." OBLIGATORIO.
-
-REGLAS DE MODO RESUMIDO:
-- Máximo 200-250 palabras totales.
-- El insight (blockquote), la tabla y el guion de apertura (blockquote) son OBLIGATORIOS.
-- NO incluyas SPIN, perfil de paciente, caso clínico ni plan de prescripción."""
-                else:
-                    length_instruction = "MODO EXTENDIDO: Responde con el formato completo y detallado según tu estructura habitual."
-
-                # Preparar prompt completo con anti-fabricación AL INICIO + contexto RAG
-                anti_fabrication = (
-                    "══════════════════════════════════════════\n"
-                    "REGLA #1 — LA MÁS IMPORTANTE DE TODAS:\n"
-                    "══════════════════════════════════════════\n"
-                    "USA SOLO datos de la sección 'DATOS VERIFICADOS DE PURO OMEGA' de abajo.\n"
-                    "- NO inventes cifras (mg, %, ratios) ni estudios que no estén en los datos verificados.\n"
-                    "- NO menciones productos que no aparezcan en los datos verificados.\n"
-                    "- Si una sección de tu formato NO tiene datos verificados disponibles → OMITE esa sección ENTERA. No la incluyas.\n"
-                    "- NUNCA pongas '—', 'No disponible', 'Consultar ficha técnica' ni celdas vacías. Si no hay dato, no pongas la fila/sección.\n"
-                    "- SÍ usa técnicas de persuasión (FAB, SPIN, Feel-Felt-Found, storytelling) con los datos que SÍ tienes.\n"
-                    "- Presenta los datos verificados de forma COMPLETA, ÚTIL y PERSUASIVA para que el representante pueda vender.\n"
-                    "══════════════════════════════════════════\n\n"
-                )
-
-                full_prompt = f"""{anti_fabrication}{agent.system_prompt}
-
-{context}
-
----
-{rag_instruction}
-
-{length_instruction}"""
-
-                # Tokens según modo (low coverage siempre corto)
-                if rag_coverage == "low":
-                    max_tokens = 400
-                elif response_mode == "short":
-                    max_tokens = 500
-                else:
-                    max_tokens = 1000
-
-                # Construir mensajes con historial de conversación
-                messages = [{"role": "system", "content": full_prompt}]
-
-                # Añadir historial previo (para contexto de conversación)
-                for hist_msg in conversation_history:
-                    messages.append(hist_msg)
-
-                # Instrucción de continuidad conversacional (inyectada justo antes del user msg)
-                if conversation_history:
-                    # Extraer la última pregunta del historial para dar contexto explícito
-                    last_user_q = ""
-                    for h in reversed(conversation_history):
-                        if h["role"] == "user":
-                            last_user_q = h["content"][:120]
-                            break
-                    messages.append({"role": "system", "content": (
-                        "CONTINUIDAD CONVERSACIONAL OBLIGATORIA:\n"
-                        f"El usuario venía hablando sobre: \"{last_user_q}\"\n"
-                        "Su nueva pregunta es un FOLLOW-UP de esa conversación.\n\n"
-                        "REGLAS:\n"
-                        "1. Tu respuesta DEBE conectar temáticamente con lo anterior. "
-                        "Si antes hablaban de precio y ahora preguntan sobre duración, "
-                        "conecta ambos temas (ej: el coste-beneficio a largo plazo).\n"
-                        "2. NO uses frases genéricas como 'En relación con lo anterior...' o "
-                        "'Continuando con el tema...'. En su lugar, conecta de forma ESPECÍFICA "
-                        "mencionando el tema concreto (ej: 'Precisamente, uno de los argumentos "
-                        "más potentes frente a la objeción del precio es el tiempo de respuesta...').\n"
-                        "3. NO repitas información ya dada. Amplía, profundiza o conecta con ángulos nuevos.\n"
-                        "4. Mantén tono conversacional natural, como un colega que te está explicando algo "
-                        "y tú le haces otra pregunta — no como un chatbot que empieza de cero cada vez."
-                    )})
-
-                # Añadir mensaje actual del usuario
-                messages.append({"role": "user", "content": user_message})
-
-                # Stream de respuesta con Kimi K2 (Groq)
-                stream = llm_client.chat.completions.create(
-                    model=LLM_MODEL,
-                    messages=messages,
-                    stream=True,
-                    max_tokens=max_tokens,
-                    temperature=0.3
-                )
-
-                # Enviar chunks al frontend
-                full_response = ""
-                for chunk in stream:
-                    if chunk.choices[0].delta.content:
-                        token = chunk.choices[0].delta.content
-                        full_response += token
-                        await websocket.send_json({
-                            "type": "token",
-                            "content": token
-                        })
+                    if cache_key and full_response.strip():
+                        answer_cache.set(cache_key, full_response)
+                    chat_messages.inc("llm")
 
                 # Guardar en historial
                 conversation_history.append({"role": "user", "content": user_message})
@@ -875,8 +1698,16 @@ REGLAS DE MODO RESUMIDO:
                     "type": "end",
                     "full_response": full_response
                 })
+                chat_stage_seconds.observe("total", time.perf_counter() - message_started)
+
+                if TTS_SUMMARY_PRECOMPUTE:
+                    precompute_tts_summary(full_response)
+                speculative_infographic = start_speculative_infographic(full_response)
 
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
+                chat_messages.inc("error")
                 await websocket.send_json({
                     "type": "error",
                     "message": f"Error procesando mensaje: {str(e)}"
@@ -886,6 +1717,9 @@ REGLAS DE MODO RESUMIDO:
         print(f"[WS] Cliente desconectado — historial tenía {len(conversation_history)} mensajes")
     except Exception as e:
         print(f"[WS] Error WebSocket: {e}")
+    finally:
+        if speculative_infographic is not None:
+            speculative_infographic.cancel()
 
 
 if __name__ == "__main__":
@@ -894,5 +1728,7 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=7860,
-        reload=True
+        # reload solo funciona con un proceso
+        reload=WEB_CONCURRENCY == 1,
+        workers=WEB_CONCURRENCY,
     )
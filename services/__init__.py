@@ -0,0 +1,24 @@
+# Servicios de infraestructura del backend (cachés, almacenamiento, métricas, límites)
+
+from .audio_cache import AudioCache
+from .cache import LRUCache
+from .history_store import HistoryStore, JSONHistoryStore, SQLiteHistoryStore, create_history_store
+from .limiter import UpstreamBusy, UpstreamLimiter
+from .metrics import Counter, Histogram, LatencyTracker, render_metric
+from .singleflight import SingleFlight
+
+__all__ = [
+    "AudioCache",
+    "LRUCache",
+    "HistoryStore",
+    "JSONHistoryStore",
+    "SQLiteHistoryStore",
+    "create_history_store",
+    "Counter",
+    "Histogram",
+    "LatencyTracker",
+    "render_metric",
+    "SingleFlight",
+    "UpstreamBusy",
+    "UpstreamLimiter",
+]
@@ -0,0 +1,123 @@
+"""
+Caché de audio TTS en disco, direccionada por contenido
+Cada entrada es un fichero `<sha256>.mp3`; el tamaño total se acota con desalojo LRU.
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class AudioCache:
+    """
+    Ficheros de audio en `directory` con un límite de `max_bytes`.
+
+    El orden LRU se guarda en memoria y se reconstruye al arrancar a partir
+    del mtime de los ficheros (cada acierto lo actualiza). Las escrituras van
+    a un temporal y se publican con os.replace, así que un lector nunca ve
+    un MP3 a medias.
+    """
+
+    SUFFIX = ".mp3"
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Clave de contenido: hash de todo lo que determina el audio generado"""
+        raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key: str) -> Optional[str]:
+        """Ruta del audio cacheado o None; un acierto lo marca como usado recientemente"""
+        path = self.path_for(key)
+        with self._lock:
+            if key in self._sizes:
+                try:
+                    os.utime(path)
+                except OSError:
+                    # Borrado desde fuera: olvidar la entrada
+                    self._total -= self._sizes.pop(key)
+                else:
+                    self._sizes.move_to_end(key)
+                    self.hits += 1
+                    return path
+            self.misses += 1
+            return None
+
+    def put(self, key: str, data: bytes):
+        """Guarda el audio completo y desaloja lo menos usado si se supera el límite"""
+        if not data or len(data) > self.max_bytes:
+            return
+        path = self.path_for(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._total -= self._sizes.pop(key, 0)
+            self._sizes[key] = len(data)
+            self._total += len(data)
+            self._evict()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._sizes),
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._sizes)
+
+    # ---------- Internos ----------
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                # Escritura interrumpida de una ejecución anterior
+                os.remove(path)
+            elif name.endswith(self.SUFFIX):
+                st = os.stat(path)
+                entries.append((st.st_mtime, name[:-len(self.SUFFIX)], st.st_size))
+
+        for _, key, size in sorted(entries):
+            self._sizes[key] = size
+            self._total += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._sizes:
+            key, size = self._sizes.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
@@ -0,0 +1,167 @@
+"""
+Caché LRU con TTL y persistencia opcional en SQLite
+Los valores deben ser serializables a JSON.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Caché LRU en memoria con expiración por TTL.
+
+    Si se indica `path`, cada entrada se escribe también en una base SQLite
+    para sobrevivir a reinicios; los fallos en memoria se consultan en disco.
+    `version` identifica los datos de origen (p. ej. hash de la base de
+    conocimiento): si cambia, la caché se vacía entera.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: Optional[float] = None,
+                 path: Optional[str] = None, version: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+        if path:
+            self._open_db(path)
+
+    # ---------- API pública ----------
+
+    def get(self, key: str) -> Optional[Any]:
+        """Devuelve el valor o None si no existe o ha expirado"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                entry = self._db_get(key)
+                if entry is not None:
+                    self._store_memory(key, entry)
+
+            if entry is not None and self._expired(entry[0]):
+                self._delete(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any):
+        """Guarda un valor (sobrescribe si ya existía)"""
+        entry = (time.time(), value)
+        with self._lock:
+            self._store_memory(key, entry)
+            if self._db is not None:
+                self._db_set(key, entry)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._delete(key)
+
+    def clear(self):
+        """Vacía memoria y disco"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM entries")
+
+    def set_version(self, version: str):
+        """Actualiza la versión de los datos de origen; si cambia, invalida todo"""
+        if version == self.version:
+            return
+        self.version = version
+        self.clear()
+        if self._db is not None:
+            with self._lock, self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (version,)
+                )
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "persistent": self._db is not None,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------- Internos ----------
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _store_memory(self, key: str, entry: Tuple[float, Any]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+
+    def _delete(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            with self._db:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _open_db(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if row is None or row[0] != self.version:
+                # Datos de otra versión de la base de conocimiento: descartar
+                self._db.execute("DELETE FROM entries")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (self.version,)
+                )
+
+    def _db_get(self, key: str) -> Optional[Tuple[float, Any]]:
+        row = self._db.execute("SELECT created, value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def _db_set(self, key: str, entry: Tuple[float, Any]):
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(entry[1], ensure_ascii=False), entry[0]),
+            )
+            # Acotar el disco también entre reinicios (la memoria empieza vacía)
+            self._db.execute(
+                "DELETE FROM entries WHERE key NOT IN "
+                "(SELECT key FROM entries ORDER BY created DESC LIMIT ?)",
+                (self.max_entries,),
+            )
@@ -0,0 +1,159 @@
+"""
+Almacenamiento del historial de búsquedas por usuario (sincronización entre dispositivos)
+Backends: SQLite en modo WAL (por defecto) y fichero JSON (legado / tests).
+"""
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class HistoryStore(ABC):
+    """Interfaz de almacenamiento del historial. Las operaciones son bloqueantes:
+    desde FastAPI se llaman con asyncio.to_thread."""
+
+    @abstractmethod
+    def load(self, username: str) -> Optional[dict]:
+        """Devuelve {"searches": [...], "last_sync": float} o None si no hay datos"""
+        pass
+
+    @abstractmethod
+    def save(self, username: str, searches: list, last_sync: float):
+        """Guarda (upsert) el historial de un usuario"""
+        pass
+
+    def close(self):
+        pass
+
+
+class JSONHistoryStore(HistoryStore):
+    """Todos los usuarios en un único fichero JSON (reescrito entero en cada guardado)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # Serializa lectura-modificación-escritura para no perder guardados concurrentes
+        self._lock = threading.Lock()
+
+    def _read_all(self) -> dict:
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"[UserData] Error loading: {e}")
+        return {}
+
+    def load(self, username: str) -> Optional[dict]:
+        with self._lock:
+            user = self._read_all().get(username)
+        if not user or "searches" not in user:
+            return None
+        return {"searches": user["searches"], "last_sync": user.get("last_sync", 0)}
+
+    def save(self, username: str, searches: list, last_sync: float):
+        with self._lock:
+            data = self._read_all()
+            data.setdefault(username, {})
+            data[username]["searches"] = searches
+            data[username]["last_sync"] = last_sync
+            try:
+                with open(self.path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+            except Exception as e:
+                print(f"[UserData] Error saving: {e}")
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """Una fila por usuario en SQLite (WAL): guardar y cargar cuestan O(1) usuarios.
+
+    Si se indica `migrate_from` (el user_data.json antiguo), se importa una sola vez.
+    """
+
+    def __init__(self, path: str, migrate_from: Optional[str] = None):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Una conexión por hilo: las llamadas llegan desde el thread pool
+        self._local = threading.local()
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_history ("
+                "username TEXT PRIMARY KEY, searches TEXT NOT NULL, last_sync REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+        if migrate_from:
+            self._migrate_json(migrate_from)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate_json(self, json_path: str):
+        """Importa user_data.json una única vez (queda marcado en la tabla meta)"""
+        conn = self._conn()
+        done = conn.execute("SELECT value FROM meta WHERE name = 'json_migrated'").fetchone()
+        if done or not os.path.exists(json_path):
+            return
+
+        data = JSONHistoryStore(json_path)._read_all()
+        rows = [
+            (username, json.dumps(user["searches"], ensure_ascii=False), user.get("last_sync", 0))
+            for username, user in data.items()
+            if isinstance(user, dict) and "searches" in user
+        ]
+        with conn:
+            # No pisar datos más recientes que ya estén en SQLite
+            conn.executemany(
+                "INSERT OR IGNORE INTO user_history (username, searches, last_sync) VALUES (?, ?, ?)",
+                rows,
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('json_migrated', ?)", (json_path,))
+        print(f"[UserData] Migrados {len(rows)} usuarios de {json_path} a {self.path}")
+
+    def load(self, username: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT searches, last_sync FROM user_history WHERE username = ?", (username,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"searches": json.loads(row[0]), "last_sync": row[1]}
+
+    def save(self, username: str, searches: list, last_sync: float):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO user_history (username, searches, last_sync) VALUES (?, ?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET searches = excluded.searches, last_sync = excluded.last_sync",
+                (username, json.dumps(searches, ensure_ascii=False), last_sync),
+            )
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def create_history_store(backend: str, db_path: str, json_path: str) -> HistoryStore:
+    """Crea el backend de historial: 'sqlite' (por defecto) o 'json'"""
+    if backend == "json":
+        return JSONHistoryStore(json_path)
+    if backend != "sqlite":
+        raise ValueError(f"HISTORY_BACKEND desconocido: {backend}")
+    try:
+        return SQLiteHistoryStore(db_path, migrate_from=json_path)
+    except (sqlite3.Error, OSError) as e:
+        # p. ej. directorio sin permisos de escritura en el contenedor
+        print(f"[UserData] SQLite no disponible ({e}), usando {json_path}")
+        return JSONHistoryStore(json_path)
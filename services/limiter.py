@@ -0,0 +1,102 @@
+"""
+Límite de concurrencia y cola acotada por upstream (LLM de infografías, resumen TTS, Whisper)
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from .metrics import LatencyTracker
+
+
+class UpstreamBusy(Exception):
+    """La cola del upstream está llena: el llamante debe responder 429 / reintentar"""
+
+    def __init__(self, name: str):
+        super().__init__(f"{name}: demasiadas peticiones en cola")
+        self.name = name
+
+
+class UpstreamLimiter:
+    """
+    Como mucho `max_concurrent` llamadas activas y `max_queue` esperando turno;
+    por encima se lanza UpstreamBusy en vez de encolar sin límite.
+
+    Las llamadas síncronas (`run`) usan un thread pool propio del tamaño de
+    `max_concurrent`, así una ráfaga no agota el executor por defecto del
+    event loop; ocupan el hueco hasta que el hilo termina aunque el llamante
+    se cancele. Las async usan `async with limiter:` o acquire()/release().
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.wait_time = LatencyTracker()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def acquire(self):
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise UpstreamBusy(self.name)
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.wait_time.record((time.perf_counter() - started) * 1000)
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Ejecuta una función bloqueante en el pool propio, respetando el límite"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrent, thread_name_prefix=f"upstream-{self.name}"
+            )
+        await self.acquire()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BaseException:
+            self.release()
+            raise
+        # El hueco se libera cuando termina el hilo, no cuando el llamante deja de esperar:
+        # si se cancela (cliente desconectado) la llamada sigue ocupando el upstream
+        future.add_done_callback(self._release_when_done)
+        return await asyncio.shield(future)
+
+    def _release_when_done(self, future: asyncio.Future):
+        self.release()
+        if not future.cancelled():
+            # Recoge la excepción si el llamante ya no la espera (evita el aviso de asyncio)
+            future.exception()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "rejected": self.rejected,
+            "wait": self.wait_time.summary(),
+        }
@@ -0,0 +1,146 @@
+"""
+Métricas de latencia en memoria (ventana deslizante de muestras) y exportación
+en formato de texto de Prometheus (histogramas y contadores con una etiqueta)
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+class LatencyTracker:
+    """
+    Acumula latencias en milisegundos y resume percentiles sobre las
+    últimas `window` muestras. `count` y `errors` son totales desde el arranque.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.errors = 0
+        self._samples: "deque[float]" = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, ms: float):
+        with self._lock:
+            self.count += 1
+            self._samples.append(ms)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+            count, errors = self.count, self.errors
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 1)
+
+        return {
+            "count": count,
+            "errors": errors,
+            "p50_ms": pct(50),
+            "p95_ms": pct(95),
+            "p99_ms": pct(99),
+            "max_ms": round(ordered[-1], 1) if ordered else 0.0,
+        }
+
+
+# Límites (en segundos) de los buckets de latencia: de 0.5 ms a 30 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metric(name: str, kind: str, help_text: str, label: str,
+                  samples: Iterable[Tuple[str, float]]) -> str:
+    """Bloque de texto Prometheus de una métrica con una etiqueta: (valor de la etiqueta, valor)"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for label_value, value in samples:
+        lines.append(f'{name}{{{label}="{_escape(str(label_value))}"}} {_format(value)}')
+    return "\n".join(lines)
+
+
+class Counter:
+    """Contador monótono por valor de etiqueta (p. ej. nivel de cobertura RAG)"""
+
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_value: str, amount: float = 1):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def render(self) -> str:
+        with self._lock:
+            samples = sorted(self._values.items())
+        return render_metric(self.name, "counter", self.help_text, self.label, samples)
+
+
+class Histogram:
+    """
+    Histograma acumulativo de latencias (segundos) por valor de etiqueta,
+    p. ej. una serie por etapa del chat. Solo guarda cuentas por bucket,
+    suma y total: el coste de observe() no depende del tráfico acumulado.
+    """
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        # etiqueta → [cuentas por bucket (no acumuladas) + overflow, suma, total]
+        self._series: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    @contextmanager
+    def time(self, label_value: str) -> Iterator[None]:
+        """Mide el bloque (también si termina con excepción)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, time.perf_counter() - started)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for label_value, (counts, total, count) in series:
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {_format(total)}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return "\n".join(lines)
@@ -0,0 +1,59 @@
+"""
+Single-flight: peticiones concurrentes con la misma clave comparten una sola llamada upstream
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """
+    La primera llamada con una clave lanza la tarea; las siguientes, mientras
+    siga en curso, esperan a esa misma tarea (`coalesced` cuenta cuántas).
+
+    La tarea se protege con asyncio.shield: si un llamante se cancela (socket
+    cerrado, cliente que aborta), la llamada upstream continúa para los demás
+    y para quien la cachee al terminar. Con `cancel_when_abandoned`, si se
+    cancela el último llamante que la esperaba, se cancela también la tarea.
+    """
+
+    def __init__(self, cancel_when_abandoned: bool = False):
+        self.cancel_when_abandoned = cancel_when_abandoned
+        self.coalesced = 0
+        self.abandoned = 0
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced += 1
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self.cancel_when_abandoned and not task.done() and self._waiters.get(key) == 1:
+                self.abandoned += 1
+                task.cancel()
+            raise
+        finally:
+            if self._tasks.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _done(self, key: str, task: asyncio.Task):
+        self._tasks.pop(key, None)
+        self._waiters.pop(key, None)
+        # Marcar la excepción como recogida aunque todos los llamantes se hayan cancelado
+        if not task.cancelled():
+            task.exception()